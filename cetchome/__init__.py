@@ -0,0 +1,17 @@
+"""Shared infrastructure for the CetCHome tools (helper.media, helper.docs, downloader.urls)."""
+import os
+
+CACHE_ENV = 'CETC_CACHE'
+
+
+def cache_path(name):
+    """
+    Location of one persistent cache (folder or file): <CETC_CACHE>/<name>,
+    by default ~/.cache/cetchome/<name>. Returns None when CETC_CACHE=off.
+    """
+    value = os.environ.get(CACHE_ENV)
+    if value is None:
+        value = os.path.join(os.path.expanduser('~'), '.cache', 'cetchome')
+    elif value.lower() in ('', '0', 'off', 'false', 'no'):
+        return None
+    return os.path.join(value, name)
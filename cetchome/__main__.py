@@ -0,0 +1,5 @@
+import sys
+
+from cetchome.cli import main
+
+sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+In-process batch API for the tools.
+
+A Session keeps the tool modules, a worker pool and the exiftool
+processes alive between batches, so a long-running service pays the
+interpreter and dependency start-up once instead of once per batch:
+
+    from cetchome.api import Session, VideoConfig
+
+    with Session() as session:
+        for result in session.convert_videos(paths, 'out', VideoConfig(quality='medium')):
+            print(result['input_file'], result['success'], result['video_codec'], result['timings'])
+
+Every result is the tool's own result dict plus 'seconds' (wall time),
+'timings' (seconds per traced stage, e.g. probe/encode/exiftool) and
+'error' (None on success). Failures are reported in the result instead
+of being raised. The tools still print their usual progress output.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from cetchome import exiftool, tracing
+from cetchome.cli import load_script, load_tool
+
+# quality: key of convert_mov_to_mp4.QUALITY_SETTINGS (high, medium, low);
+# outputs: extra outputs of the same decode (proxy, poster, sprite), see convert_mov_to_mp4.output_targets()
+VideoConfig = namedtuple('VideoConfig', ['quality', 'hevc', 'outputs'], defaults=('high', False, ()))
+# exiftool: executable (None = raw_convert.DEFAULT_EXIFTOOL); move_original: move each source next to its JPEG
+PhotoConfig = namedtuple('PhotoConfig', ['exiftool', 'move_original'], defaults=(None, True))
+
+_lock = threading.Lock()
+_sessions = 0
+# 当前调用的耗时表；jobs 会把它带入步骤线程
+_timings = contextvars.ContextVar('cetchome_api_timings', default=None)
+
+
+def _collect(record):
+    """tracing listener: add every finished span's wall time to the running call's timings."""
+    timings = _timings.get()
+    if timings is not None:
+        with _lock:
+            timings[record['span']] = round(timings.get(record['span'], 0.0) + record['wall'], 6)
+
+
+class Session:
+    """
+    Long-lived state for running many batches in one process
+
+    Tool modules are loaded on first use and kept; the worker pool (for
+    per-file parallel work) and the shared exiftool processes live until
+    close().
+    """
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers (int): Parallel conversions for convert_photos() (default: CPU count)
+        """
+        global _sessions
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        with _lock:
+            _sessions += 1
+            # 有会话时记录 span，用于返回每个阶段的耗时
+            tracing.add_listener(_collect)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        global _sessions
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        with _lock:
+            _sessions -= 1
+            if _sessions == 0:
+                tracing.remove_listener(_collect)
+                exiftool.close()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cetchome')
+        return self._pool
+
+    def _run(self, func, *args, **kwargs):
+        """Call one tool function and add 'seconds', 'timings' and 'error' to its result dict."""
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            if not isinstance(result, dict):
+                result = {'success': bool(result)}
+        except Exception as e:
+            result = {'success': False, 'error': f"{type(e).__name__}: {e}"}
+        finally:
+            _timings.reset(token)
+        result.setdefault('error', None if result.get('success') else 'failed')
+        result['seconds'] = round(time.perf_counter() - started, 6)
+        result['timings'] = timings
+        return result
+
+    def _ordered(self, func, items):
+        """Run func(item) on the pool and yield (item, result) in input order, with bounded look-ahead."""
+        pending = deque()
+        for item in items:
+            pending.append((item, self.pool.submit(self._run, func, item)))
+            if len(pending) >= self.workers * 2:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+    def convert_videos(self, inputs, output_folder, config=VideoConfig()):
+        """
+        Convert MOV videos to MP4 one after another (ffmpeg already uses all cores)
+
+        Args:
+            inputs (iterable): Video paths
+            output_folder (str): Folder for the MP4 files and the backups of the originals
+            config (VideoConfig): Quality level and codec
+
+        Yields:
+            dict: Per-file result with sizes, 'video_codec'/'audio_codec' decisions,
+                  'extra_outputs', 'metadata_comparison', 'seconds', 'timings' and 'error'
+        """
+        module = load_tool('mov2mp4')
+        output_folder = Path(output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
+        for input_file in inputs:
+            input_file = Path(input_file)
+            result = self._run(module.convert_file, input_file, output_folder, config.quality, config.hevc,
+                               config.outputs)
+            result.setdefault('input_file', input_file.name)
+            yield result
+
+    def convert_photos(self, inputs, output_folder=None, config=PhotoConfig()):
+        """
+        Convert RAF/HEIC photos to JPEG in parallel on the session pool
+
+        Args:
+            inputs (iterable): Photo paths (format taken from the extension)
+            output_folder (str): Folder for the JPEGs (default: <photo folder>/<RAF|HEIC>, as the script does)
+            config (PhotoConfig): exiftool executable and whether to move the originals
+
+        Yields:
+            dict: Per-file result in input order, with sizes, 'output_file', 'seconds', 'timings' and 'error'
+        """
+        module = load_tool('raw2jpg')
+        exiftool_path = config.exiftool or module.DEFAULT_EXIFTOOL
+
+        def convert(photo):
+            photo = Path(photo)
+            target = Path(output_folder) if output_folder else photo.parent / photo.suffix.lstrip('.').upper()
+            target.mkdir(parents=True, exist_ok=True)
+            return module.convert_photo(photo, target, exiftool_path=exiftool_path,
+                                        move_original=config.move_original)
+
+        for photo, result in self._ordered(convert, inputs):
+            result.setdefault('input_file', Path(photo).name)
+            yield result
+
+    def merge_pdfs(self, inputs, output_path, **options):
+        """pdf_merge.merge_pdfs() (options: dedupe, object_streams, linearize)"""
+        module = load_script('helper.docs', 'pdf_merge.py')
+        return self._run(module.merge_pdfs, list(inputs), output_path, **options)
+
+    def duplex_merge(self, inputs, output_path, **options):
+        """pdf_duplex.duplex_merge() for scans in scan order (options: drop_blank, dedupe, object_streams, linearize)"""
+        module = load_tool('scanmerge')
+        return self._run(module.duplex_merge, list(inputs), output_path, **options)
+
+    def merge_audio(self, inputs, output_path, **options):
+        """audio_concat.merge_audio_files() (options: bitrate, allow_stream_copy, workers, gapless, crossfade)"""
+        module = load_script('helper.media', 'audio_concat.py')
+        return self._run(module.merge_audio_files, list(inputs), output_path, **options)
+
+    def download(self, source, output_folder, **options):
+        """
+        Download one batch of photos into output_folder (not the working directory) and deduplicate them
+
+        Args:
+            source (str | iterable): DOM file to select renditions from (as DOM.txt), or the URLs to download
+            output_folder (str): Folder for the photos, one subfolder per domain
+            options: min_width, prefer_webp, probe, allow_smaller, inline_dedup, perceptual_dedup,
+                     remove_duplicates, threshold, reference_index (see downloader-urls.download())
+
+        Returns:
+            dict: 'urls', 'downloaded', 'skipped' (duplicates), 'replaced', 'failed', 'saved_bytes',
+                  'seconds', 'timings' and 'error'
+
+        Raises:
+            ValueError: cleanup or backup_dir was passed; the command line's cleanup deletes the whole
+                        download folder, empty output_folder yourself instead
+        """
+        if options.get('cleanup') or options.get('backup_dir'):
+            raise ValueError('Session.download() does not delete folders; empty output_folder yourself')
+        module = load_tool('download')
+        if not isinstance(source, (str, os.PathLike)):
+            source = list(source)
+        return self._run(module.download, source, os.fspath(output_folder), **options)
+
+    def merge_images(self, input_folder, output_folder, order_by='natural', manifest_path=None):
+        """merge_images_to_pdf.merge_images_to_pdf(); the result only carries 'success'"""
+        module = load_tool('img2pdf')
+        return self._run(module.merge_images_to_pdf, input_folder, output_folder, order_by, manifest_path)
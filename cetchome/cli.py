@@ -0,0 +1,86 @@
+"""
+Single command-line entry point for all tools:
+
+    cetc <tool> [options]       (or: python -m cetchome <tool> [options])
+
+Each subcommand loads only its own script, and the scripts import their
+heavy dependencies (PIL, numpy, pypdf, rawpy, ...) only on the code paths
+that need them, so `cetc --help`, `cetc <tool> --help` and light paths
+such as `cetc download --only-remove-duplicates` start quickly.
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_PACKAGE_DIR)
+
+# 子命令 -> (工具目录, 脚本, 固定附加参数, 说明)
+TOOLS = {
+    'download': ('downloader.urls', 'downloader-urls.py', (),
+                 'Download the photos listed in DOM.txt, deduplicating while downloading'),
+    'dedup': ('downloader.urls', 'downloader-urls.py', ('--only-dedup',),
+              'Deduplicate already downloaded photos'),
+    'mov2mp4': ('helper.media', 'convert_mov_to_mp4.py', (), 'Convert MOV videos to MP4'),
+    'raw2jpg': ('helper.media', 'raw_convert.py', (), 'Convert RAF or HEIC photos to JPEG'),
+    'img2pdf': ('helper.media', 'merge_images_to_pdf.py', (), 'Merge a folder of images into one PDF'),
+    'pdfmerge': ('helper.docs', 'pdf_merge.py', (), 'Merge all PDFs of a folder'),
+    'scanmerge': ('helper.docs', 'pdf_duplex.py', (), 'Merge duplex scans into one PDF in reading order'),
+    'audiomerge': ('helper.media', 'merge Audio.py', (), 'Concatenate the audio files of a folder'),
+}
+
+
+def tool_dir(directory):
+    """Folder of a tool: cetchome/tools/<name> when installed, the repository folder otherwise."""
+    installed = os.path.join(_PACKAGE_DIR, 'tools', directory.replace('.', '_'))
+    return installed if os.path.isdir(installed) else os.path.join(_ROOT, directory)
+
+
+def load_script(directory, script):
+    """
+    Import a script of a tool folder as a module
+
+    Script names may contain spaces or dashes, so they are loaded by path.
+    The tool folder is put on sys.path first, as when the script is run
+    directly, so its helper modules import the same way.
+    """
+    folder = tool_dir(directory)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+
+    module_name = os.path.splitext(script)[0].replace('-', '_').replace(' ', '_')
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(folder, script))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_tool(name):
+    """Import the script behind a subcommand."""
+    directory, script, _, _ = TOOLS[name]
+    return load_script(directory, script)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    parser = argparse.ArgumentParser(
+        prog='cetc', description='CetCHome tools',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='tools:\n' + '\n'.join(f"  {name:<12}{entry[3]}" for name, entry in TOOLS.items()) +
+               "\n\nRun 'cetc <tool> --help' for the options of one tool.")
+    parser.add_argument('tool', choices=list(TOOLS), metavar='tool', help='Tool to run (see below)')
+    # 只解析第一个参数，其余原样交给工具自己的参数解析
+    args = parser.parse_args(argv[:1])
+
+    module = load_tool(args.tool)
+    sys.argv = [f"cetc {args.tool}", *TOOLS[args.tool][2], *argv[1:]]
+    return module.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Long-lived exiftool processes shared by all tools.
+
+Starting exiftool (a Perl program) costs far more than most of the
+commands the tools run with it, and the video converter runs several per
+file. run() has the same shape as subprocess.run(capture_output=True,
+text=True) but sends the command to one `exiftool -stay_open True -@ -`
+process per executable, which is started on first use and kept until
+exit (or close()).
+"""
+import atexit
+import itertools
+import subprocess
+import threading
+
+_lock = threading.Lock()
+_processes = {}
+
+
+class ExifTool:
+    """One stay-open exiftool process. Commands are serialized, so it is safe to share between threads."""
+
+    def __init__(self, executable):
+        self.executable = executable
+        self._process = None
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def start(self):
+        # 参数以 UTF-8 传递，文件名中的非 ASCII 字符在 Windows 上也能正确解析
+        self._process = subprocess.Popen(
+            [self.executable, '-stay_open', 'True', '-@', '-', '-common_args', '-charset', 'filename=utf8'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def execute(self, *args):
+        """
+        Run one exiftool command (arguments without the executable)
+
+        Returns:
+            tuple: (ok, stdout, stderr) as text; ok is False when exiftool reported an error
+        """
+        with self._lock:
+            if not self.running():
+                self.start()
+            sequence = next(self._sequence)
+            ready = f"{{ready{sequence}}}".encode()
+            # -echo4 在命令结束后向 stderr 写入同一个标记，两个管道都能读到命令边界
+            lines = [str(arg) for arg in args] + ['-echo4', ready.decode(), f'-execute{sequence}']
+            self._process.stdin.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            self._process.stdin.flush()
+            stdout = self._read_until(self._process.stdout, ready)
+            stderr = self._read_until(self._process.stderr, ready)
+        ok = not any(line.startswith('Error') for line in stderr.splitlines())
+        return ok, stdout, stderr
+
+    def _read_until(self, stream, ready):
+        lines = []
+        while True:
+            line = stream.readline()
+            if not line:
+                raise OSError(f"exiftool exited unexpectedly ({self.executable})")
+            if line.rstrip(b'\r\n') == ready:
+                return b''.join(lines).decode('utf-8', errors='replace')
+            lines.append(line)
+
+    def close(self):
+        with self._lock:
+            if self.running():
+                try:
+                    self._process.stdin.write(b'-stay_open\nFalse\n')
+                    self._process.stdin.flush()
+                    self._process.wait(timeout=5)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._process.kill()
+            self._process = None
+
+
+def shared(executable):
+    """The process-wide ExifTool for an executable (started lazily)."""
+    with _lock:
+        process = _processes.get(executable)
+        if process is None:
+            process = _processes[executable] = ExifTool(executable)
+            if len(_processes) == 1:
+                atexit.register(close)
+        return process
+
+
+def run(cmd, check=False):
+    """
+    Drop-in for subprocess.run(cmd, capture_output=True, text=True) with cmd[0] an exiftool executable
+
+    Falls back to a one-off exiftool process if the stay-open process cannot be used.
+
+    Returns:
+        subprocess.CompletedProcess: returncode 0 on success, 1 if exiftool reported an error
+    """
+    try:
+        ok, stdout, stderr = shared(cmd[0]).execute(*cmd[1:])
+        result = subprocess.CompletedProcess(cmd, 0 if ok else 1, stdout, stderr)
+    except OSError:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    if check:
+        result.check_returncode()
+    return result
+
+
+def close():
+    """Stop all shared exiftool processes."""
+    with _lock:
+        processes = list(_processes.values())
+        _processes.clear()
+    for process in processes:
+        process.close()
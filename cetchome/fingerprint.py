@@ -0,0 +1,162 @@
+"""
+File fingerprints shared by all tools.
+
+Two kinds of fingerprint, both cached per (device, inode, size, mtime) in
+memory and in an append-only log in the cache folder (see
+cetchome.cache_path), so an unchanged file is never read twice:
+
+    full      hash of the whole content (optionally through mmap)
+    sampled   hash of the size, the first and last block and SAMPLE_BLOCKS
+              evenly spaced blocks; reads about 1 MB of a multi-GB video,
+              so identity checks take milliseconds. Files small enough to
+              be covered by the samples are hashed in full.
+
+The hash is xxh3-128 when the optional xxhash package is installed and
+BLAKE2b otherwise; fingerprints are only comparable with the same
+algorithm, which is part of the cache key.
+"""
+import importlib.util
+import os
+import threading
+
+from cetchome import cache_path
+
+SAMPLE_BLOCK = 64 * 1024
+SAMPLE_BLOCKS = 16
+BUFFER_SIZE = 8 * 1024 * 1024
+LOG_NAME = 'fingerprints.log'
+
+ALGORITHM = 'xxh3_128' if importlib.util.find_spec('xxhash') is not None else 'blake2b'
+
+_lock = threading.Lock()
+_cache = {}
+_log_path = None
+_log_loaded = False
+
+
+def _hasher():
+    if ALGORITHM == 'xxh3_128':
+        import xxhash
+        return xxhash.xxh3_128()
+    import hashlib
+    return hashlib.blake2b(digest_size=16)
+
+
+def full_hash(path, use_mmap=False):
+    """Hash of the whole file (not cached). mmap avoids copying the content through Python buffers."""
+    hasher = _hasher()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size > 0:
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, BUFFER_SIZE):
+                        hasher.update(view[offset:offset + BUFFER_SIZE])
+                finally:
+                    view.release()
+        else:
+            buffer = bytearray(BUFFER_SIZE)
+            view = memoryview(buffer)
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                hasher.update(view[:count])
+    return hasher.hexdigest()
+
+
+def sampled_hash(path, blocks=SAMPLE_BLOCKS, block_size=SAMPLE_BLOCK):
+    """Hash of the size, head, tail and evenly spaced blocks of a file (not cached)."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= (blocks + 2) * block_size:
+            return full_hash(path)
+        hasher = _hasher()
+        hasher.update(size.to_bytes(8, 'little'))
+        last = size - block_size
+        for index in range(blocks + 2):
+            # 第一个块为文件头，最后一个为文件尾，其余均匀分布
+            f.seek(last * index // (blocks + 1))
+            hasher.update(f.read(block_size))
+    return hasher.hexdigest()
+
+
+def _key(stat, path, mode):
+    # 网络共享上 st_ino 可能为 0，此时以路径代替
+    identity = stat.st_ino or os.path.normcase(os.path.abspath(path))
+    return f"{ALGORITHM}/{mode}/{stat.st_dev}/{identity}/{stat.st_size}/{stat.st_mtime_ns}"
+
+
+def _load_log():
+    global _log_path, _log_loaded
+    _log_loaded = True
+    _log_path = cache_path(LOG_NAME)
+    if _log_path is None:
+        return
+    lines = 0
+    try:
+        with open(_log_path, encoding='utf-8') as f:
+            for line in f:
+                key, _, digest = line.rstrip('\n').partition('\t')
+                if digest:
+                    _cache[key] = digest
+                    lines += 1
+    except OSError:
+        return
+    # 同一文件被多次记录 (修改后重新计算) 时压缩日志
+    if lines > 2 * len(_cache) + 1000:
+        try:
+            temporary = f"{_log_path}.{os.getpid()}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.writelines(f"{key}\t{digest}\n" for key, digest in _cache.items())
+            os.replace(temporary, _log_path)
+        except OSError:
+            pass
+
+
+def _remember(key, digest):
+    with _lock:
+        _cache[key] = digest
+        if _log_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(_log_path), exist_ok=True)
+            with open(_log_path, 'a', encoding='utf-8') as f:
+                f.write(f"{key}\t{digest}\n")
+        except OSError:
+            pass
+
+
+def fingerprint(path, mode='sampled'):
+    """
+    Cached fingerprint of a file
+
+    Args:
+        path (str): File to fingerprint
+        mode (str): 'sampled' (fast, for identity checks of large media) or 'full'
+
+    Returns:
+        str: Hex digest
+    """
+    stat = os.stat(path)
+    key = _key(stat, path, mode)
+    with _lock:
+        if not _log_loaded:
+            _load_log()
+        digest = _cache.get(key)
+    if digest is None:
+        digest = full_hash(path) if mode == 'full' else sampled_hash(path)
+        _remember(key, digest)
+    return digest
+
+
+def identical(path1, path2, mode='sampled'):
+    """True if both files exist with the same size and fingerprint."""
+    try:
+        if os.stat(path1).st_size != os.stat(path2).st_size:
+            return False
+        return fingerprint(path1, mode) == fingerprint(path2, mode)
+    except OSError:
+        return False
@@ -0,0 +1,278 @@
+"""
+Job-graph executor shared by the tools.
+
+A tool describes its work as steps: a function, its arguments (passing
+another step as an argument passes that step's result and makes it a
+dependency) and a resource class. Graph.run() starts every step as soon
+as its inputs are ready, on one thread pool per resource class, so the
+probing, copying and metadata work of one file overlaps the encode of
+another:
+
+    graph = jobs.Graph()
+    info = graph.add('probe', get_video_info, path, resource='subprocess', file=path.name, files=[path])
+    out = graph.add('transcode', transcode, path, mp4, info, resource='encode', file=path.name,
+                    files=[path], outputs=[mp4], params=settings)
+    graph.run()
+    print(out.status, out.result, out.error)
+
+Steps that declare files are memoized: the (JSON) result is stored under a
+hash of the step name, params, the fingerprints of those files
+(cetchome.fingerprint, sampled) and the output paths, and a re-run with
+unchanged inputs whose outputs are still in place returns it without
+calling the step again. The cache lives in <CETC_CACHE>/jobs (default
+~/.cache/cetchome/jobs; CETC_CACHE=off disables it).
+
+Steps waiting for the same pool start in order of priority (highest
+first, then in the order they were added), e.g. the longest encodes first
+to shorten the total run time of a batch.
+
+Every step runs inside a tracing span named after it, with its keyword
+attributes (e.g. file). The pools are threads: the heavy work of the
+tools runs in ffmpeg/exiftool subprocesses or in C code that releases the
+GIL, and steps can pass in-memory results (decoded images) to each other.
+"""
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from cetchome import cache_path, fingerprint, tracing
+
+# 每类资源的并发数；ffmpeg 编码本身已使用全部核心，一次只运行一个
+DEFAULT_WORKERS = {
+    'cpu': os.cpu_count() or 1,
+    'io': 8,
+    'subprocess': os.cpu_count() or 1,
+    'encode': 1,
+}
+
+
+class Step:
+    """One unit of work in a Graph. Use Graph.add() instead of creating it directly."""
+
+    def __init__(self, name, func, args, resource, after, attrs, files, outputs, params, priority=0):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.resource = resource
+        self.priority = priority
+        self.attrs = attrs
+        self.files = [str(path) for path in files]
+        self.outputs = [str(path) for path in outputs]
+        self.params = params
+        self.deps = []
+        for value in (*args, *after):
+            if isinstance(value, Step) and value not in self.deps:
+                self.deps.append(value)
+
+        self.status = 'pending'  # pending, ready, running, done, cached, failed, skipped
+        self.result = None
+        self.error = None
+        self.seconds = 0.0
+        self._unstored_key = None
+
+    @property
+    def ok(self):
+        return self.status in ('done', 'cached')
+
+    def __repr__(self):
+        return f"<Step {self.name} {self.attrs.get('file', '')} {self.status}>"
+
+
+class Graph:
+    """A set of steps and their dependencies."""
+
+    def __init__(self):
+        self.steps = []
+
+    def add(self, name, func, *args, resource='cpu', after=(), files=(), outputs=(), params=None, priority=0,
+            **kwargs):
+        """
+        Add a step calling func(*args)
+
+        Args:
+            name (str): Step name, also the name of its tracing span
+            func (callable): Work to do; Step arguments are replaced by their results
+            resource (str): Pool to run on: cpu, io, subprocess or encode (see DEFAULT_WORKERS)
+            after (iterable): Steps that must finish first without passing their result
+            files (iterable): Input files that, with params, determine the result (enables memoization)
+            outputs (iterable): Files the step writes (or a later step moves into place); a memoized
+                result is only reused while they are unchanged
+            params: JSON-serializable settings that change the result
+            priority (float): Among ready steps of the same resource, higher priorities start first
+            **kwargs: Attributes of the step's span (e.g. file=name)
+
+        Returns:
+            Step: Handle to depend on and to read status/result/error from after run()
+        """
+        step = Step(name, func, args, resource, after, kwargs, files, outputs, params, priority)
+        self.steps.append(step)
+        return step
+
+    def run(self, workers=None, memo=True, on_step=None):
+        """
+        Run all steps; a failed step skips everything that depends on it
+
+        Args:
+            workers (dict): Pool sizes overriding DEFAULT_WORKERS, e.g. {'encode': 2}
+            memo (bool): Reuse and store memoized results
+            on_step (callable): Called as on_step(step) in this thread whenever a step finishes, fails or is skipped
+
+        Returns:
+            Graph: self
+        """
+        # 按需导入，使只解析参数的工具启动更快
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        limits = dict(DEFAULT_WORKERS, **(workers or {}))
+        cache = cache_path('jobs') if memo else None
+        remaining = {step: set(step.deps) for step in self.steps}
+        dependents = defaultdict(list)
+        for step in self.steps:
+            for dep in step.deps:
+                dependents[dep].append(step)
+        pools = {}
+        running = {}
+        # 就绪但等待线程的步骤，每类资源一个按优先级排序的堆；池内不排队
+        ready = defaultdict(list)
+        busy = Counter()
+        order = itertools.count()
+
+        def dispatch(resource):
+            limit = limits.get(resource, 1)
+            while ready[resource] and busy[resource] < limit:
+                step = heapq.heappop(ready[resource])[2]
+                step.status = 'running'
+                busy[resource] += 1
+                pool = pools.get(resource)
+                if pool is None:
+                    pool = pools[resource] = ThreadPoolExecutor(
+                        max_workers=limit, thread_name_prefix=f"jobs-{resource}")
+                # 复制调用方的 contextvars，使步骤内的 span 监听器能归属到发起运行的调用
+                running[pool.submit(contextvars.copy_context().run, _execute, step, cache)] = step
+
+        def submit(step, start=True):
+            step.status = 'ready'
+            heapq.heappush(ready[step.resource], (-step.priority, next(order), step))
+            if start:
+                dispatch(step.resource)
+
+        def settle(step):
+            if on_step is not None:
+                on_step(step)
+            for child in dependents[step]:
+                if child.status != 'pending':
+                    continue
+                if not step.ok:
+                    child.status = 'skipped'
+                    child.error = f"{step.name} {step.status}"
+                    settle(child)
+                else:
+                    remaining[child].discard(step)
+                    if not remaining[child]:
+                        submit(child)
+
+        try:
+            # 先把所有初始就绪的步骤入堆，再按优先级启动
+            for step in self.steps:
+                if step.status == 'pending' and not remaining[step]:
+                    submit(step, start=False)
+            for resource in list(ready):
+                dispatch(resource)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    busy[step.resource] -= 1
+                    settle(step)
+                    dispatch(step.resource)
+            # 输出由后续步骤完成的结果 (例如输出从暂存目录移出) 在图运行完后保存
+            for step in self.steps:
+                if step.status == 'done' and step._unstored_key:
+                    _store(cache, step._unstored_key, step)
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+        return self
+
+    @property
+    def failed(self):
+        return [step for step in self.steps if step.status == 'failed']
+
+
+def _execute(step, cache):
+    started = time.perf_counter()
+    with tracing.span(step.name, **step.attrs) as step_span:
+        try:
+            key = _key(step) if cache and step.files else None
+            hit, result = _load(cache, key)
+            if hit:
+                step.result = result
+                step.status = 'cached'
+                step_span.set('cached', True)
+            else:
+                args = [value.result if isinstance(value, Step) else value for value in step.args]
+                step.result = step.func(*args)
+                step.status = 'done'
+                if not _store(cache, key, step):
+                    step._unstored_key = key
+        except Exception as e:
+            step.status = 'failed'
+            step.error = f"{type(e).__name__}: {e}"
+            step_span.set('error', type(e).__name__)
+    step.seconds = time.perf_counter() - started
+
+
+def _key(step):
+    try:
+        content = [fingerprint.fingerprint(path) for path in step.files]
+    except OSError:
+        return None
+    import hashlib
+    payload = json.dumps([step.name, step.params, content, [os.path.abspath(path) for path in step.outputs]],
+                         sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+def _output_state(paths):
+    state = {}
+    for path in paths:
+        stat = os.stat(path)
+        state[path] = [stat.st_size, stat.st_mtime_ns]
+    return state
+
+
+def _load(cache, key):
+    if key is None:
+        return False, None
+    try:
+        with open(os.path.join(cache, key[:2], key + '.json'), encoding='utf-8') as f:
+            entry = json.load(f)
+        if _output_state(entry['outputs']) != entry['outputs']:
+            return False, None
+        return True, entry['result']
+    except (OSError, ValueError, KeyError):
+        return False, None
+
+
+def _store(cache, key, step):
+    # None 表示“没有结果”（例如 ffprobe 失败），不缓存
+    if key is None or step.result is None:
+        return False
+    try:
+        line = json.dumps({'step': step.name, 'result': step.result, 'outputs': _output_state(step.outputs)},
+                          ensure_ascii=False)
+        folder = os.path.join(cache, key[:2])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, key + '.json')
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(line)
+        os.replace(temporary, path)
+        return True
+    except (OSError, TypeError, ValueError):
+        return False
@@ -0,0 +1,310 @@
+"""
+Prometheus-style metrics shared by all tools.
+
+Metrics are off by default and every update is a no-op. Once enabled (a
+tool's --metrics-port/--metrics-file options or the CETC_METRICS_PORT /
+CETC_METRICS_FILE environment variables) counters, gauges and histograms
+are kept in memory and exposed in the Prometheus text format, either on
+http://127.0.0.1:<port>/metrics or by periodically rewriting a file for
+node_exporter's textfile collector.
+
+Per-stage durations, bytes and processed/failed files come from the tracing
+spans the tools already record (see cetchome.tracing); tool-specific values
+such as encode fps or queue depth are updated directly:
+
+    metrics.QUEUE_DEPTH.set(len(remaining))
+"""
+import atexit
+import os
+import tempfile
+import threading
+import time
+
+from cetchome import tracing
+
+DEFAULT_INTERVAL = 15.0
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.25, 1.5, 2.0)
+
+_lock = threading.Lock()
+_registry = []
+_enabled = False
+_tool = None
+_server = None
+_textfile = None
+_stop = threading.Event()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A metric family; label values are passed as keyword arguments to each update."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        labels = {'tool': _tool} if _tool else {}
+        labels.update(zip(self.labelnames, key))
+        return labels
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            samples = sorted(self._values.items())
+        for key, value in samples:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_sample(self, key, state):
+        labels = self._labels(key)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state[0]):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state[1])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {state[2]}")
+        return lines
+
+
+# 由 tracing span 推导的通用指标
+FILES = Counter('cetc_files_total', 'Files processed, by stage and status (ok or failed)', ('stage', 'status'))
+BYTES = Counter('cetc_bytes_total', 'Bytes read and written, by stage and direction (in or out)',
+                ('stage', 'direction'))
+STAGE_DURATION = Histogram('cetc_stage_duration_seconds', 'Wall time per stage', ('stage',))
+
+# 各工具直接更新的指标
+QUEUE_DEPTH = Gauge('cetc_queue_depth', 'Items waiting to be processed in the current batch')
+ENCODE_FPS = Gauge('cetc_encode_fps', 'Frames per second reported by the running ffmpeg encode')
+COMPRESSION_RATIO = Histogram('cetc_compression_ratio', 'Output size divided by input size per converted file',
+                              buckets=RATIO_BUCKETS)
+DOWNLOAD_LATENCY = Histogram('cetc_download_latency_seconds', 'Time until the response headers arrived',
+                             buckets=LATENCY_BUCKETS)
+DOWNLOAD_ERRORS = Counter('cetc_download_errors_total', 'Failed downloads, by HTTP status or exception type',
+                          ('reason',))
+LAST_UPDATE = Gauge('cetc_last_update_timestamp_seconds', 'Unix time of the last finished stage')
+
+
+def _on_span(record):
+    """tracing listener: turn every finished span into stage metrics."""
+    stage = record['span']
+    STAGE_DURATION.observe(record['wall'], stage=stage)
+    for direction in ('in', 'out'):
+        amount = record.get('bytes_' + direction)
+        if amount:
+            BYTES.inc(amount, stage=stage, direction=direction)
+    # 只有每个文件的顶层 span 计入文件数
+    if record['parent'] is None and 'file' in record:
+        failed = 'error' in record or record.get('success') is False
+        FILES.inc(stage=stage, status='failed' if failed else 'ok')
+    LAST_UPDATE.set(time.time())
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    """Atomically rewrite path with the current metrics (for the textfile collector)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    # 先写临时文件再重命名，采集器不会读到写了一半的文件
+    fd, temp_path = tempfile.mkstemp(prefix='.metrics-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(render())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _start_server(port):
+    # http.server 导入较慢，只在需要 HTTP 端点时加载
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+def _write_periodically(path, interval):
+    while not _stop.wait(interval):
+        try:
+            write_textfile(path)
+        except OSError as e:
+            print(f"Warning: could not write metrics file {path}: {e}")
+
+
+def enable(tool, port=None, textfile=None, interval=DEFAULT_INTERVAL):
+    """
+    Start collecting metrics for one tool run.
+
+    Args:
+        tool (str): Value of the constant "tool" label (e.g. 'mov2mp4')
+        port (int): Serve http://127.0.0.1:<port>/metrics from a background thread
+        textfile (str): Rewrite this .prom file every interval seconds and at exit
+        interval (float): Seconds between textfile writes
+
+    Returns:
+        int: The bound port (useful with port=0), or None without a server
+    """
+    global _enabled, _tool, _server, _textfile
+    disable()
+    _tool = tool
+    _enabled = True
+    _stop.clear()
+    tracing.add_listener(_on_span)
+
+    if port is not None:
+        _server = _start_server(port)
+    if textfile:
+        _textfile = textfile
+        threading.Thread(target=_write_periodically, args=(textfile, interval),
+                         name='metrics-textfile', daemon=True).start()
+    atexit.register(disable)
+    return _server.server_address[1] if _server is not None else None
+
+
+def disable():
+    """Stop the server and writer; the textfile gets a final write."""
+    global _enabled, _server, _textfile
+    if not _enabled:
+        return
+    tracing.remove_listener(_on_span)
+    _stop.set()
+    if _textfile:
+        try:
+            write_textfile(_textfile)
+        except OSError as e:
+            print(f"Warning: could not write metrics file {_textfile}: {e}")
+        _textfile = None
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def enable_from_env(tool):
+    """Enable metrics when CETC_METRICS_PORT or CETC_METRICS_FILE is set. Returns True if enabled."""
+    port = os.environ.get('CETC_METRICS_PORT')
+    textfile = os.environ.get('CETC_METRICS_FILE')
+    if not port and not textfile:
+        return False
+    enable(tool, int(port) if port else None, textfile or None)
+    return True
+
+
+def add_arguments(parser):
+    """Add the shared --metrics-port/--metrics-file options to a tool's argument parser."""
+    port = os.environ.get('CETC_METRICS_PORT')
+    parser.add_argument('--metrics-port', type=int, default=int(port) if port else None, metavar='PORT',
+                        help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default: $CETC_METRICS_PORT)')
+    parser.add_argument('--metrics-file', default=os.environ.get('CETC_METRICS_FILE'), metavar='FILE',
+                        help='Periodically write Prometheus metrics to FILE for the textfile collector '
+                             '(default: $CETC_METRICS_FILE)')
+
+
+def enable_from_args(args, tool):
+    """Enable metrics from add_arguments() options. Returns True if enabled."""
+    if args.metrics_port is None and not args.metrics_file:
+        return False
+    enable(tool, args.metrics_port, args.metrics_file)
+    return True
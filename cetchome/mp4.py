@@ -0,0 +1,361 @@
+"""
+Minimal reader for the structure of QuickTime/MP4 files (MOV, MP4, M4A).
+
+Only the moov atom is read: the top-level atoms are walked by seeking
+over their headers, so the media data (mdat) is never touched and a
+multi-GB file is inspected in milliseconds without starting a process.
+
+read_tracks() reports per track what is needed to check a file without
+decoding it (duration, sample and keyframe counts, where the last sample
+ends, which is past the end of the file when it is truncated) and its
+codec, dimensions and rotation. probe() condenses that into the summary
+the tools use in place of ffprobe: codecs, bitrates, duration,
+dimensions, rotation and capture time/location from the metadata atoms
+(mvhd, udta ©day/©xyz, Apple's mdta keys).
+"""
+import math
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+# 采样描述 (stsd) 的四字符码 -> 与 ffprobe 相同的编码名称
+CODECS = {
+    'avc1': 'h264', 'avc3': 'h264', 'hvc1': 'hevc', 'hev1': 'hevc', 'dvh1': 'hevc', 'dvhe': 'hevc',
+    'mp4v': 'mpeg4', 'av01': 'av1', 'vp09': 'vp9', 'jpeg': 'mjpeg', 'mjpa': 'mjpeg',
+    'apch': 'prores', 'apcn': 'prores', 'apcs': 'prores', 'apco': 'prores', 'ap4h': 'prores', 'ap4x': 'prores',
+    'mp4a': 'aac', '.mp3': 'mp3', 'ac-3': 'ac3', 'ec-3': 'eac3', 'alac': 'alac', 'Opus': 'opus', 'fLaC': 'flac',
+    'sowt': 'pcm_s16le', 'twos': 'pcm_s16be', 'lpcm': 'pcm', 'ulaw': 'pcm_mulaw', 'alaw': 'pcm_alaw',
+}
+# esds 中 MPEG-1/2 音频的 objectTypeIndication (其余视为 AAC)
+MP3_OBJECT_TYPES = {0x69, 0x6B}
+# QuickTime 时间从 1904-01-01 (UTC) 起算
+EPOCH_1904 = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+
+def _atoms(data, start=0, end=None):
+    """(type, payload start, payload end) of the atoms in data[start:end]"""
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, position)
+        header = 8
+        if size == 1:
+            if position + 16 > end:
+                break
+            size = struct.unpack_from('>Q', data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header or position + size > end:
+            raise ValueError(f"damaged {kind.decode('latin-1')} atom at offset {position}")
+        yield kind, position + header, position + size
+        position += size
+
+
+def _read_moov(f, file_size):
+    position = 0
+    while position + 8 <= file_size:
+        f.seek(position)
+        header = f.read(16)
+        if len(header) < 8:
+            break
+        size, kind = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if size == 1 and len(header) == 16:
+            size = struct.unpack_from('>Q', header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - position
+        if size < header_size:
+            raise ValueError(f"damaged atom at offset {position}")
+        if kind == b'moov':
+            if position + size > file_size:
+                raise ValueError('moov atom is cut off')
+            f.seek(position + header_size)
+            return f.read(size - header_size)
+        position += size
+    raise ValueError('no moov atom (incomplete file?)')
+
+
+def _find(data, start, end, *path):
+    """Payload (start, end) of the first atom along path, or None"""
+    for kind, payload_start, payload_end in _atoms(data, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return payload_start, payload_end
+            return _find(data, payload_start, payload_end, *path[1:])
+    return None
+
+
+def _timing(data, box):
+    """(timescale, duration) of an mvhd/mdhd payload"""
+    start = box[0]
+    if data[start] == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, start + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', data, start + 12)
+    return timescale, duration
+
+
+def _table(data, box, fmt, skip=0):
+    """Entries of a sample table atom (version/flags, [skip bytes,] entry count, entries)"""
+    start = box[0] + 4 + skip
+    count = struct.unpack_from('>I', data, start)[0]
+    size = struct.calcsize(fmt)
+    start += 4
+    if start + count * size > box[1]:
+        raise ValueError('damaged sample table')
+    return list(struct.iter_unpack(fmt, data[start:start + count * size]))
+
+
+def _sample_sizes(data, box):
+    sample_size, count = struct.unpack_from('>II', data, box[0] + 4)
+    if sample_size:
+        return [sample_size] * count
+    start = box[0] + 12
+    if start + count * 4 > box[1]:
+        raise ValueError('damaged sample size table')
+    return [size for size, in struct.iter_unpack('>I', data[start:start + count * 4])]
+
+
+def _data_end(offsets, chunk_runs, sizes):
+    """Offset just past the last byte of sample data referenced by the track"""
+    if not offsets or not sizes:
+        return 0
+    # 样本大小的前缀和，按块依次取出每块的样本
+    ends = [0, *accumulate(sizes)]
+    runs = [(first - 1, per_chunk) for first, per_chunk, _ in chunk_runs] + [(len(offsets), 0)]
+    sample = 0
+    data_end = 0
+    for (first, per_chunk), (following, _) in zip(runs, runs[1:]):
+        for chunk in range(first, min(following, len(offsets))):
+            last = min(sample + per_chunk, len(sizes))
+            data_end = max(data_end, offsets[chunk] + ends[last] - ends[sample])
+            sample = last
+    return data_end
+
+
+def _sample_description(data, box, handler):
+    """Codec (and coded size of video) from the first sample entry of an stsd payload"""
+    entries = list(_atoms(data, box[0] + 8, box[1]))
+    if not entries:
+        return {}
+    kind, start, end = entries[0]
+    fourcc = kind.decode('latin-1')
+    description = {'codec': CODECS.get(fourcc, fourcc.strip())}
+    if handler == 'vide' and start + 28 <= end:
+        description['width'], description['height'] = struct.unpack_from('>HH', data, start + 24)
+    elif fourcc == 'mp4a':
+        # esds 可能直接在采样条目中，也可能在 QuickTime 的 wave 原子里
+        esds = data.find(b'esds', start, end)
+        if esds >= 0 and _esds_object_type(data, esds + 8, end) in MP3_OBJECT_TYPES:
+            description['codec'] = 'mp3'
+    return description
+
+
+def _descriptor(data, position):
+    """(tag, payload start) of an MPEG-4 descriptor with its variable-length size"""
+    tag = data[position]
+    position += 1
+    for _ in range(4):
+        byte = data[position]
+        position += 1
+        if not byte & 0x80:
+            break
+    return tag, position
+
+
+def _esds_object_type(data, position, end):
+    """objectTypeIndication of the decoder config in an esds payload (after version/flags)"""
+    tag, position = _descriptor(data, position)
+    if tag != 0x03 or position + 3 > end:
+        return None
+    flags = data[position + 2]
+    position += 3
+    if flags & 0x80:
+        position += 2
+    if flags & 0x40:
+        position += 1 + data[position]
+    if flags & 0x20:
+        position += 2
+    tag, position = _descriptor(data, position)
+    return data[position] if tag == 0x04 and position < end else None
+
+
+def _rotation(data, box):
+    """Clockwise display rotation in degrees from a tkhd transformation matrix"""
+    offset = box[0] + (52 if data[box[0]] == 1 else 40)
+    a, b = struct.unpack_from('>ii', data, offset)
+    return round(math.degrees(math.atan2(b, a))) % 360
+
+
+def _creation_time(data, box):
+    start = box[0]
+    seconds = struct.unpack_from('>Q' if data[start] == 1 else '>I', data, start + 4)[0]
+    if not seconds:
+        return None
+    try:
+        return (EPOCH_1904 + timedelta(seconds=seconds)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    except OverflowError:
+        return None
+
+
+def _tags(moov):
+    """String metadata: QuickTime udta (©day, ©xyz, ...) and mdta keys (com.apple.quicktime.*)"""
+    tags = {}
+    udta = _find(moov, 0, len(moov), b'udta')
+    if udta:
+        for kind, start, end in _atoms(moov, *udta):
+            if kind[:1] == b'\xa9' and start + 4 <= end:
+                # 2 字节长度 + 2 字节语言代码 + 文本
+                length = struct.unpack_from('>H', moov, start)[0]
+                text = moov[start + 4:min(start + 4 + length, end)]
+                tags[kind.decode('latin-1')] = text.decode('utf-8', 'replace')
+
+    # Apple 写在 moov/meta，ffmpeg 写在 moov/udta/meta (ISO 格式，带版本/标志)
+    meta = _find(moov, 0, len(moov), b'meta') or (udta and _find(moov, *udta, b'meta'))
+    if meta:
+        start = meta[0] if moov[meta[0] + 4:meta[0] + 8] == b'hdlr' else meta[0] + 4
+        children = {kind: (start, end) for kind, start, end in _atoms(moov, start, meta[1])}
+        if b'keys' in children and b'ilst' in children:
+            keys = []
+            position, end = children[b'keys'][0] + 8, children[b'keys'][1]
+            while position + 8 <= end:
+                size = struct.unpack_from('>I', moov, position)[0]
+                if size < 8:
+                    break
+                keys.append(moov[position + 8:position + size].decode('utf-8', 'replace'))
+                position += size
+            for kind, start, end in _atoms(moov, *children[b'ilst']):
+                index = int.from_bytes(kind, 'big') - 1
+                value = _find(moov, start, end, b'data')
+                # data: 4 字节类型 (1 = UTF-8) + 4 字节区域 + 值
+                if 0 <= index < len(keys) and value and struct.unpack_from('>I', moov, value[0])[0] == 1:
+                    tags[keys[index]] = moov[value[0] + 8:value[1]].decode('utf-8', 'replace')
+    return tags
+
+
+def read_tracks(path):
+    """
+    Structure of a MOV/MP4 file read from its moov atom
+
+    Args:
+        path (str): File to inspect
+
+    Returns:
+        dict: 'size' (bytes), 'duration' (seconds, movie header), 'creation_time'
+              (ISO 8601 UTC, movie header), 'tags' (udta ©xxx and mdta key
+              strings) and 'tracks', one dict per track with 'handler' ('vide',
+              'soun', ...), 'codec', 'width', 'height', 'rotation' (degrees),
+              'duration' (seconds), 'samples', 'bytes' (sum of sample sizes),
+              'keyframes' (None if every sample is one) and 'data_end' (offset
+              past its last sample)
+
+    Raises:
+        ValueError: The file has no complete moov atom or its tables are damaged
+        OSError: The file cannot be read
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        moov = _read_moov(f, file_size)
+
+    try:
+        info = {'size': file_size, 'duration': 0.0, 'tracks': []}
+        mvhd = _find(moov, 0, len(moov), b'mvhd')
+        if mvhd:
+            timescale, duration = _timing(moov, mvhd)
+            info['duration'] = duration / timescale if timescale else 0.0
+
+        for kind, start, end in _atoms(moov):
+            if kind != b'trak':
+                continue
+            hdlr = _find(moov, start, end, b'mdia', b'hdlr')
+            mdhd = _find(moov, start, end, b'mdia', b'mdhd')
+            stbl = _find(moov, start, end, b'mdia', b'minf', b'stbl')
+            if not (hdlr and mdhd and stbl):
+                continue
+            timescale, duration = _timing(moov, mdhd)
+            tables = {kind: (box_start, box_end) for kind, box_start, box_end in _atoms(moov, *stbl)}
+            sizes = _sample_sizes(moov, tables[b'stsz']) if b'stsz' in tables else []
+            if b'co64' in tables:
+                offsets = [offset for offset, in _table(moov, tables[b'co64'], '>Q')]
+            elif b'stco' in tables:
+                offsets = [offset for offset, in _table(moov, tables[b'stco'], '>I')]
+            else:
+                offsets = []
+            chunk_runs = _table(moov, tables[b'stsc'], '>III') if b'stsc' in tables else []
+            handler = moov[hdlr[0] + 8:hdlr[0] + 12].decode('latin-1')
+            track = {
+                'handler': handler,
+                'duration': duration / timescale if timescale else 0.0,
+                'samples': len(sizes),
+                'bytes': sum(sizes),
+                'keyframes': len(_table(moov, tables[b'stss'], '>I')) if b'stss' in tables else None,
+                'data_end': _data_end(offsets, chunk_runs, sizes),
+                'codec': None,
+                'width': 0,
+                'height': 0,
+                'rotation': 0,
+            }
+            if b'stsd' in tables:
+                track.update(_sample_description(moov, tables[b'stsd'], handler))
+            tkhd = _find(moov, start, end, b'tkhd')
+            if tkhd and handler == 'vide':
+                track['rotation'] = _rotation(moov, tkhd)
+            info['tracks'].append(track)
+
+        mvhd_time = _creation_time(moov, mvhd) if mvhd else None
+        info['creation_time'] = mvhd_time
+        info['tags'] = _tags(moov)
+    except (struct.error, KeyError, IndexError) as e:
+        raise ValueError(f"damaged moov atom: {e}") from e
+    return info
+
+
+def first_track(info, handler):
+    """First track with the given handler type ('vide', 'soun'), or None"""
+    return next((track for track in info['tracks'] if track['handler'] == handler), None)
+
+
+def probe(path):
+    """
+    Summary of a MOV/MP4 file in the shape of the tools' ffprobe-based probes
+
+    Bitrates are the sample bytes of the track over its duration (what
+    ffprobe reports for MP4 streams). 'capture_time' is Apple's creation
+    date, the QuickTime ©day tag or the movie header time, in that order;
+    'location' is the ISO 6709 string of the GPS position, if any.
+
+    Returns:
+        dict: 'video_codec', 'video_bitrate', 'audio_codec', 'audio_bitrate',
+              'duration', 'width', 'height', 'rotation', 'capture_time', 'location'
+
+    Raises:
+        ValueError: Not a QuickTime/MP4 file with a video track
+        OSError: The file cannot be read
+    """
+    info = read_tracks(path)
+    video = first_track(info, 'vide')
+    if video is None:
+        raise ValueError('no video track')
+    audio = first_track(info, 'soun')
+    tags = info['tags']
+
+    def bitrate(track):
+        return int(track['bytes'] * 8 / track['duration']) if track and track['duration'] else 0
+
+    return {
+        'video_codec': video['codec'],
+        'video_bitrate': bitrate(video),
+        'audio_codec': audio['codec'] if audio else None,
+        'audio_bitrate': bitrate(audio),
+        'duration': info['duration'] or video['duration'],
+        'width': video['width'],
+        'height': video['height'],
+        'rotation': video['rotation'],
+        'capture_time': (tags.get('com.apple.quicktime.creationdate') or tags.get('\xa9day')
+                         or info['creation_time']),
+        'location': (tags.get('com.apple.quicktime.location.ISO6709') or tags.get('\xa9xyz')
+                     or tags.get('location')),
+    }
@@ -0,0 +1,171 @@
+"""
+Local staging of inputs and outputs for sources on network shares.
+
+Encoders and decoders reading straight from an SMB/NFS share stall on
+network latency. A Stager copies inputs to a local scratch folder with
+large sequential reads, READ_AHEAD files ahead of the one being worked
+on, so the next file is already local when the current one finishes:
+
+    stager = Stager('D:/scratch', order=files)
+    local = stager.local(files[0])      # waits for the copy, starts copying files[1:3]
+    ...                                 # work on the local copy
+    stager.release(files[0])            # the copy may now be evicted
+    stager.close()
+
+Staged copies stay within a byte limit; copies that are no longer in use
+are evicted least recently used first. A file that does not fit, or
+whose copy fails, is read from its original location. Outputs can be
+written to scratch (output_path()) and moved to their destination with
+publish(), e.g. from an I/O step of a job graph while the next file is
+encoded.
+"""
+import itertools
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from cetchome import tracing
+
+READ_AHEAD = 2
+SIZE_LIMIT = 20 * 1024 ** 3
+BUFFER_SIZE = 16 * 1024 * 1024
+
+
+class _Entry:
+    def __init__(self, local, size):
+        self.local = local
+        self.size = size
+        self.pinned = True
+        self.ready = threading.Event()
+        self.error = None
+
+
+class Stager:
+    """Read-ahead copies of inputs in a size-bounded, LRU-evicted scratch folder."""
+
+    def __init__(self, scratch, order=(), size_limit=SIZE_LIMIT, read_ahead=READ_AHEAD):
+        """
+        Args:
+            scratch (str): Local folder; a private subfolder is created in it and removed by close()
+            order (iterable): Input paths in the order they will be processed (for read-ahead)
+            size_limit (int): Maximum bytes of staged inputs
+            read_ahead (int): Number of inputs to copy ahead of the one being processed
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.folder = Path(scratch) / f"cetchome-stage-{os.getpid()}"
+        (self.folder / 'in').mkdir(parents=True, exist_ok=True)
+        (self.folder / 'out').mkdir(parents=True, exist_ok=True)
+        self.order = [str(path) for path in order]
+        self._position = {path: index for index, path in enumerate(self.order)}
+        self.size_limit = size_limit
+        self.read_ahead = read_ahead
+        self._entries = OrderedDict()
+        self._used = 0
+        self._cursor = -1
+        self._names = itertools.count()
+        self._lock = threading.Lock()
+        # 单线程顺序读取，避免多个并发请求在网络共享上互相争抢
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stage')
+
+    def local(self, source):
+        """
+        Local path to read source from, waiting for its copy (the original path if it is not staged)
+
+        Also starts copying the next read_ahead inputs. The copy stays pinned until release(source).
+        """
+        source = str(source)
+        with self._lock:
+            entry = self._entries.get(source)
+            if entry is None:
+                entry = self._schedule(source)
+            else:
+                entry.pinned = True
+                self._entries.move_to_end(source)
+            self._cursor = max(self._cursor, self._position.get(source, -1))
+            self._schedule_ahead()
+        if entry is None:
+            return Path(source)
+        entry.ready.wait()
+        return entry.local if entry.error is None else Path(source)
+
+    def release(self, source):
+        """The staged copy of source is no longer needed and may be evicted."""
+        with self._lock:
+            entry = self._entries.get(str(source))
+            if entry is not None:
+                entry.pinned = False
+            # 释放空间后继续预读
+            self._schedule_ahead()
+
+    def output_path(self, destination):
+        """Scratch path to write an output to before publish()."""
+        return self.folder / 'out' / Path(destination).name
+
+    def publish(self, scratch_file, destination):
+        """Move an output from scratch to its destination (nothing to do if it was not written)."""
+        scratch_file = Path(scratch_file)
+        if not scratch_file.exists():
+            return None
+        destination = Path(destination)
+        if destination.exists():
+            destination.unlink()
+        shutil.move(str(scratch_file), str(destination))
+        return destination
+
+    def close(self):
+        """Stop copying and delete the scratch subfolder."""
+        self._reader.shutdown(cancel_futures=True)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _schedule_ahead(self):
+        if self._cursor < 0:
+            return
+        for source in self.order[self._cursor + 1:self._cursor + 1 + self.read_ahead]:
+            if source not in self._entries:
+                self._schedule(source)
+
+    def _schedule(self, source):
+        """Reserve space and queue the copy of source; None if it does not fit."""
+        try:
+            size = os.stat(source).st_size
+        except OSError:
+            return None
+        if not self._make_room(size):
+            return None
+        local = self.folder / 'in' / f"{next(self._names)}_{os.path.basename(source)}"
+        entry = self._entries[source] = _Entry(local, size)
+        self._used += size
+        self._reader.submit(self._copy, source, entry)
+        return entry
+
+    def _make_room(self, size):
+        if size > self.size_limit:
+            return False
+        for source in list(self._entries):
+            if self._used + size <= self.size_limit:
+                break
+            entry = self._entries[source]
+            if not entry.pinned and entry.ready.is_set():
+                del self._entries[source]
+                self._used -= entry.size
+                try:
+                    entry.local.unlink()
+                except OSError:
+                    pass
+        return self._used + size <= self.size_limit
+
+    def _copy(self, source, entry):
+        try:
+            with tracing.span('stage', file=os.path.basename(source)) as stage_span, \
+                    open(source, 'rb') as fsrc, open(entry.local, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, BUFFER_SIZE)
+                stage_span.add('bytes_in', entry.size)
+            # 保留时间戳，按修改时间比较或回写时间戳的代码读到的与原文件一致
+            shutil.copystat(source, entry.local)
+        except OSError as e:
+            entry.error = e
+        finally:
+            entry.ready.set()
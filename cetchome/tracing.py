@@ -0,0 +1,415 @@
+"""
+Span-based timing shared by all tools.
+
+Tracing is off by default and span() then returns a no-op object, so
+instrumented code pays almost nothing. Once enabled (enable(), a tool's
+--trace option or the CETC_TRACE environment variable) every finished span
+is written as one JSON line:
+
+    {"span": "encode", "file": "IMG_0001.MOV", "wall": 41.2, "cpu": 0.02,
+     "children_cpu": 160.4, "subprocesses": 1, "bytes_in": 734003200, ...}
+
+Spans nest per thread; a child inherits its parent's "file".
+"children_cpu" is the CPU time of subprocesses that ended during the span.
+The operating system only reports it for the whole process, so it is null
+for spans that overlapped a span of another thread (e.g. steps of a job
+graph running in parallel), whose ffmpeg runs it cannot tell apart.
+
+Optional profiling (CETC_PROFILE / --profile) writes cProfile stats or folded
+sampled stacks next to the trace. Summarize a trace with:
+
+    python -m cetchome.tracing trace.jsonl
+"""
+import argparse
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_MODES = ('cprofile', 'sample')
+# 在当前 span 中记录首次发生时间 (相对 span 开始的秒数) 的审计事件：
+# 请求 span 据此可拆分为 DNS 解析、建立连接和等待首字节
+MARKED_EVENTS = {'socket.getaddrinfo': 'dns_at', 'socket.connect': 'connect_at'}
+SAMPLE_INTERVAL = 0.005
+
+_lock = threading.Lock()
+_local = threading.local()
+_writer = None
+_listeners = []
+_profiler = None
+_next_id = 0
+_audit_hook_installed = False
+# 有打开的 span 的线程数；每当 span 与其他线程的 span 重叠时 _overlaps 加一
+_active_threads = 0
+_overlaps = 0
+
+
+def _audit(event, args):
+    # 在创建子进程的线程中计数，按线程归属到当前 span
+    if event == 'subprocess.Popen':
+        _local.subprocesses = getattr(_local, 'subprocesses', 0) + 1
+    elif event in MARKED_EVENTS:
+        stack = getattr(_local, 'stack', None)
+        if stack:
+            stack[-1].mark(MARKED_EVENTS[event])
+
+
+class Span:
+    """One timed stage. Use span() instead of creating it directly."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.counters = {}
+        self.marks = {}
+
+    def add(self, key, amount=1):
+        """Accumulate a counter on this span (e.g. bytes_in, bytes_out, frames)."""
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, key, value):
+        """Attach an attribute (e.g. a codec decision) to this span."""
+        self.attrs[key] = value
+
+    def mark(self, key):
+        """Record when something first happened, in seconds since the span started."""
+        if key not in self.marks:
+            self.marks[key] = round(time.perf_counter() - self._wall, 6)
+
+    def __enter__(self):
+        global _next_id, _active_threads, _overlaps
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        parent = stack[-1] if stack else None
+        if parent is not None and 'file' not in self.attrs and 'file' in parent.attrs:
+            self.attrs['file'] = parent.attrs['file']
+        with _lock:
+            _next_id += 1
+            self.id = _next_id
+            if not stack:
+                if _active_threads:
+                    _overlaps += 1
+                _active_threads += 1
+            # 只有其他线程没有打开的 span 时，子进程 CPU 时间才能归属到本 span
+            self._exclusive = _overlaps if _active_threads == 1 else None
+        self.parent_id = parent.id if parent is not None else None
+        stack.append(self)
+
+        times = os.times()
+        self._children_cpu = times.children_user + times.children_system
+        self._subprocesses = getattr(_local, 'subprocesses', 0)
+        self._started = time.time()
+        self._cpu = time.thread_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_threads
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        times = os.times()
+        _local.stack.pop()
+        with _lock:
+            exclusive = self._exclusive is not None and self._exclusive == _overlaps
+            if not _local.stack:
+                _active_threads -= 1
+        children_cpu = times.children_user + times.children_system - self._children_cpu
+
+        record = {
+            'span': self.name,
+            'id': self.id,
+            'parent': self.parent_id,
+            'thread': threading.current_thread().name,
+            'start': round(self._started, 6),
+            'wall': round(wall, 6),
+            'cpu': round(cpu, 6),
+            # 子进程 CPU 时间 (ffmpeg/exiftool 等)，仅在子进程结束后计入；与其他线程并行时为 None
+            'children_cpu': round(children_cpu, 6) if exclusive else None,
+            'subprocesses': getattr(_local, 'subprocesses', 0) - self._subprocesses,
+        }
+        record.update(self.attrs)
+        record.update(self.counters)
+        if self.marks:
+            record['marks'] = self.marks
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        _write(record)
+        return False
+
+
+class _NullSpan:
+    """Returned by span() while tracing is disabled."""
+
+    def add(self, key, amount=1):
+        pass
+
+    def set(self, key, value):
+        pass
+
+    def mark(self, key):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _write(record):
+    for listener in _listeners:
+        listener(record)
+    if _writer is None:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _lock:
+        if _writer is not None:
+            _writer.write(line + '\n')
+
+
+def enabled():
+    """True while spans are recorded (trace file open or a listener registered)."""
+    return _writer is not None or bool(_listeners)
+
+
+def _install_audit_hook():
+    global _audit_hook_installed
+    if not _audit_hook_installed:
+        # 审计钩子无法移除，只安装一次
+        sys.addaudithook(_audit)
+        atexit.register(disable)
+        _audit_hook_installed = True
+
+
+def add_listener(callback):
+    """
+    Call callback(record) for every finished span, with or without a trace file
+    (used by cetchome.metrics). Registering a listener activates span recording.
+    """
+    _install_audit_hook()
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def span(name, **attrs):
+    """
+    Time a stage: ``with tracing.span('encode', file=name) as s: ...; s.add('bytes_out', n)``.
+
+    Returns a no-op span while tracing is disabled.
+    """
+    if _writer is None and not _listeners:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+
+def current():
+    """The innermost open span of this thread (a no-op span when there is none)."""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack and enabled() else _NULL_SPAN
+
+
+def traced(name=None):
+    """Decorator form of span(); the span is named after the function by default."""
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _writer is None and not _listeners:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads every interval seconds and counts
+    them in folded format (one "frame;frame;frame count" line per stack),
+    which flamegraph tools read directly.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, output_path):
+        self._stop.set()
+        self._thread.join()
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def enable(trace_path, profile=None):
+    """
+    Start writing spans to trace_path (JSON lines, appended).
+
+    Args:
+        trace_path (str): Trace file
+        profile (str): None, 'cprofile' (writes <trace>.prof, profiles the calling thread)
+                       or 'sample' (writes <trace>.folded, samples all threads)
+    """
+    global _writer, _profiler
+    if profile is not None and profile not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{profile}', expected one of {PROFILE_MODES}")
+    disable()
+    _install_audit_hook()
+
+    _writer = open(trace_path, 'a', encoding='utf-8', buffering=1)
+    if profile == 'cprofile':
+        _profiler = (cProfile.Profile(), trace_path + '.prof')
+        _profiler[0].enable()
+    elif profile == 'sample':
+        _profiler = (SamplingProfiler(), trace_path + '.folded')
+        _profiler[0].start()
+
+
+def disable():
+    """Stop tracing, close the trace file and write profiler output."""
+    global _writer, _profiler
+    if _profiler is not None:
+        profiler, output_path = _profiler
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            profiler.dump_stats(output_path)
+        else:
+            profiler.stop(output_path)
+        _profiler = None
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+def enable_from_env():
+    """Enable tracing when CETC_TRACE is set (profiling with CETC_PROFILE). Returns True if enabled."""
+    trace_path = os.environ.get('CETC_TRACE')
+    if not trace_path:
+        return False
+    enable(trace_path, os.environ.get('CETC_PROFILE') or None)
+    return True
+
+
+def add_arguments(parser):
+    """Add the shared --trace/--profile options to a tool's argument parser."""
+    parser.add_argument('--trace', default=os.environ.get('CETC_TRACE'), metavar='FILE',
+                        help='Write per-stage timings as JSON lines to FILE (default: $CETC_TRACE)')
+    parser.add_argument('--profile', default=os.environ.get('CETC_PROFILE') or None, choices=PROFILE_MODES,
+                        help='Also profile the run: cprofile (<trace>.prof) or sample (<trace>.folded)')
+
+
+def enable_from_args(args):
+    """Enable tracing from add_arguments() options. Returns True if enabled."""
+    if not args.trace:
+        if args.profile:
+            print("Warning: --profile needs --trace, profiling disabled")
+        return False
+    enable(args.trace, args.profile)
+    return True
+
+
+def load_trace(trace_path):
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """
+    Aggregate spans by name.
+
+    Returns:
+        dict: span name -> count, wall/cpu/children_cpu totals, max wall,
+              subprocess count and the sum of every numeric counter;
+              children_cpu only adds up the spans that have it (see module docstring)
+    """
+    base_keys = {'span', 'id', 'parent', 'thread', 'start', 'wall', 'cpu', 'children_cpu', 'subprocesses', 'marks'}
+    summary = {}
+    for record in records:
+        entry = summary.setdefault(record['span'], {
+            'count': 0, 'errors': 0, 'wall': 0.0, 'wall_max': 0.0, 'cpu': 0.0, 'children_cpu': 0.0,
+            'subprocesses': 0, 'counters': {}, 'marks': {},
+        })
+        entry['count'] += 1
+        entry['errors'] += 1 if 'error' in record else 0
+        entry['wall'] += record['wall']
+        entry['wall_max'] = max(entry['wall_max'], record['wall'])
+        entry['cpu'] += record['cpu']
+        entry['children_cpu'] += record.get('children_cpu') or 0.0
+        entry['subprocesses'] += record.get('subprocesses', 0)
+        for key, offset in record.get('marks', {}).items():
+            entry['marks'].setdefault(key, []).append(offset)
+        for key, value in record.items():
+            if key not in base_keys and isinstance(value, (int, float)) and not isinstance(value, bool):
+                entry['counters'][key] = entry['counters'].get(key, 0) + value
+    for entry in summary.values():
+        # 标记只报告平均时间点
+        entry['marks'] = {key: sum(offsets) / len(offsets) for key, offsets in entry['marks'].items()}
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'span':<24}{'count':>7}{'wall(s)':>11}{'mean(s)':>10}{'max(s)':>10}"
+          f"{'cpu(s)':>10}{'child cpu':>11}{'procs':>7}  counters")
+    for name, entry in sorted(summary.items(), key=lambda item: item[1]['wall'], reverse=True):
+        counters = ', '.join([f"{key}={value:,.0f}" for key, value in sorted(entry['counters'].items())] +
+                             [f"{key}~{value:.3f}s" for key, value in sorted(entry['marks'].items())])
+        print(f"{name:<24}{entry['count']:>7}{entry['wall']:>11.3f}{entry['wall'] / entry['count']:>10.3f}"
+              f"{entry['wall_max']:>10.3f}{entry['cpu']:>10.3f}{entry['children_cpu']:>11.3f}"
+              f"{entry['subprocesses']:>7}  {counters}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a JSON-lines trace written by the tools')
+    parser.add_argument('trace', help='Trace file (JSON lines)')
+    parser.add_argument('--json', '-j', default=None, metavar='FILE',
+                        help='Also write the per-span summary as JSON')
+    parser.add_argument('--file', default=None, help='Only include spans of this input file')
+    args = parser.parse_args()
+
+    records = load_trace(args.trace)
+    if args.file:
+        records = [record for record in records if record.get('file') == args.file]
+    summary = summarize(records)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from benchmark_downloads import git_revision, load_downloader, peak_rss_mb
+from image_similarity import (DEFAULT_THRESHOLD, build_hash_columns, compute_hashes,
+                              find_similar_pairs, group_duplicates)
+from local_cdn import synthetic_photo
+
+# 视为重复 (应被去重) 的变体，以及真正不同的图片
+VARIANT_KINDS = ('resized', 'recompressed', 'cropped', 'color-shifted')
+DEFAULT_SCALES = (1000, 10000)
+DEFAULT_SWEEP = (0.04, 0.06, 0.08, 0.10, 0.12, 0.15)
+SEED_WIDTH = 512
+
+
+def make_variant(img, kind, rng):
+    """
+    A near-duplicate of img that the dedup pipeline should catch.
+
+    Returns:
+        tuple: (PIL image, JPEG quality)
+    """
+    width, height = img.size
+    if kind == 'resized':
+        scale = rng.uniform(0.5, 0.8)
+        return img.resize((int(width * scale), int(height * scale))), 85
+    if kind == 'recompressed':
+        return img, rng.randint(35, 65)
+    if kind == 'cropped':
+        dx, dy = int(width * rng.uniform(0.01, 0.04)), int(height * rng.uniform(0.01, 0.04))
+        return img.crop((dx, dy, width - dx, height - dy)), 85
+    if kind == 'color-shifted':
+        img = ImageEnhance.Brightness(img).enhance(rng.uniform(0.9, 1.1))
+        return ImageEnhance.Color(img).enhance(rng.uniform(0.85, 1.15)), 85
+    raise ValueError(f"Unknown variant kind: {kind}")
+
+
+def load_seed_images(seed_dir):
+    """Paths of real photos to use as seeds before falling back to synthetic ones."""
+    if not seed_dir:
+        return []
+    return sorted(
+        os.path.join(root, file)
+        for root, _, files in os.walk(seed_dir)
+        for file in files if file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))
+    )
+
+
+def generate_corpus(count, seed_paths=(), distinct_fraction=0.5, max_variants=4, seed=0):
+    """
+    Yield a corpus with known ground truth, one image at a time (nothing is kept in memory).
+
+    Each seed image is emitted as-is; a (1 - distinct_fraction) share of the
+    seeds also gets 1..max_variants near-duplicate variants.
+
+    Yields:
+        tuple: (group id, variant kind or 'original', seed name, width, JPEG bytes)
+    """
+    rng = random.Random(seed)
+    emitted = 0
+    group = 0
+    while emitted < count:
+        if group < len(seed_paths):
+            with Image.open(seed_paths[group]) as source:
+                base = source.convert('RGB')
+            if base.width > SEED_WIDTH:
+                base = base.resize((SEED_WIDTH, int(base.height * SEED_WIDTH / base.width)))
+        else:
+            base = synthetic_photo(seed * 1000003 + group, SEED_WIDTH)
+        name = f"photo{group:06d}"
+
+        members = [('original', base, 90)]
+        if rng.random() >= distinct_fraction:
+            for _ in range(rng.randint(1, max_variants)):
+                kind = rng.choice(VARIANT_KINDS)
+                img, quality = make_variant(base, kind, rng)
+                members.append((kind, img, quality))
+
+        for kind, img, quality in members[:count - emitted]:
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=quality)
+            yield group, kind, name, img.width, buffer.getvalue()
+            emitted += 1
+        group += 1
+
+
+def pair_metrics(true_labels, predicted_groups):
+    """
+    Pairwise precision/recall of predicted duplicate groups against ground-truth labels.
+
+    A pair of images counts as positive when both are in the same group.
+    """
+    n = len(true_labels)
+    predicted = np.arange(n, dtype=np.int64) + n
+    for number, group in enumerate(predicted_groups):
+        predicted[group] = number
+
+    def pairs(labels):
+        _, counts = np.unique(labels, return_counts=True, axis=0)
+        counts = counts.astype(np.int64)
+        return int((counts * (counts - 1) // 2).sum())
+
+    true_labels = np.asarray(true_labels, dtype=np.int64)
+    true_pairs = pairs(true_labels)
+    predicted_pairs = pairs(predicted)
+    correct_pairs = pairs(np.stack([true_labels, predicted], axis=1))
+
+    precision = correct_pairs / predicted_pairs if predicted_pairs else 1.0
+    recall = correct_pairs / true_pairs if true_pairs else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1,
+            'true_pairs': true_pairs, 'predicted_pairs': predicted_pairs}
+
+
+def recall_by_kind(true_labels, kinds, predicted_groups):
+    """Share of each variant kind that ended up grouped with its original."""
+    grouped_with = {}
+    for group in predicted_groups:
+        for index in group:
+            grouped_with[index] = group[0]
+    originals = {}
+    for index, (label, kind) in enumerate(zip(true_labels, kinds)):
+        if kind == 'original':
+            originals[label] = index
+
+    found, total = {}, {}
+    for index, (label, kind) in enumerate(zip(true_labels, kinds)):
+        if kind == 'original':
+            continue
+        total[kind] = total.get(kind, 0) + 1
+        original = originals[label]
+        if index in grouped_with and grouped_with.get(original) == grouped_with[index]:
+            found[kind] = found.get(kind, 0) + 1
+    return {kind: found.get(kind, 0) / total[kind] for kind in sorted(total)}
+
+
+def _run_scale(count, seed_dir, thresholds, threshold, pipeline, seed, results):
+    """Child process: hash and match one corpus size, report accuracy and throughput."""
+    seed_paths = load_seed_images(seed_dir)
+    labels, kinds, hash_rows = [], [], []
+    hashing_seconds = 0.0
+    work_dir = tempfile.mkdtemp(prefix='dedup-bench-') if pipeline else None
+    try:
+        label_of = {}
+
+        for group, kind, name, width, data in generate_corpus(count, seed_paths, seed=seed):
+            # 只计时解码 + 计算哈希 (与 deduplicate_downloads 每张图片的工作相同)
+            started = time.perf_counter()
+            with Image.open(io.BytesIO(data)) as img:
+                hash_rows.append(compute_hashes(img))
+            hashing_seconds += time.perf_counter() - started
+            labels.append(group)
+            kinds.append(kind)
+
+            if pipeline:
+                # 同一照片的缩放版本使用 CDN 的命名方式，其它变体是不同的文件名
+                folder = os.path.join(work_dir, "downloads", "bench")
+                os.makedirs(folder, exist_ok=True)
+                filename = (f"{name}-cc_ft_{width}.jpg" if kind in ('original', 'resized')
+                            else f"{name}-{kind}-{len(labels)}.jpg")
+                with open(os.path.join(folder, filename), 'wb') as f:
+                    f.write(data)
+                label_of[filename] = group
+
+        # 计时的匹配阶段与 deduplicate_downloads 相同：列构建、分块配对、分组
+        started = time.perf_counter()
+        columns = build_hash_columns(hash_rows)
+        pair_i, pair_j, _ = find_similar_pairs(columns, threshold=threshold)
+        groups = group_duplicates(count, pair_i, pair_j)
+        matching_seconds = time.perf_counter() - started
+
+        # 阈值扫描：按最大阈值搜索一次，再按距离筛选
+        pair_i, pair_j, distance = find_similar_pairs(columns, threshold=max(thresholds + [threshold]))
+        sweep = {}
+        for value in sorted(set(thresholds + [threshold])):
+            keep = distance <= value
+            sweep[f"{value:.3f}"] = pair_metrics(labels, group_duplicates(count, pair_i[keep], pair_j[keep]))
+
+        result = {
+            'images': count,
+            'groups': len(set(labels)),
+            'hashing_seconds': hashing_seconds,
+            'hashing_images_per_second': count / hashing_seconds,
+            'matching_seconds': matching_seconds,
+            'matching_images_per_second': count / matching_seconds if matching_seconds else None,
+            'accuracy': sweep[f"{threshold:.3f}"],
+            'recall_by_kind': recall_by_kind(labels, kinds, groups),
+            'threshold_sweep': sweep,
+        }
+        if pipeline:
+            result['pipeline'] = run_pipeline(work_dir, label_of, threshold)
+        result['peak_rss_mb'] = peak_rss_mb()
+        results.put(result)
+    finally:
+        if work_dir:
+            # run_pipeline() 切换到了 work_dir，Windows 上不能删除当前目录
+            os.chdir(os.path.dirname(work_dir))
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_pipeline(work_dir, label_of, threshold):
+    """
+    Run remove_filename_duplicates() and deduplicate_downloads() on the corpus
+    written to work_dir/downloads and score the removals.
+
+    A removal is correct when the image belongs to a true duplicate group
+    and at least one member of that group survives.
+    """
+    os.chdir(work_dir)
+    downloader = load_downloader()
+    before = set(label_of)
+
+    stages = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        media_index = downloader.scan_media("downloads")
+        started = time.perf_counter()
+        downloader.remove_filename_duplicates(media_index)
+        stages['filename_seconds'] = time.perf_counter() - started
+        after_filename = {f.name for f in media_index.files()}
+
+        started = time.perf_counter()
+        downloader.deduplicate_downloads(threshold, media_index=media_index)
+        stages['perceptual_seconds'] = time.perf_counter() - started
+        survivors = {f.name for f in media_index.files()}
+
+    stages['filename'] = _removal_metrics(label_of, before, after_filename)
+    stages['combined'] = _removal_metrics(label_of, before, survivors)
+    return stages
+
+
+def _removal_metrics(label_of, before, after):
+    removed = before - after
+    group_sizes, surviving = {}, {}
+    for name in before:
+        group_sizes[label_of[name]] = group_sizes.get(label_of[name], 0) + 1
+    for name in after:
+        surviving[label_of[name]] = surviving.get(label_of[name], 0) + 1
+
+    correct = sum(1 for name in removed if group_sizes[label_of[name]] > 1 and surviving.get(label_of[name]))
+    removable = len(before) - len(group_sizes)
+    return {
+        'removed': len(removed),
+        'precision': correct / len(removed) if removed else 1.0,
+        'recall': correct / removable if removable else 1.0,
+        'groups_lost': sum(1 for label in group_sizes if not surviving.get(label)),
+    }
+
+
+def run_benchmark(scales=DEFAULT_SCALES, seed_dir=None, thresholds=DEFAULT_SWEEP, threshold=DEFAULT_THRESHOLD,
+                  pipeline=False, seed=0):
+    """
+    Benchmark the dedup stages at every corpus size, each in its own process.
+
+    Returns:
+        dict: JSON-serializable benchmark report
+    """
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'config': {'seed_dir': seed_dir, 'threshold': threshold, 'pipeline': pipeline, 'seed': seed},
+        'scales': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    for count in scales:
+        print(f"运行规模 {count} 张图片...")
+        results = context.Queue()
+        process = context.Process(target=_run_scale,
+                                  args=(count, seed_dir, list(thresholds), threshold, pipeline, seed, results))
+        process.start()
+        report['scales'][str(count)] = results.get()
+        process.join()
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"{'图片数':>8}{'精确率':>8}{'召回率':>8}{'哈希(张/s)':>12}{'匹配(张/s)':>12}{'峰值RSS(MB)':>13}")
+    for count, result in report['scales'].items():
+        rss = result.get('peak_rss_mb')
+        print(f"{count:>8}{result['accuracy']['precision']:>8.3f}{result['accuracy']['recall']:>8.3f}"
+              f"{result['hashing_images_per_second']:>12.0f}{result['matching_images_per_second'] or 0:>12.0f}"
+              f"{rss if rss is not None else float('nan'):>13.1f}")
+        print(f"{'':>8}按变体召回率: " + ", ".join(f"{kind} {value:.2f}"
+                                           for kind, value in result['recall_by_kind'].items()))
+        if 'pipeline' in result:
+            for stage in ('filename', 'combined'):
+                metrics = result['pipeline'][stage]
+                print(f"{'':>8}{stage}: 移除 {metrics['removed']}, 精确率 {metrics['precision']:.3f}, "
+                      f"召回率 {metrics['recall']:.3f}, 丢失组 {metrics['groups_lost']}")
+
+        if baseline and count in baseline.get('scales', {}):
+            old = baseline['scales'][count]
+            for key, label in (('hashing_images_per_second', '哈希'), ('matching_images_per_second', '匹配')):
+                if old.get(key) and result.get(key):
+                    print(f"{'':>8}{label}吞吐对比 {baseline.get('revision') or baseline.get('created')}: "
+                          f"{(result[key] - old[key]) / old[key] * 100:+.1f}%")
+
+    largest = report['scales'][max(report['scales'], key=int)]
+    print("\n阈值扫描 (最大规模):")
+    for value, metrics in largest['threshold_sweep'].items():
+        print(f"  {value}: 精确率 {metrics['precision']:.3f}, 召回率 {metrics['recall']:.3f}, F1 {metrics['f1']:.3f}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark perceptual/filename dedup accuracy and throughput '
+                                                 'on a synthetic corpus with known duplicates')
+    parser.add_argument('--scales', nargs='+', type=int, default=list(DEFAULT_SCALES),
+                        help='Corpus sizes to run, e.g. 1000 10000 100000 (default: 1000 10000)')
+    parser.add_argument('--seed-dir', default=None,
+                        help='Folder of real photos used as seed images before synthetic ones')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Similarity threshold to score (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--sweep', nargs='+', type=float, default=list(DEFAULT_SWEEP),
+                        help='Thresholds to report precision/recall for')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Also write the corpus to disk and run remove_filename_duplicates() '
+                             'and deduplicate_downloads() end to end')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus random seed (default: 0)')
+    parser.add_argument('--output', '-o', default=None,
+                        help='JSON result file (default: benchmark-dedup-<timestamp>.json)')
+    parser.add_argument('--compare', default=None, metavar='JSON', help='Earlier result file to compare against')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    report = run_benchmark(args.scales, args.seed_dir, args.sweep, args.threshold, args.pipeline, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or f"benchmark-dedup-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
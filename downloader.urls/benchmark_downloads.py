@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from local_cdn import LocalCDN, build_catalog, write_dom
+
+try:
+    import resource
+except ImportError:
+    # Windows: 只报告 Python 堆峰值
+    resource = None
+
+DOWNLOADER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloader-urls.py")
+
+# 每种模式对应 downloader-urls.py 的一种运行方式
+MODES = {
+    'width-only': {'probe': False, 'inline_dedup': False},
+    'probe': {'probe': True, 'inline_dedup': False},
+    'inline-dedup': {'probe': True, 'inline_dedup': True},
+}
+
+
+def load_downloader():
+    """Import downloader-urls.py (its file name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location("downloader_urls", DOWNLOADER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where unsupported, e.g. Windows)."""
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if os.uname().sysname == 'Darwin' else 1024)
+
+
+def _run_mode(work_dir, mode, min_width, threshold, results):
+    """Child process: run one downloader mode in work_dir and report client-side measurements."""
+    os.chdir(work_dir)
+    downloader = load_downloader()
+    options = MODES[mode]
+
+    output = io.StringIO()
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        media_index = downloader.scan_media("downloads")
+        urls = downloader.select_urls_from_dom("DOM.txt", min_width, probe=options['probe'])
+        selected = time.perf_counter()
+
+        live_index = None
+        if options['inline_dedup'] and downloader.DEDUPLICATION_AVAILABLE:
+            from live_dedup import LiveDedupIndex
+            live_index = LiveDedupIndex(threshold)
+        downloader.download_urls(urls, media_index, live_index)
+        downloaded = time.perf_counter()
+
+        if live_index is None and downloader.DEDUPLICATION_AVAILABLE:
+            downloader.deduplicate_downloads(threshold, media_index=media_index)
+    finished = time.perf_counter()
+    _, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    log = output.getvalue()
+    files = media_index.files()
+    result = {
+        'urls': len(urls),
+        'select_seconds': selected - started,
+        'download_seconds': downloaded - selected,
+        'dedup_seconds': finished - downloaded,
+        'total_seconds': finished - started,
+        'failed': log.count('[FAILED]'),
+        'skipped_duplicates': log.count('[SKIPPED]'),
+        'files_kept': len(files),
+        'bytes_kept': sum(f.size for f in files),
+        'peak_heap_mb': peak_heap / (1024 * 1024),
+    }
+    result['peak_rss_mb'] = peak_rss_mb()
+    results.put(result)
+
+
+def summarize_requests(log):
+    """Server-side view of one run: request counts, bytes, retries and GET latency percentiles."""
+    gets = [entry for entry in log if entry['method'] == 'GET']
+    full_gets = [entry for entry in gets if entry['status'] == 200]
+    requests_per_path = {}
+    for entry in gets:
+        requests_per_path[entry['path']] = requests_per_path.get(entry['path'], 0) + 1
+
+    statuses = {}
+    for entry in log:
+        statuses[str(entry['status'])] = statuses.get(str(entry['status']), 0) + 1
+
+    latencies = [entry['seconds'] for entry in full_gets]
+    return {
+        'requests': len(log),
+        'head_requests': len(log) - len(gets),
+        'get_requests': len(gets),
+        'retries': sum(count - 1 for count in requests_per_path.values()),
+        'statuses': statuses,
+        'bytes_sent': sum(entry['bytes'] for entry in log),
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p95': percentile(latencies, 0.95),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': max(latencies) if latencies else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(DOWNLOADER_PATH), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(modes, photos=50, duplicates=0.1, min_width=1152, threshold=0.08, repeat=1, **cdn_options):
+    """
+    Run each downloader mode against a fresh LocalCDN and collect measurements.
+
+    Every run happens in its own temporary working directory and child process,
+    so peak memory is measured per mode.
+
+    Returns:
+        dict: JSON-serializable benchmark report
+    """
+    catalog = build_catalog(photos, duplicates=duplicates)
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'config': dict(cdn_options, photos=photos, duplicates=duplicates, min_width=min_width,
+                       threshold=threshold, repeat=repeat, catalog_bytes=sum(map(len, catalog.values()))),
+        'modes': {},
+    }
+
+    context = multiprocessing.get_context('spawn')
+    with LocalCDN(catalog, **cdn_options) as cdn:
+        for mode in modes:
+            runs = []
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory(prefix='cdn-bench-') as work_dir:
+                    write_dom(catalog, cdn.base_url, os.path.join(work_dir, "DOM.txt"))
+                    cdn.reset()
+
+                    results = context.Queue()
+                    process = context.Process(target=_run_mode,
+                                              args=(work_dir, mode, min_width, threshold, results))
+                    process.start()
+                    result = results.get()
+                    process.join()
+
+                    result.update(summarize_requests(cdn.log))
+                    result['throughput_mbps'] = (result['bytes_sent'] / (1024 * 1024)) / result['total_seconds']
+                    runs.append(result)
+            # 多次运行取总时间的中位数那一次
+            runs.sort(key=lambda run: run['total_seconds'])
+            report['modes'][mode] = dict(runs[len(runs) // 2], runs=len(runs))
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"{'模式':<14}{'总时间(s)':>10}{'MB/s':>8}{'p95(s)':>9}{'p99(s)':>9}"
+          f"{'重试':>6}{'失败':>6}{'保留':>6}{'峰值RSS(MB)':>13}")
+    for mode, result in report['modes'].items():
+        rss = result.get('peak_rss_mb')
+        print(f"{mode:<14}{result['total_seconds']:>10.2f}{result['throughput_mbps']:>8.2f}"
+              f"{result['latency_p95'] or 0:>9.3f}{result['latency_p99'] or 0:>9.3f}"
+              f"{result['retries']:>6}{result['failed']:>6}{result['files_kept']:>6}"
+              f"{rss if rss is not None else float('nan'):>13.1f}")
+
+        if baseline and mode in baseline.get('modes', {}):
+            old = baseline['modes'][mode]
+            change = (result['total_seconds'] - old['total_seconds']) / old['total_seconds'] * 100
+            print(f"{'':<14}对比 {baseline.get('revision') or baseline.get('created')}: 总时间 {change:+.1f}%")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark downloader-urls.py against a local stand-in CDN')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES),
+                        help='Downloader modes to run (default: all)')
+    parser.add_argument('--photos', type=int, default=50, help='Number of synthetic photos (default: 50)')
+    parser.add_argument('--duplicates', type=float, default=0.1,
+                        help='Fraction of photos that repeat another photo under a new name (default: 0.1)')
+    parser.add_argument('--min-width', type=int, default=1152, help='Minimum rendition width (default: 1152)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per mode, the median is reported (default: 1)')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds of latency per response (default: 0.02)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('--bandwidth', type=int, default=None, help='Bytes per second per connection')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of GETs answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of GETs answered with 503')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of GETs dropped mid-body')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the injected fault sequence (default: 0)')
+    parser.add_argument('--output', '-o', default=None,
+                        help='JSON result file (default: benchmark-downloads-<timestamp>.json)')
+    parser.add_argument('--compare', default=None, metavar='JSON', help='Earlier result file to compare against')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    report = run_benchmark(
+        args.modes, photos=args.photos, duplicates=args.duplicates, min_width=args.min_width, repeat=args.repeat,
+        latency=args.latency, jitter=args.jitter, bandwidth=args.bandwidth,
+        throttle_rate=args.throttle_rate, error_rate=args.error_rate, drop_rate=args.drop_rate, seed=args.seed,
+    )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or f"benchmark-downloads-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
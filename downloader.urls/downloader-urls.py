@@ -1,38 +1,30 @@
-import requests
 import os
+import hashlib
 import re
 import shutil
 import argparse
+import importlib.util
 from urllib.parse import urlparse
 from collections import defaultdict
 from pathlib import Path
+from media_scanner import IMAGE_EXTENSIONS, scan_media
+from rendition_selector import parse_renditions, select_renditions
 
-try:
-    import imagehash
-    from PIL import Image
-    DEDUPLICATION_AVAILABLE = True
-except ImportError:
-    DEDUPLICATION_AVAILABLE = False
-    print("Warning: imagehash and PIL not available. Install with: pip install imagehash Pillow")
-
-def load_urls_from_dom(file_path):
-    """从DOM.txt文件中提取大尺寸JPG图片URL"""
-    urls = []
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import fingerprint, metrics, tracing
+
+# 去重依赖 (imagehash/PIL/numpy/scipy) 导入很慢，这里只检查是否已安装，真正去重时才导入
+DEDUPLICATION_AVAILABLE = all(importlib.util.find_spec(name) is not None
+                              for name in ('imagehash', 'PIL', 'numpy', 'scipy'))
+DEFAULT_THRESHOLD = 0.08  # 与 image_similarity.DEFAULT_THRESHOLD 相同
+if not DEDUPLICATION_AVAILABLE:
+    print("Warning: imagehash, PIL, numpy or scipy not available. Install with: pip install -r requirements.txt")
+
+def select_urls_from_dom(file_path, min_width=1152, prefer_webp=False, probe=True, allow_smaller=False):
+    """从DOM.txt中为每张照片选出满足最小宽度、体积最小的版本URL (没有合格版本的照片跳过，除非 allow_smaller)"""
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
             content = file.read()
-            # 使用正则表达式提取src属性中的JPG URL
-            url_pattern = r'src="(https://[^"]+\.jpe?g)"'
-            matches = re.findall(url_pattern, content, re.IGNORECASE)
-            urls.extend(matches)
-
-            # 也匹配srcset中的JPG URL
-            srcset_pattern = r'srcset="([^"]*)"'
-            srcset_matches = re.findall(srcset_pattern, content)
-            for srcset in srcset_matches:
-                # 从srcset中提取JPG URL
-                srcset_urls = re.findall(r'(https://[^\s,]+\.jpe?g)', srcset, re.IGNORECASE)
-                urls.extend(srcset_urls)
     except FileNotFoundError:
         print(f"错误: 找不到文件 {file_path}")
         return []
@@ -40,16 +32,9 @@ def load_urls_from_dom(file_path):
         print(f"读取文件时出错: {e}")
         return []
 
-    # 去重
-    unique_urls = list(set(urls))
-
-    # 只保留大尺寸图片 (1152, 1344, 1536)
-    large_urls = []
-    for url in unique_urls:
-        if any(size in url for size in ['1152', '1344', '1536']):
-            large_urls.append(url)
-
-    return large_urls
+    groups = parse_renditions(content)
+    print(f"从DOM.txt中找到 {len(groups)} 张照片，正在选择最小的合格版本 (最小宽度 {min_width}px)...")
+    return select_renditions(groups, min_width, prefer_webp=prefer_webp, probe=probe, allow_smaller=allow_smaller)
 
 def get_domain_folder(url):
     """从URL中提取域名作为文件夹名"""
@@ -73,30 +58,52 @@ def parse_arguments():
                        help='Skip cleaning existing photos')
     parser.add_argument('--only-remove-duplicates', action='store_true',
                        help='Only remove filename duplicates, skip download')
+    parser.add_argument('--only-dedup', action='store_true',
+                       help='Only deduplicate existing downloads (filename and/or perceptual), skip cleanup and download')
+    parser.add_argument('--min-width', type=int, default=1152,
+                       help='Minimum rendition width to download; the smallest file meeting it is chosen (default: 1152)')
+    parser.add_argument('--allow-smaller', action='store_true',
+                       help='Download the widest rendition of photos that have none of --min-width (default: skip them)')
+    parser.add_argument('--prefer-webp', action='store_true',
+                       help='Also consider WebP renditions (usually smaller than JPEG)')
+    parser.add_argument('--no-probe', action='store_true',
+                       help='Do not probe rendition sizes with HEAD/Range requests, pick the smallest qualifying width')
+    parser.add_argument('--scan-workers', type=int, default=4,
+                       help='Parallel directory listings when scanning downloads (default: 4)')
+    parser.add_argument('--reference-index', default=None, metavar='INDEX',
+                       help='Also drop downloads that duplicate a photo in this archive reference index')
+    parser.add_argument('--update-reference-index', default=None, metavar='ARCHIVE_DIR',
+                       help='Build or update the reference index (--reference-index, default: reference.idx) '
+                            'from an archive folder, then exit')
+    parser.add_argument('--no-inline-dedup', action='store_true',
+                       help='Do not check for duplicates while downloading (write everything, dedupe afterwards)')
+    parser.add_argument('--similarity-threshold', type=float, default=DEFAULT_THRESHOLD,
+                       help=f'Max weighted phash/dhash/whash distance (0-1) treated as duplicate (default: {DEFAULT_THRESHOLD})')
+    tracing.add_arguments(parser)
+    metrics.add_arguments(parser)
     return parser.parse_args()
 
 # 清理现有照片功能
-def cleanup_existing_photos(downloads_dir="downloads"):
-    """清理现有的照片和备份文件夹"""
+def cleanup_existing_photos(downloads_dir="downloads", media_index=None, backup_dir=None):
+    """清理现有的照片 (删除整个下载文件夹)，并删除 backup_dir 中旧版本留下的备份文件夹"""
     print(f"{'='*50}")
     print("清理现有照片...")
     print(f"{'='*50}")
 
     # 统计现有文件
-    existing_count = 0
     backup_folders = []
 
     # 查找现有照片
-    if os.path.exists(downloads_dir):
-        for root, dirs, files in os.walk(downloads_dir):
-            for file in files:
-                if file.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                    existing_count += 1
+    if media_index is None:
+        media_index = scan_media(downloads_dir)
+    existing_count = len(media_index.files(IMAGE_EXTENSIONS))
 
-    # 查找备份文件夹
-    for item in os.listdir('.'):
-        if os.path.isdir(item) and ('backup' in item.lower() or 'duplicat' in item.lower()):
-            backup_folders.append(item)
+    # 查找备份文件夹 (只在明确指定的文件夹中，命令行为工具的工作目录)
+    if backup_dir is not None:
+        for item in os.listdir(backup_dir):
+            folder = os.path.join(backup_dir, item)
+            if os.path.isdir(folder) and ('backup' in item.lower() or 'duplicat' in item.lower()):
+                backup_folders.append(folder)
 
     if existing_count == 0 and len(backup_folders) == 0:
         print("没有找到现有照片或备份文件夹")
@@ -118,43 +125,117 @@ def cleanup_existing_photos(downloads_dir="downloads"):
         for folder in backup_folders:
             try:
                 shutil.rmtree(folder)
-                print(f"  已删除备份文件夹: {folder}")
+                print(f"  已删除备份文件夹: {os.path.basename(folder)}")
             except Exception as e:
                 print(f"  删除失败 {folder}: {e}")
 
     # 重新创建下载目录
     os.makedirs(downloads_dir, exist_ok=True)
+    media_index.scan()
     print("清理完成，准备重新下载")
 
 def main():
     """Main function with command line argument handling."""
     args = parse_arguments()
+    tracing.enable_from_args(args)
+    metrics.enable_from_args(args, 'download')
+
+    # Only build/update the archive reference index
+    if args.update_reference_index:
+        build_reference_index(args.update_reference_index, args.reference_index or "reference.idx")
+        return
+
+    # 只扫描一次下载目录，之后各阶段共用该索引
+    media_index = scan_media("downloads", args.scan_workers)
 
     # If only removing duplicates, skip everything else
     if args.only_remove_duplicates:
-        remove_filename_duplicates()
+        remove_filename_duplicates(media_index)
+        return
+
+    if args.only_dedup:
+        process_downloads(args, media_index)
         return
 
+    # 从DOM.txt加载URLs (每张照片只选一个版本)，下载到 downloads 并去重
+    download("DOM.txt", "downloads", min_width=args.min_width, prefer_webp=args.prefer_webp,
+             probe=not args.no_probe, allow_smaller=args.allow_smaller, cleanup=not args.skip_cleanup,
+             inline_dedup=not args.no_inline_dedup, perceptual_dedup=not args.skip_perceptual_dedup,
+             remove_duplicates=args.remove_filename_duplicates, threshold=args.similarity_threshold,
+             reference_index=args.reference_index, media_index=media_index, backup_dir='.')
+
+def download(source, downloads_dir="downloads", min_width=1152, prefer_webp=False, probe=True,
+             allow_smaller=False, cleanup=False, inline_dedup=True, perceptual_dedup=True,
+             remove_duplicates=False, threshold=DEFAULT_THRESHOLD, reference_index=None, media_index=None,
+             backup_dir=None):
+    """Download one batch of photos into downloads_dir and deduplicate them.
+
+    Args:
+        source (str | list): DOM file to select renditions from (as DOM.txt), or the URLs to download
+        downloads_dir (str): Output folder; each domain gets a subfolder
+        cleanup (bool): Delete downloads_dir (and the backup folders in backup_dir) first
+        inline_dedup (bool): Compare each photo in memory while downloading
+        perceptual_dedup (bool): Perceptual deduplication of downloads_dir afterwards
+        remove_duplicates (bool): Also remove filename-based duplicates (keeping the highest resolution)
+        reference_index (str): Archive reference index; downloads it already holds are dropped
+        media_index: Scan of downloads_dir to reuse (default: scanned here)
+        backup_dir (str): Folder whose *backup*/*duplicat* folders cleanup deletes (default: none)
+
+    Returns:
+        dict: 'success', 'urls' and the counts of download_urls()
+    """
+    if media_index is None:
+        media_index = scan_media(downloads_dir)
+
     # 执行清理（可选）
-    if not args.skip_cleanup:
-        cleanup_existing_photos()
+    if cleanup:
+        cleanup_existing_photos(downloads_dir, media_index, backup_dir)
 
-    # 从DOM.txt加载URLs
-    urls = load_urls_from_dom("DOM.txt")
-    print(f"从DOM.txt中找到 {len(urls)} 个大尺寸JPG图片URL")
+    if isinstance(source, (str, os.PathLike)):
+        with tracing.span('select_renditions'):
+            urls = select_urls_from_dom(source, min_width, prefer_webp, probe, allow_smaller)
+    else:
+        urls = list(source)
+    print(f"选择了 {len(urls)} 个图片URL")
 
+    result = {'success': False, 'urls': len(urls)}
     if not urls:
         print("没有找到任何URL，退出程序")
-        return
+        result['error'] = 'no URLs to download'
+        return result
+
+    # 下载时即在内存中去重，重复的图片不写入磁盘
+    live_index = None
+    if DEDUPLICATION_AVAILABLE and inline_dedup and perceptual_dedup:
+        from live_dedup import LiveDedupIndex
+        from reference_index import ReferenceIndex
+        reference = None
+        if reference_index and os.path.exists(reference_index):
+            reference = ReferenceIndex(reference_index)
+        live_index = LiveDedupIndex(threshold, reference)
 
     # Download URLs
-    download_urls(urls)
+    result.update(download_urls(urls, media_index, live_index, downloads_dir))
+    if live_index is not None and live_index.reference_index is not None:
+        live_index.reference_index.close()
+
+    if remove_duplicates:
+        remove_filename_duplicates(media_index, downloads_dir)
 
-    # Process downloads based on arguments
-    process_downloads(args)
+    # 清理过的下载目录中所有图片都已在下载时比对过，无需再次去重
+    if perceptual_dedup and not (live_index is not None and cleanup):
+        deduplicate_downloads(threshold, reference_index, media_index, downloads_dir)
 
-def get_unique_filename(folder, filename):
+    result['success'] = result['failed'] == 0
+    if result['failed']:
+        result['error'] = f"{result['failed']} of {len(urls)} downloads failed"
+    return result
+
+def get_unique_filename(folder, filename, media_index=None):
     """如果文件已存在，自动加 _1、_2 ... 后缀"""
+    if media_index is not None:
+        return media_index.unique_filename(folder, filename)
+
     base, ext = os.path.splitext(filename)
     counter = 1
     new_filename = filename
@@ -163,25 +244,25 @@ def get_unique_filename(folder, filename):
         counter += 1
     return new_filename
 
-def remove_filename_duplicates():
+def remove_filename_duplicates(media_index=None, downloads_dir="downloads"):
     """Remove duplicate images based on filename pattern (keeping highest resolution)."""
     print(f"\n{'='*50}")
     print("开始移除文件名重复...")
     print(f"{'='*50}")
 
-    downloads_dir = Path("downloads")
+    downloads_dir = Path(downloads_dir)
     if not downloads_dir.exists():
         print("Downloads目录不存在")
         return
 
-    # Find all image files
-    image_files = []
-    for img_file in downloads_dir.rglob("*.jpg"):
-        image_files.append(img_file)
+    # Find all image files (size comes from the scan, no extra stat calls)
+    if media_index is None:
+        media_index = scan_media(downloads_dir)
+    image_files = media_index.files(('.jpg', '.webp'))
 
     # Group files by base name (without resolution suffix)
     file_groups = {}
-    pattern = r'^(.+)-cc_ft_(\d+)\.jpg$'
+    pattern = r'^(.+)-cc_ft_(\d+)\.(?:jpg|webp)$'
 
     for img_file in image_files:
         match = re.match(pattern, img_file.name)
@@ -209,18 +290,18 @@ def remove_filename_duplicates():
             print(f"发现重复文件组: {base_name}")
             print(f"  保留: {files[0][0].name} ({files[0][1]}px)")
 
-            for file_path, resolution in files_to_remove:
+            for media_file, resolution in files_to_remove:
                 try:
-                    file_size = file_path.stat().st_size
-                    file_path.unlink()
-                    print(f"  移除: {file_path.name} ({resolution}px)")
+                    os.remove(media_file.path)
+                    media_index.remove(media_file.path)
+                    print(f"  移除: {media_file.name} ({resolution}px)")
                     removed_count += 1
-                    total_size_saved += file_size
+                    total_size_saved += media_file.size
                 except Exception as e:
-                    print(f"  删除失败 {file_path.name}: {e}")
+                    print(f"  删除失败 {media_file.name}: {e}")
 
     # Final statistics
-    remaining_files = list(downloads_dir.rglob("*.jpg"))
+    remaining_files = media_index.files(('.jpg', '.webp'))
 
     print(f"\n{'='*50}")
     print("文件名去重完成！")
@@ -229,107 +310,278 @@ def remove_filename_duplicates():
     print(f"节省空间: {total_size_saved / (1024*1024):.2f} MB")
     print(f"剩余文件: {len(remaining_files)}")
 
-def download_urls(urls):
-    """Download all URLs."""
+def download_urls(urls, media_index=None, live_index=None, downloads_dir="downloads"):
+    """Download all URLs into a subfolder of downloads_dir per domain.
+
+    如果提供了 live_index (LiveDedupIndex)，每张图片接收完后先在内存中比对：
+    重复的不写入，质量更高的重复版本原子地替换较差的已有文件。
+
+    Returns:
+        dict: 'downloaded', 'skipped' (duplicates), 'replaced', 'failed' and 'saved_bytes'
+    """
+    import requests
+    if live_index is not None:
+        from live_dedup import DUPLICATE, REPLACE
+
+    if media_index is None:
+        media_index = scan_media(downloads_dir)
+
+    downloaded_count = 0
+    failed_count = 0
+    skipped_count = 0
+    replaced_count = 0
+    saved_bytes = 0
+
     # Download files
-    for url in urls:
+    for position, url in enumerate(urls):
+        metrics.QUEUE_DEPTH.set(len(urls) - position)
         # 获取域名并创建对应的子文件夹
         domain = get_domain_folder(url)
-        domain_folder = os.path.join("downloads", domain)
+        domain_folder = os.path.join(downloads_dir, domain)
         os.makedirs(domain_folder, exist_ok=True)
 
         # 从 URL 提取文件名
         filename = url.split("/")[-1].split("?")[0]
-        filename = get_unique_filename(domain_folder, filename)
-        filepath = os.path.join(domain_folder, filename)
 
-        print(f"Downloading {url} -> {filepath}")
+        print(f"Downloading {url}")
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            with open(filepath, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            with tracing.span('download', file=filename, url=url) as download_span:
+                # 发送请求并等待响应头 (DNS 解析、建立连接与首字节)
+                with tracing.span('request'):
+                    response = requests.get(url, stream=True)
+                    metrics.DOWNLOAD_LATENCY.observe(response.elapsed.total_seconds())
+                    response.raise_for_status()
+
+                # 边接收边计算 SHA-256，内容保留在内存中
+                buffer = bytearray()
+                digest = hashlib.sha256()
+                with tracing.span('transfer') as transfer_span:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        buffer.extend(chunk)
+                        digest.update(chunk)
+                    transfer_span.add('bytes_in', len(buffer))
+                data = bytes(buffer)
+                download_span.add('bytes_in', len(data))
+
+                inspection = None
+                if live_index is not None:
+                    with tracing.span('inspect') as inspect_span:
+                        inspection = live_index.inspect(data, digest.hexdigest())
+                        inspect_span.set('action', inspection['action'])
+                    if inspection['action'] == DUPLICATE:
+                        skipped_count += 1
+                        saved_bytes += len(data)
+                        print(f"[SKIPPED] 重复图片，未写入: {filename} (已有: {inspection['existing']})")
+                        continue
+
+                filename = get_unique_filename(domain_folder, filename, media_index)
+                filepath = os.path.join(domain_folder, filename)
+
+                # 先写临时文件再重命名，中断时不会留下不完整的图片
+                with tracing.span('write') as write_span:
+                    temp_path = filepath + ".part"
+                    with open(temp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(temp_path, filepath)
+                    write_span.add('bytes_out', len(data))
+                media_index.add(filepath)
+
+                if inspection is not None:
+                    if inspection['action'] == REPLACE:
+                        weaker_path = inspection['existing']
+                        try:
+                            saved_bytes += os.path.getsize(weaker_path)
+                            os.remove(weaker_path)
+                            media_index.remove(weaker_path)
+                            replaced_count += 1
+                            print(f"[REPLACED] 质量更高，替换: {os.path.basename(weaker_path)} -> {filename}")
+                        except OSError as e:
+                            print(f"  删除失败 {weaker_path}: {e}")
+                    live_index.register(filepath, inspection)
+
+            downloaded_count += 1
             print(f"[SUCCESS] 下载成功: {filename}")
         except Exception as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            metrics.DOWNLOAD_ERRORS.inc(reason=status or type(e).__name__)
+            failed_count += 1
             print(f"[FAILED] 下载失败: {url}\n错误: {e}")
 
+    metrics.QUEUE_DEPTH.set(0)
     print("全部下载完成！")
+    if live_index is not None:
+        print(f"下载时去重: 跳过 {skipped_count} 个重复图片，替换 {replaced_count} 个较差版本，"
+              f"节省 {saved_bytes / (1024*1024):.2f} MB")
+    return {'downloaded': downloaded_count, 'skipped': skipped_count, 'replaced': replaced_count,
+            'failed': failed_count, 'saved_bytes': saved_bytes}
 
-def process_downloads(args):
+def process_downloads(args, media_index=None, skip_perceptual=False, downloads_dir="downloads"):
     """Process downloaded files based on arguments."""
     # Remove filename-based duplicates if requested
     if args.remove_filename_duplicates:
-        remove_filename_duplicates()
+        remove_filename_duplicates(media_index, downloads_dir)
 
-    # Execute perceptual deduplication unless skipped
-    if not args.skip_perceptual_dedup:
-        deduplicate_downloads()
+    # Execute perceptual deduplication unless skipped (or already done while downloading)
+    if not args.skip_perceptual_dedup and not skip_perceptual:
+        deduplicate_downloads(args.similarity_threshold, args.reference_index, media_index, downloads_dir)
 
 # Auto-deduplication after download
-def deduplicate_downloads():
-    """自动去重下载的图片，使用感知哈希查找视觉重复项。"""
+def remove_exact_duplicates(image_entries, media_index):
+    """移除内容完全相同的文件 (大小相同时才比较缓存的内容指纹)，每组保留一个，无需解码。
+
+    Returns:
+        tuple: (保留的文件列表, 移除数量, 节省字节数)
+    """
+    by_size = defaultdict(list)
+    for media_file in image_entries:
+        by_size[media_file.size].append(media_file)
+
+    removed = set()
+    removed_count = 0
+    total_size_saved = 0
+    with tracing.span('exact_match', images=len(image_entries)):
+        for same_size in by_size.values():
+            if len(same_size) < 2:
+                continue
+            seen = {}
+            for media_file in same_size:
+                try:
+                    digest = fingerprint.fingerprint(media_file.path, 'full')
+                except OSError:
+                    continue
+                if digest not in seen:
+                    seen[digest] = media_file
+                    continue
+                try:
+                    os.remove(media_file.path)
+                    media_index.remove(media_file.path)
+                    print(f"  移除: {media_file.name} (与 {seen[digest].name} 完全相同)")
+                    removed.add(media_file.path)
+                    removed_count += 1
+                    total_size_saved += media_file.size
+                except Exception as e:
+                    print(f"  删除失败 {media_file.name}: {e}")
+
+    kept = [media_file for media_file in image_entries if media_file.path not in removed]
+    return kept, removed_count, total_size_saved
+
+def deduplicate_downloads(threshold=DEFAULT_THRESHOLD, reference_index_path=None, media_index=None,
+                          downloads_dir="downloads"):
+    """自动去重下载的图片，使用 phash/dhash/whash 加权距离查找视觉重复项。
+
+    如果提供了归档参考索引，先剔除与归档中同等或更高质量照片重复的新下载。
+    """
     if not DEDUPLICATION_AVAILABLE:
-        print("去重功能不可用，请安装: pip install imagehash Pillow")
+        print("去重功能不可用，请安装: pip install -r requirements.txt")
         return
+    from PIL import Image
+    from image_similarity import build_hash_columns, compute_hashes, find_similar_pairs, group_duplicates
+    from reference_index import ReferenceIndex
 
     print(f"\n{'='*50}")
     print("开始自动去重...")
     print(f"{'='*50}")
 
-    downloads_dir = "downloads"
-    image_files = [
-        os.path.join(root, file)
-        for root, _, files in os.walk(downloads_dir)
-        for file in files
-        if file.lower().endswith(('.jpg', '.jpeg'))
-    ]
+    if media_index is None:
+        media_index = scan_media(downloads_dir)
+    image_entries = media_index.files(('.jpg', '.jpeg', '.webp'))
+    image_files = [media_file.path for media_file in image_entries]
 
-    if len(image_files) <= 1:
+    if len(image_files) == 0 or (len(image_files) == 1 and not reference_index_path):
         print("文件数量不足，无需去重")
         return
 
     print(f"分析 {len(image_files)} 个图片文件...")
 
-    # 1. 计算每个图片的哈希值和质量分数
-    # hashes: { hash -> [(filepath, quality_score), ...] }
-    hashes = defaultdict(list)
-    for filepath in image_files:
+    # 0. 完全相同的文件只保留一个，剩下的才需要解码
+    image_entries, removed_count, total_size_saved = remove_exact_duplicates(image_entries, media_index)
+
+    # 1. 每个图片只解码一次，计算三种哈希和质量分数
+    hashed_files = []
+    hash_rows = []
+    quality_scores = []
+    file_sizes = []
+    for media_file in image_entries:
+        filepath = media_file.path
         try:
             with Image.open(filepath) as img:
-                file_hash = imagehash.phash(img)
+                # 先单独解码，以便区分解码与计算哈希的耗时
+                with tracing.span('decode', file=media_file.name) as decode_span:
+                    img.load()
+                    decode_span.add('bytes_in', media_file.size)
+                with tracing.span('hash', file=media_file.name):
+                    hash_rows.append(compute_hashes(img))
                 width, height = img.size
                 resolution = width * height
-                file_size = os.path.getsize(filepath)
-                quality_score = (resolution, file_size)
-                hashes[file_hash].append((filepath, quality_score))
+                quality_scores.append((resolution, media_file.size))
+                hashed_files.append(filepath)
+                file_sizes.append(media_file.size)
         except Exception as e:
             print(f"无法处理文件 {filepath}: {e}")
 
-    removed_count = 0
-    total_size_saved = 0
+    if len(hashed_files) == 0 or (len(hashed_files) == 1 and not reference_index_path):
+        print("文件数量不足，无需去重")
+        return
 
-    # 2. 查找重复项并保留质量最好的一个
-    for file_hash, files_with_scores in hashes.items():
-        if len(files_with_scores) > 1:
-            # 按质量分数从高到低排序
-            files_with_scores.sort(key=lambda item: item[1], reverse=True)
-            
-            keep_file_path, _ = files_with_scores[0]
-            
-            print(f"发现重复图片 (hash: {file_hash}):")
-            print(f"  保留: {os.path.basename(keep_file_path)} (质量最高)")
-
-            # 移除其他重复文件
-            for remove_file_path, _ in files_with_scores[1:]:
+    columns = build_hash_columns(hash_rows)
+    removed = set()
+
+    # 2. 与归档参考索引比对 (直接在内存映射上计算，不加载为 Python 对象)
+    if reference_index_path:
+        if not os.path.exists(reference_index_path):
+            print(f"参考索引不存在: {reference_index_path}")
+        else:
+            reference = ReferenceIndex(reference_index_path)
+            print(f"与归档参考索引比对 ({len(reference)} 条记录)...")
+            with tracing.span('reference_match', records=len(reference)):
+                matches = reference.find_matches(columns, threshold)
+            for index_pos, (record, _) in sorted(matches.items()):
+                filepath = hashed_files[index_pos]
+                archive_path = reference.path(int(reference.records['file_id'][record]))
+                if reference.quality(record) < quality_scores[index_pos]:
+                    print(f"  新图片质量更高，保留: {os.path.basename(filepath)} (归档: {archive_path})")
+                    continue
                 try:
-                    file_size = os.path.getsize(remove_file_path)
-                    os.remove(remove_file_path)
-                    print(f"  移除: {os.path.basename(remove_file_path)}")
+                    os.remove(filepath)
+                    media_index.remove(filepath)
+                    print(f"  移除: {os.path.basename(filepath)} (归档中已有: {archive_path})")
+                    removed.add(index_pos)
                     removed_count += 1
-                    total_size_saved += file_size
+                    total_size_saved += file_sizes[index_pos]
                 except Exception as e:
-                    print(f"  删除失败 {remove_file_path}: {e}")
+                    print(f"  删除失败 {filepath}: {e}")
+            reference.close()
+
+    # 3. 分块向量化计算所有图片对的加权汉明距离，并合并为重复组
+    with tracing.span('match', images=len(hashed_files)):
+        pair_i, pair_j, _ = find_similar_pairs(columns, threshold=threshold)
+        duplicate_groups = group_duplicates(len(hashed_files), pair_i, pair_j)
+
+    # 4. 每组保留质量最好的一个
+    for group in duplicate_groups:
+        group = [index for index in group if index not in removed]
+        if len(group) <= 1:
+            continue
+
+        # 按质量分数从高到低排序
+        group.sort(key=lambda index: quality_scores[index], reverse=True)
+
+        keep_file_path = hashed_files[group[0]]
+
+        print(f"发现重复图片 ({len(group)} 个):")
+        print(f"  保留: {os.path.basename(keep_file_path)} (质量最高)")
+
+        # 移除其他重复文件
+        for index in group[1:]:
+            remove_file_path = hashed_files[index]
+            try:
+                os.remove(remove_file_path)
+                media_index.remove(remove_file_path)
+                print(f"  移除: {os.path.basename(remove_file_path)}")
+                removed_count += 1
+                total_size_saved += file_sizes[index]
+            except Exception as e:
+                print(f"  删除失败 {remove_file_path}: {e}")
 
     # 最终统计
     remaining_files_count = len(image_files) - removed_count
@@ -341,5 +593,21 @@ def deduplicate_downloads():
     print(f"节省空间: {total_size_saved / (1024*1024):.2f} MB")
     print(f"剩余唯一图片: {remaining_files_count}")
 
+def build_reference_index(archive_dir, index_path):
+    """Build or update the archive reference index."""
+    if not DEDUPLICATION_AVAILABLE:
+        print("去重功能不可用，请安装: pip install -r requirements.txt")
+        return
+    from reference_index import update_reference_index
+
+    print(f"{'='*50}")
+    print(f"更新归档参考索引: {index_path}")
+    print(f"{'='*50}")
+
+    stats = update_reference_index(archive_dir, index_path)
+    print(f"新增记录: {stats['added']}")
+    print(f"移除记录: {stats['removed']}")
+    print(f"索引总数: {stats['total']}")
+
 if __name__ == "__main__":
     main()
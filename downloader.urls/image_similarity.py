@@ -0,0 +1,165 @@
+import numpy as np
+import imagehash
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# 感知哈希种类，每种都是 8x8 = 64 位，按 uint64 列存储
+HASH_KINDS = ('phash', 'dhash', 'whash')
+HASH_FUNCTIONS = {
+    'phash': imagehash.phash,
+    'dhash': imagehash.dhash,
+    'whash': imagehash.whash,
+}
+
+# 各哈希的权重：加权后的归一化汉明距离 (0 = 相同, 1 = 全部位不同)
+DEFAULT_WEIGHTS = {'phash': 0.5, 'dhash': 0.25, 'whash': 0.25}
+# 低于此加权距离视为重复 (约等于 64 位中平均 5 位不同)
+DEFAULT_THRESHOLD = 0.08
+# 分块大小：每块计算 BLOCK_SIZE x BLOCK_SIZE 个距离，控制内存占用
+BLOCK_SIZE = 2048
+
+# 16 位 popcount 查找表 (每个 uint64 拆成 4 个 uint16 查表)
+POPCOUNT16 = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+
+
+def pack_hash(image_hash):
+    """Pack an imagehash.ImageHash (8x8 bits) into a Python int usable as uint64."""
+    bits = np.packbits(np.asarray(image_hash.hash, dtype=bool).reshape(-1))
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def compute_hashes(img):
+    """Compute every hash in HASH_KINDS from one already opened PIL image (single decode)."""
+    return {kind: pack_hash(HASH_FUNCTIONS[kind](img)) for kind in HASH_KINDS}
+
+
+def build_hash_columns(hash_rows):
+    """
+    Turn a list of compute_hashes() results into packed uint64 columns.
+
+    Returns:
+        dict: kind -> np.ndarray[uint64] of length len(hash_rows)
+    """
+    return {
+        kind: np.fromiter((row[kind] for row in hash_rows), dtype=np.uint64, count=len(hash_rows))
+        for kind in HASH_KINDS
+    }
+
+
+def popcount64(x):
+    """Number of set bits of each element of a uint64 array."""
+    if hasattr(np, 'bitwise_count'):
+        # numpy >= 2.0 提供原生 popcount
+        return np.bitwise_count(x)
+    x = np.ascontiguousarray(x)
+    return POPCOUNT16[x.view(np.uint16)].reshape(x.shape + (4,)).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming_block(a, b):
+    """
+    All-pairs Hamming distances between two uint64 hash vectors.
+
+    Returns:
+        np.ndarray[uint8]: shape (len(a), len(b))
+    """
+    return popcount64(np.bitwise_xor(a[:, None], b[None, :]))
+
+
+def _scan_blocks(columns_a, columns_b, weights, threshold, block_size, same_set):
+    """Blocked pair search shared by find_similar_pairs() and find_cross_pairs()."""
+    weights = {kind: w for kind, w in (weights or DEFAULT_WEIGHTS).items() if w}
+    total = sum(weights.values())
+    scale = {kind: w / (64.0 * total) for kind, w in weights.items()}
+    primary = max(weights, key=weights.get)
+    primary_limit = threshold / scale[primary]
+
+    n_a = len(columns_a[primary])
+    n_b = len(columns_b[primary])
+    found_i, found_j, found_d = [], [], []
+
+    for start_i in range(0, n_a, block_size):
+        end_i = min(start_i + block_size, n_a)
+        block_a = np.asarray(columns_a[primary][start_i:end_i])
+
+        for start_j in range(start_i if same_set else 0, n_b, block_size):
+            end_j = min(start_j + block_size, n_b)
+
+            mask = hamming_block(block_a, np.asarray(columns_b[primary][start_j:end_j])) <= primary_limit
+            if same_set and start_i == start_j:
+                # 对角块只取上三角，排除自身与重复的对称对
+                mask &= np.triu(np.ones(mask.shape, dtype=bool), k=1)
+
+            rows, cols = np.nonzero(mask)
+            if len(rows) == 0:
+                continue
+            rows += start_i
+            cols += start_j
+
+            # 只对候选对计算完整的加权距离
+            distance = np.zeros(len(rows), dtype=np.float32)
+            for kind, factor in scale.items():
+                xor = np.bitwise_xor(np.asarray(columns_a[kind])[rows], np.asarray(columns_b[kind])[cols])
+                distance += popcount64(xor).astype(np.float32) * factor
+
+            keep = distance <= threshold
+            found_i.append(rows[keep])
+            found_j.append(cols[keep])
+            found_d.append(distance[keep])
+
+    if not found_i:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+
+
+def find_similar_pairs(columns, weights=None, threshold=DEFAULT_THRESHOLD, block_size=BLOCK_SIZE):
+    """
+    Exact all-pairs search for images whose weighted hash distance is <= threshold.
+
+    The n x n comparison runs in blocks of block_size x block_size, so memory
+    stays bounded while each block is fully vectorized. Every weighted term
+    is non-negative, so the heaviest hash alone must already be within the
+    threshold: it is compared for all pairs, the other hashes only for the
+    surviving candidates.
+
+    Args:
+        columns (dict): Output of build_hash_columns()
+        weights (dict): Weight per hash kind (default DEFAULT_WEIGHTS)
+        threshold (float): Maximum weighted distance of a duplicate pair
+        block_size (int): Rows/columns per block
+
+    Returns:
+        tuple: (i, j, distance) numpy arrays with i < j
+    """
+    return _scan_blocks(columns, columns, weights, threshold, block_size, same_set=True)
+
+
+def find_cross_pairs(columns_a, columns_b, weights=None, threshold=DEFAULT_THRESHOLD, block_size=BLOCK_SIZE):
+    """
+    Like find_similar_pairs(), but between two sets (e.g. new downloads vs. an archive index).
+
+    columns_b may be views into a memory-mapped file; only the compared
+    block is read at a time.
+
+    Returns:
+        tuple: (i, j, distance) numpy arrays, i indexes columns_a and j columns_b
+    """
+    return _scan_blocks(columns_a, columns_b, weights, threshold, block_size, same_set=False)
+
+
+def group_duplicates(n, pair_i, pair_j):
+    """
+    Merge duplicate pairs into groups (connected components).
+
+    Returns:
+        list: Lists of indices, only groups with more than one member
+    """
+    if len(pair_i) == 0:
+        return []
+
+    graph = coo_matrix((np.ones(len(pair_i), dtype=np.int8), (pair_i, pair_j)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    order = np.argsort(labels, kind='stable')
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    return [group.tolist() for group in np.split(order, boundaries) if len(group) > 1]
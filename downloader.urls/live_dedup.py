@@ -0,0 +1,115 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from image_similarity import HASH_KINDS, DEFAULT_THRESHOLD, compute_hashes, find_cross_pairs
+
+# 下载时的判定结果
+NEW = 'new'
+DUPLICATE = 'duplicate'
+REPLACE = 'replace'
+
+
+class LiveDedupIndex:
+    """
+    Duplicate index that is filled while downloading.
+
+    Every received image is checked before it is written: first by exact
+    SHA-256, then by perceptual hashes computed from the in-memory buffer
+    (one decode). Perceptual hashes are kept in growable uint64 columns so
+    each lookup is a single vectorized comparison.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, reference_index=None):
+        self.threshold = threshold
+        self.reference_index = reference_index
+        self.paths = []
+        self.quality = []
+        self.alive = []
+        self.hashed = []
+        self.by_sha = {}
+        self._sha_of = []
+        self._columns = {kind: np.zeros(256, dtype=np.uint64) for kind in HASH_KINDS}
+
+    def __len__(self):
+        return sum(self.alive)
+
+    def inspect(self, data, sha256):
+        """
+        Decide what to do with a freshly received image.
+
+        Args:
+            data (bytes): Complete image file content
+            sha256 (str): Hex digest computed while receiving
+
+        Returns:
+            dict: 'action' (NEW, DUPLICATE or REPLACE), 'existing' path (or archive path),
+                  and 'hashes'/'quality' for register()
+        """
+        result = {'action': NEW, 'existing': None, 'hashes': None, 'quality': None, 'sha256': sha256}
+
+        position = self.by_sha.get(sha256)
+        if position is not None and self.alive[position]:
+            result['action'] = DUPLICATE
+            result['existing'] = self.paths[position]
+            return result
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                result['hashes'] = compute_hashes(img)
+                width, height = img.size
+        except Exception:
+            # 不是可解码的图片，按普通文件保存
+            return result
+        result['quality'] = (width * height, len(data))
+
+        query = {kind: np.array([result['hashes'][kind]], dtype=np.uint64) for kind in HASH_KINDS}
+
+        # 归档参考索引中已有同等或更高质量的版本
+        if self.reference_index is not None:
+            match = self.reference_index.find_matches(query, self.threshold).get(0)
+            if match and self.reference_index.quality(match[0]) >= result['quality']:
+                record = match[0]
+                result['action'] = DUPLICATE
+                result['existing'] = self.reference_index.path(int(self.reference_index.records['file_id'][record]))
+                return result
+
+        count = len(self.paths)
+        if count:
+            columns = {kind: column[:count] for kind, column in self._columns.items()}
+            _, positions, distances = find_cross_pairs(query, columns, threshold=self.threshold)
+            live = [(d, p) for p, d in zip(positions.tolist(), distances.tolist())
+                    if self.alive[p] and self.hashed[p]]
+            if live:
+                _, position = min(live)
+                result['existing'] = self.paths[position]
+                result['position'] = position
+                result['action'] = REPLACE if result['quality'] > self.quality[position] else DUPLICATE
+
+        return result
+
+    def register(self, path, inspection):
+        """Record a written file (after NEW or REPLACE)."""
+        if inspection['action'] == REPLACE:
+            self.alive[inspection['position']] = False
+            self.by_sha.pop(self._sha_of[inspection['position']], None)
+
+        position = len(self.paths)
+        self.paths.append(path)
+        self.quality.append(inspection['quality'] or (0, 0))
+        self.alive.append(True)
+        self.hashed.append(inspection['hashes'] is not None)
+        self._sha_of.append(inspection['sha256'])
+        self.by_sha[inspection['sha256']] = position
+
+        if position >= len(self._columns[HASH_KINDS[0]]):
+            # 容量翻倍，均摊 O(1) 追加
+            for kind in HASH_KINDS:
+                grown = np.zeros(len(self._columns[kind]) * 2, dtype=np.uint64)
+                grown[:position] = self._columns[kind][:position]
+                self._columns[kind] = grown
+        # 无法解码的文件只参与 SHA-256 比较
+        if inspection['hashes'] is not None:
+            for kind in HASH_KINDS:
+                self._columns[kind][position] = inspection['hashes'][kind]
@@ -0,0 +1,317 @@
+import argparse
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw
+
+# 与真实 CDN 相同的版本命名: <photo>-cc_ft_<size>.jpg
+RENDITION_SIZES = (384, 768, 1152, 1344, 1536)
+ASPECT_RATIO = 2 / 3
+SEND_CHUNK = 16 * 1024
+
+
+def synthetic_photo(seed, width):
+    """A deterministic synthetic photo (random shapes) rendered at the given width."""
+    rng = random.Random(seed)
+    height = int(width * ASPECT_RATIO)
+    img = Image.new('RGB', (width, height), tuple(rng.randint(0, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.random() * width, rng.random() * height
+        x1, y1 = x0 + rng.random() * width / 3, y0 + rng.random() * height / 3
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle([x0, y0, x1, y1], fill=color)
+        else:
+            draw.ellipse([x0, y0, x1, y1], fill=color)
+    return img
+
+
+def build_catalog(photos=50, sizes=RENDITION_SIZES, duplicates=0.0, quality=85, seed=0):
+    """
+    Render every rendition of every synthetic photo once, in memory.
+
+    Args:
+        photos (int): Number of distinct photo names
+        sizes (tuple): Rendition widths per photo
+        duplicates (float): Fraction of photo names that reuse another photo's image
+                            (same picture under a different name, for dedup benchmarks)
+        quality (int): JPEG quality
+
+    Returns:
+        dict: URL path -> JPEG bytes
+    """
+    rng = random.Random(seed)
+    repeated = set(rng.sample(range(1, photos), round((photos - 1) * duplicates))) if photos > 1 else set()
+    catalog = {}
+    for number in range(photos):
+        image_seed = rng.randrange(number) if number in repeated else number
+        base = synthetic_photo(image_seed, max(sizes))
+        for size in sizes:
+            img = base if size == base.width else base.resize((size, int(size * ASPECT_RATIO)))
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=quality)
+            catalog[f"/photos/photo{number:05d}-cc_ft_{size}.jpg"] = buffer.getvalue()
+    return catalog
+
+
+class LocalCDN:
+    """
+    Local HTTP server standing in for the photo CDN.
+
+    Serves a build_catalog() catalog with HEAD, ETag/If-None-Match and
+    single Range requests, and can inject latency, a per-connection
+    bandwidth cap, 429/503 responses and dropped connections. Every
+    request is recorded in self.log for the benchmark harness.
+
+    Use as a context manager; base_url is valid while it runs.
+    """
+
+    def __init__(self, catalog, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, bandwidth=None,
+                 throttle_rate=0.0, error_rate=0.0, drop_rate=0.0, seed=0):
+        """
+        Args:
+            latency (float): Seconds added before every response
+            jitter (float): Extra random latency, uniform in [0, jitter]
+            bandwidth (int): Bytes per second per connection (None = unlimited)
+            throttle_rate (float): Fraction of GET requests answered with 429 (Retry-After: 1)
+            error_rate (float): Fraction of GET requests answered with 503
+            drop_rate (float): Fraction of GET requests whose connection is closed mid-body
+        """
+        self.catalog = catalog
+        self.etags = {path: '"' + hashlib.md5(data).hexdigest() + '"' for path, data in catalog.items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.log = []
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return self.base_url + path
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        """Clear the request log and restart the fault sequence, so every run sees the same faults."""
+        with self._lock:
+            self.log = []
+            self._rng = random.Random(self.seed)
+
+    def _fault(self):
+        """Pick the injected fault (or None) for one GET request."""
+        with self._lock:
+            roll = self._rng.random()
+            delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+        if roll < self.throttle_rate:
+            return 429, delay
+        roll -= self.throttle_rate
+        if roll < self.error_rate:
+            return 503, delay
+        roll -= self.error_rate
+        if roll < self.drop_rate:
+            return 'drop', delay
+        return None, delay
+
+    def _record(self, method, path, status, started, sent):
+        with self._lock:
+            self.log.append({
+                'method': method,
+                'path': path,
+                'status': status,
+                'seconds': time.perf_counter() - started,
+                'bytes': sent,
+            })
+
+    def _handler_class(self):
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_body(self, data):
+                """Send data, honouring the bandwidth cap. Returns bytes sent."""
+                sent = 0
+                for start in range(0, len(data), SEND_CHUNK):
+                    chunk = data[start:start + SEND_CHUNK]
+                    chunk_started = time.perf_counter()
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    if cdn.bandwidth:
+                        remaining = len(chunk) / cdn.bandwidth - (time.perf_counter() - chunk_started)
+                        if remaining > 0:
+                            time.sleep(remaining)
+                return sent
+
+            def _serve(self, head_only):
+                started = time.perf_counter()
+                path = self.path.split('?', 1)[0]
+                method = 'HEAD' if head_only else 'GET'
+                data = cdn.catalog.get(path)
+                if data is None:
+                    self.send_error(404)
+                    cdn._record(method, path, 404, started, 0)
+                    return
+
+                fault, delay = (None, cdn.latency) if head_only else cdn._fault()
+                if delay:
+                    time.sleep(delay)
+
+                if fault in (429, 503):
+                    self.send_response(fault)
+                    if fault == 429:
+                        self.send_header('Retry-After', '1')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    cdn._record(method, path, fault, started, 0)
+                    return
+
+                etag = cdn.etags[path]
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    cdn._record(method, path, 304, started, 0)
+                    return
+
+                status, body = 200, data
+                content_range = None
+                requested = self.headers.get('Range', '')
+                if requested.startswith('bytes=') and ',' not in requested:
+                    first, _, last = requested[6:].partition('-')
+                    if first.isdigit():
+                        first = int(first)
+                        last = min(int(last), len(data) - 1) if last.isdigit() else len(data) - 1
+                        if first < len(data) and first <= last:
+                            status, body = 206, data[first:last + 1]
+                            content_range = f"bytes {first}-{last}/{len(data)}"
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', etag)
+                if content_range:
+                    self.send_header('Content-Range', content_range)
+                self.end_headers()
+
+                if head_only:
+                    cdn._record(method, path, status, started, 0)
+                    return
+
+                if fault == 'drop':
+                    # 只发送一半内容后断开连接
+                    sent = self._send_body(body[:len(body) // 2])
+                    self.close_connection = True
+                    cdn._record(method, path, 'dropped', started, sent)
+                    return
+
+                sent = self._send_body(body)
+                cdn._record(method, path, status, started, sent)
+
+            def do_GET(self):
+                try:
+                    self._serve(head_only=False)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_HEAD(self):
+                try:
+                    self._serve(head_only=True)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+
+def write_dom(catalog, base_url, dom_path="DOM.txt"):
+    """
+    Write a DOM.txt with one <img src/srcset> per photo, in the format the
+    downloader parses.
+
+    Returns:
+        int: Number of photos written
+    """
+    photos = {}
+    for path in sorted(catalog):
+        name = path.rsplit('/', 1)[-1]
+        base, size = name.rsplit('-cc_ft_', 1)
+        photos.setdefault(base, []).append((int(size.split('.')[0]), base_url + path))
+
+    with open(dom_path, 'w', encoding='utf-8') as f:
+        f.write('<html><body>\n')
+        for base, renditions in photos.items():
+            renditions.sort()
+            srcset = ', '.join(f"{url} {size}w" for size, url in renditions)
+            f.write(f'<img alt="{base}" src="{renditions[len(renditions) // 2][1]}" srcset="{srcset}">\n')
+        f.write('</body></html>\n')
+    return len(photos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic -cc_ft_<size>.jpg photos as a local stand-in CDN')
+    parser.add_argument('--photos', type=int, default=50, help='Number of synthetic photos (default: 50)')
+    parser.add_argument('--duplicates', type=float, default=0.0,
+                        help='Fraction of photos that repeat another photo under a new name (default: 0)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency per response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('--bandwidth', type=int, default=None, help='Bytes per second per connection')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of GETs answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of GETs answered with 503')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of GETs dropped mid-body')
+    parser.add_argument('--dom', default='DOM.txt', help='Where to write the matching DOM file (default: DOM.txt)')
+    args = parser.parse_args()
+
+    print(f"生成 {args.photos} 张合成照片...")
+    catalog = build_catalog(args.photos, duplicates=args.duplicates)
+    cdn = LocalCDN(catalog, port=args.port, latency=args.latency, jitter=args.jitter, bandwidth=args.bandwidth,
+                   throttle_rate=args.throttle_rate, error_rate=args.error_rate, drop_rate=args.drop_rate)
+    count = write_dom(catalog, cdn.base_url, args.dom)
+    print(f"已写入 {os.path.abspath(args.dom)} ({count} 张照片)")
+    print(f"本地 CDN 运行于 {cdn.base_url} (Ctrl+C 停止)")
+    cdn.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cdn.stop()
+
+
+if __name__ == "__main__":
+    main()
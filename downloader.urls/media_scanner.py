@@ -0,0 +1,143 @@
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# 单个文件的索引记录 (stat 结果来自扫描时的 DirEntry，不再单独调用 stat)
+MediaFile = namedtuple('MediaFile', ['path', 'name', 'size', 'mtime', 'ext'])
+
+
+def _folder_key(folder):
+    return os.path.normcase(os.path.abspath(folder))
+
+
+def _scan_folder(folder):
+    """Scan one directory: returns (file entries, all file names, sub directories)."""
+    files, names, subdirs = [], [], []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        names.append(entry.name)
+                        stat = entry.stat()
+                        ext = os.path.splitext(entry.name)[1].lower()
+                        files.append(MediaFile(entry.path, entry.name, stat.st_size, stat.st_mtime, ext))
+                except OSError:
+                    continue
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        pass
+    return files, names, subdirs
+
+
+class MediaIndex:
+    """
+    In-memory index of a media tree, built by a single os.scandir walk.
+
+    Every stage (cleanup, filename dedup, perceptual dedup, downloads)
+    queries this index instead of walking the tree and calling stat()
+    again. It also hands out unique file names per folder in O(1).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.entries = {}
+        self._names = {}
+        self._next_suffix = {}
+
+    def _add_folder(self, folder, files, names):
+        self._names[_folder_key(folder)] = {os.path.normcase(name) for name in names}
+        for media_file in files:
+            self.entries[media_file.path] = media_file
+
+    def scan(self, workers=1):
+        """
+        Walk the tree once. With workers > 1 directories are listed in
+        parallel, which hides latency on network shares.
+        """
+        self.entries.clear()
+        self._names.clear()
+        self._next_suffix.clear()
+        if not os.path.isdir(self.root):
+            return self
+
+        if workers <= 1:
+            pending = [self.root]
+            while pending:
+                folder = pending.pop()
+                files, names, subdirs = _scan_folder(folder)
+                self._add_folder(folder, files, names)
+                pending.extend(subdirs)
+            return self
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_scan_folder, self.root): self.root}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folder = futures.pop(future)
+                    files, names, subdirs = future.result()
+                    self._add_folder(folder, files, names)
+                    for subdir in subdirs:
+                        futures[pool.submit(_scan_folder, subdir)] = subdir
+        return self
+
+    def __len__(self):
+        return len(self.entries)
+
+    def files(self, extensions=None):
+        """Indexed files, optionally filtered by lower-case extension(s), in path order."""
+        if isinstance(extensions, str):
+            extensions = (extensions,)
+        return sorted(
+            (f for f in self.entries.values() if extensions is None or f.ext in extensions),
+            key=lambda f: f.path
+        )
+
+    def add(self, path, size=None, mtime=None):
+        """Record a file written after the scan (e.g. a finished download)."""
+        if size is None or mtime is None:
+            stat = os.stat(path)
+            size, mtime = stat.st_size, stat.st_mtime
+        name = os.path.basename(path)
+        self._folder_names(os.path.dirname(path)).add(os.path.normcase(name))
+        self.entries[path] = MediaFile(path, name, size, mtime, os.path.splitext(name)[1].lower())
+
+    def remove(self, path):
+        """Forget a deleted file."""
+        self.entries.pop(path, None)
+        names = self._names.get(_folder_key(os.path.dirname(path)))
+        if names is not None:
+            names.discard(os.path.normcase(os.path.basename(path)))
+
+    def _folder_names(self, folder):
+        key = _folder_key(folder)
+        if key not in self._names:
+            # 扫描范围之外的目录，首次使用时列出一次
+            _, names, _ = _scan_folder(folder)
+            self._names[key] = {os.path.normcase(name) for name in names}
+        return self._names[key]
+
+    def unique_filename(self, folder, filename):
+        """如果文件已存在，自动加 _1、_2 ... 后缀 (并预留该名称)"""
+        names = self._folder_names(folder)
+        new_filename = filename
+        if os.path.normcase(new_filename) in names:
+            base, ext = os.path.splitext(filename)
+            key = (_folder_key(folder), base, ext)
+            counter = self._next_suffix.get(key, 1)
+            new_filename = f"{base}_{counter}{ext}"
+            while os.path.normcase(new_filename) in names:
+                counter += 1
+                new_filename = f"{base}_{counter}{ext}"
+            self._next_suffix[key] = counter + 1
+        names.add(os.path.normcase(new_filename))
+        return new_filename
+
+
+def scan_media(root, workers=1):
+    """Build a MediaIndex for root with a single (optionally parallel) scandir walk."""
+    return MediaIndex(root).scan(workers)
@@ -0,0 +1,255 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from image_similarity import HASH_KINDS, DEFAULT_THRESHOLD, compute_hashes, find_cross_pairs
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# 索引文件格式: 16 字节文件头 + 定长记录数组
+# 路径表保存在同名的 .paths 旁路文件中，第 N 行对应 file_id N
+INDEX_MAGIC = b'CCHIDX01'
+HEADER_SIZE = 16
+RECORD_DTYPE = np.dtype([
+    ('phash', '<u8'),
+    ('dhash', '<u8'),
+    ('whash', '<u8'),
+    ('file_id', '<u4'),
+    ('deleted', 'u1'),
+    ('_pad', 'u1', 3),
+    ('resolution', '<u8'),
+    ('file_size', '<u8'),
+])
+
+
+def _paths_file(index_path):
+    return str(index_path) + '.paths'
+
+
+def _write_header(handle):
+    handle.write(INDEX_MAGIC)
+    handle.write(np.array([1, RECORD_DTYPE.itemsize], dtype='<u4').tobytes())
+
+
+class ReferenceIndex:
+    """
+    Persistent, memory-mapped hash index of an existing photo archive.
+
+    Opening only maps the record file; hashes are compared straight from
+    the mapping without creating Python objects per record. File paths live
+    in a sidecar table and are only read when a match has to be reported.
+    """
+
+    def __init__(self, index_path, writable=False):
+        self.index_path = str(index_path)
+        self.writable = writable
+        self._paths = None
+        self.records = self._map()
+
+    def _map(self):
+        if not os.path.exists(self.index_path):
+            return np.zeros(0, dtype=RECORD_DTYPE)
+
+        with open(self.index_path, 'rb') as handle:
+            header = handle.read(HEADER_SIZE)
+        if header[:8] != INDEX_MAGIC:
+            raise ValueError(f"{self.index_path} is not a reference hash index")
+        if int(np.frombuffer(header[12:16], dtype='<u4')[0]) != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{self.index_path} has an incompatible record layout")
+
+        count = (os.path.getsize(self.index_path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.memmap(self.index_path, dtype=RECORD_DTYPE, mode='r+' if self.writable else 'r',
+                         offset=HEADER_SIZE, shape=(count,))
+
+    def __len__(self):
+        return len(self.records)
+
+    def columns(self):
+        """Hash columns as (strided) views into the mapping, for image_similarity."""
+        return {kind: self.records[kind] for kind in HASH_KINDS}
+
+    def path(self, file_id):
+        """Archive path of a record, read lazily from the sidecar path table."""
+        if self._paths is None:
+            self._paths = self.load_paths()
+        return self._paths[file_id]
+
+    def load_paths(self):
+        paths_file = _paths_file(self.index_path)
+        if not os.path.exists(paths_file):
+            return []
+        with open(paths_file, 'r', encoding='utf-8') as handle:
+            return handle.read().splitlines()
+
+    def append(self, hash_rows, paths, quality_scores):
+        """
+        Append records for newly hashed archive files.
+
+        Args:
+            hash_rows (list): compute_hashes() results
+            paths (list): Archive path of each row
+            quality_scores (list): (resolution, file_size) of each row
+        """
+        if not hash_rows:
+            return
+
+        # file_id == 记录位置 (compact() 会重新编号)
+        first_id = len(self.records)
+        new_records = np.zeros(len(hash_rows), dtype=RECORD_DTYPE)
+        for kind in HASH_KINDS:
+            new_records[kind] = [row[kind] for row in hash_rows]
+        new_records['file_id'] = np.arange(first_id, first_id + len(hash_rows), dtype=np.uint32)
+        new_records['resolution'] = [score[0] for score in quality_scores]
+        new_records['file_size'] = [score[1] for score in quality_scores]
+
+        # 先释放旧映射，再追加写入
+        self.close()
+        is_new = not os.path.exists(self.index_path)
+        with open(self.index_path, 'ab') as handle:
+            if is_new:
+                _write_header(handle)
+            handle.write(new_records.tobytes())
+        with open(_paths_file(self.index_path), 'a', encoding='utf-8') as handle:
+            handle.writelines(f"{path}\n" for path in paths)
+
+        self._paths = None
+        self.records = self._map()
+
+    def mark_deleted(self, positions):
+        """Flag records (by position) as deleted; they are dropped by compact()."""
+        if not self.writable:
+            raise ValueError("Reference index was opened read-only")
+        self.records['deleted'][np.asarray(positions, dtype=np.int64)] = 1
+        self.records.flush()
+
+    def compact(self):
+        """
+        Rewrite the index without deleted records and renumber the path table.
+
+        Returns:
+            int: Number of records removed
+        """
+        live = np.asarray(self.records[self.records['deleted'] == 0])
+        removed = len(self.records) - len(live)
+        if removed == 0:
+            return 0
+
+        paths = self.load_paths()
+        live_paths = [paths[file_id] for file_id in live['file_id']]
+        live['file_id'] = np.arange(len(live), dtype=np.uint32)
+
+        self.close()
+        temp_index = self.index_path + '.tmp'
+        temp_paths = _paths_file(self.index_path) + '.tmp'
+        with open(temp_index, 'wb') as handle:
+            _write_header(handle)
+            handle.write(live.tobytes())
+        with open(temp_paths, 'w', encoding='utf-8') as handle:
+            handle.writelines(f"{path}\n" for path in live_paths)
+        os.replace(temp_index, self.index_path)
+        os.replace(temp_paths, _paths_file(self.index_path))
+
+        self._paths = None
+        self.records = self._map()
+        return removed
+
+    def find_matches(self, columns, threshold=DEFAULT_THRESHOLD):
+        """
+        Find, for each query image, its closest live archive record within threshold.
+
+        Args:
+            columns (dict): build_hash_columns() of the query images
+
+        Returns:
+            dict: query index -> (record position, distance)
+        """
+        if len(self.records) == 0:
+            return {}
+
+        query_i, record_j, distance = find_cross_pairs(columns, self.columns(), threshold=threshold)
+        live = self.records['deleted'][record_j] == 0
+        best = {}
+        for i, j, d in zip(query_i[live].tolist(), record_j[live].tolist(), distance[live].tolist()):
+            if i not in best or d < best[i][1]:
+                best[i] = (j, d)
+        return best
+
+    def quality(self, position):
+        record = self.records[position]
+        return int(record['resolution']), int(record['file_size'])
+
+    def close(self):
+        if isinstance(self.records, np.memmap):
+            mmap = getattr(self.records, '_mmap', None)
+            if self.writable:
+                self.records.flush()
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+            if mmap is not None:
+                try:
+                    mmap.close()
+                except BufferError:
+                    # 仍有视图引用该映射，交给垃圾回收释放
+                    pass
+
+
+def update_reference_index(archive_dir, index_path, batch_size=1000):
+    """
+    Build or incrementally update the reference index of an archive folder.
+
+    Files already in the index are skipped, records of files that no longer
+    exist are flagged as deleted, and the index is compacted at the end.
+
+    Returns:
+        dict: 'added', 'removed' and 'total' record counts
+    """
+    index = ReferenceIndex(index_path, writable=True)
+    known_paths = index.load_paths()
+    deleted = index.records['deleted']
+
+    # 已被删除的归档文件
+    gone = [position for position, path in enumerate(known_paths)
+            if not deleted[position] and not os.path.exists(path)]
+    if gone:
+        index.mark_deleted(gone)
+    known = {path for position, path in enumerate(known_paths) if not deleted[position]}
+    # 不保留对映射的引用，以便追加/压缩时能释放它
+    del deleted
+
+    added = 0
+    hash_rows, paths, quality_scores = [], [], []
+    for root, _, files in os.walk(archive_dir):
+        for file in files:
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            filepath = os.path.abspath(os.path.join(root, file))
+            if filepath in known:
+                continue
+            try:
+                with Image.open(filepath) as img:
+                    hashes = compute_hashes(img)
+                    width, height = img.size
+                quality_score = (width * height, os.path.getsize(filepath))
+
+            except Exception as e:
+                print(f"无法处理文件 {filepath}: {e}")
+                continue
+            hash_rows.append(hashes)
+            quality_scores.append(quality_score)
+            paths.append(filepath)
+
+            if len(hash_rows) >= batch_size:
+                index.append(hash_rows, paths, quality_scores)
+                added += len(hash_rows)
+                print(f"  已索引 {added} 个新文件...")
+                hash_rows, paths, quality_scores = [], [], []
+
+    index.append(hash_rows, paths, quality_scores)
+    added += len(hash_rows)
+
+    removed = index.compact()
+    total = len(index)
+    index.close()
+    return {'added': added, 'removed': removed, 'total': total}
@@ -0,0 +1,204 @@
+import importlib.util
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+# requests 与 PIL 只在探测版本时才导入
+HEADER_PARSING_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# 同一张照片的不同版本: <base>-cc_ft_<size>.<jpg|webp>
+RENDITION_PATTERN = re.compile(r'^(?P<base>.+?)-cc_ft_(?P<size>\d+)\.(?P<ext>jpe?g|webp)$', re.IGNORECASE)
+URL_PATTERN = re.compile(r'https?://[^\s,"\']+\.(?:jpe?g|webp)(?:\?[^\s,"\']*)?', re.IGNORECASE)
+
+# 读取图片头部以获取尺寸时的 Range 大小
+HEADER_RANGE_BYTES = 64 * 1024
+PROBE_TIMEOUT = 15
+
+_thread_state = threading.local()
+
+
+def _session():
+    """One keep-alive session per worker thread, so probes reuse connections."""
+    if not hasattr(_thread_state, 'session'):
+        import requests
+        _thread_state.session = requests.Session()
+    return _thread_state.session
+
+
+def parse_renditions(content):
+    """
+    从 DOM 内容中提取每张照片的所有可用版本 (src 与 srcset, JPEG 与 WebP)
+
+    Returns:
+        dict: 照片键 -> [{'url', 'width', 'format'}, ...]
+    """
+    groups = {}
+    seen = set()
+
+    candidates = []
+    for srcset in re.findall(r'srcset="([^"]*)"', content, re.IGNORECASE):
+        for item in srcset.split(','):
+            parts = item.split()
+            if parts:
+                descriptor = parts[1] if len(parts) > 1 else ''
+                candidates.append((parts[0], descriptor))
+    for url in URL_PATTERN.findall(content):
+        candidates.append((url, ''))
+
+    for url, descriptor in candidates:
+        if url in seen or not URL_PATTERN.fullmatch(url):
+            continue
+        seen.add(url)
+
+        parsed = urlparse(url)
+        name = parsed.path.rsplit('/', 1)[-1]
+        match = RENDITION_PATTERN.match(name)
+        if match:
+            key = (parsed.netloc, parsed.path.rsplit('/', 1)[0], match.group('base'))
+            width = int(match.group('size'))
+            ext = match.group('ext').lower()
+        else:
+            key = (parsed.netloc, parsed.path.rsplit('.', 1)[0])
+            width = None
+            ext = name.rsplit('.', 1)[-1].lower()
+
+        if descriptor.endswith('w') and descriptor[:-1].isdigit():
+            width = int(descriptor[:-1])
+
+        groups.setdefault(key, []).append({
+            'url': url,
+            'width': width,
+            'format': 'webp' if ext == 'webp' else 'jpeg',
+        })
+
+    return groups
+
+
+def _parse_dimensions(data):
+    """Image size from the first bytes of a file, without decoding pixels."""
+    if not HEADER_PARSING_AVAILABLE:
+        return None
+    from PIL import ImageFile
+    parser = ImageFile.Parser()
+    try:
+        parser.feed(data)
+    except Exception:
+        return None
+    return parser.image.size if parser.image else None
+
+
+def probe_rendition(rendition, need_dimensions=False):
+    """
+    用 HEAD (必要时用小范围 Range 读取图片头) 获取字节数和尺寸
+
+    Returns:
+        dict: rendition 加上 'bytes' (未知为 None) 和 'height'
+    """
+    import requests
+    result = dict(rendition, bytes=None, height=None)
+    session = _session()
+
+    try:
+        response = session.head(rendition['url'], allow_redirects=True, timeout=PROBE_TIMEOUT)
+        if response.ok and response.headers.get('Content-Length'):
+            result['bytes'] = int(response.headers['Content-Length'])
+    except requests.RequestException:
+        pass
+
+    if result['bytes'] is None or need_dimensions:
+        try:
+            response = session.get(rendition['url'], headers={'Range': f'bytes=0-{HEADER_RANGE_BYTES - 1}'},
+                                   timeout=PROBE_TIMEOUT)
+            if response.status_code == 206:
+                total = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+                if total.isdigit():
+                    result['bytes'] = int(total)
+            elif response.ok and result['bytes'] is None:
+                result['bytes'] = len(response.content)
+            size = _parse_dimensions(response.content[:HEADER_RANGE_BYTES])
+            if size:
+                result['width'], result['height'] = size
+        except requests.RequestException:
+            pass
+
+    return result
+
+
+def select_renditions(groups, min_width, prefer_webp=False, probe=True, workers=8, allow_smaller=False):
+    """
+    为每张照片选出满足最小宽度、字节数最小的版本
+
+    没有任何版本达到最小宽度的照片默认跳过；allow_smaller=True 时改为下载其最宽的版本，并逐张打印。
+
+    Args:
+        groups (dict): parse_renditions() 的结果
+        min_width (int): 目标最小宽度 (像素)
+        prefer_webp (bool): 同时考虑 WebP 版本，字节数相同时优先 WebP
+        probe (bool): 通过 HEAD/Range 探测字节数；否则直接选宽度最小的合格版本
+        workers (int): 并发探测的连接数
+        allow_smaller (bool): 没有合格版本时取最宽的版本，而不是跳过该照片
+
+    Returns:
+        list: 选中的 URL
+    """
+    formats = ('jpeg', 'webp') if prefer_webp else ('jpeg',)
+
+    def below_target(rendition):
+        print(f"  {rendition['url']}: 最宽的版本只有 {rendition['width']}px，低于 {min_width}px")
+
+    # 1. 每张照片的候选版本：满足目标宽度的全部版本；都不满足时跳过，或 (allow_smaller) 取最宽的
+    shortlists = []
+    skipped = 0
+    for renditions in groups.values():
+        usable = [r for r in renditions if r['format'] in formats]
+        if not usable:
+            continue
+        qualified = [r for r in usable if r['width'] is None or r['width'] >= min_width]
+        if not qualified:
+            if not allow_smaller:
+                skipped += 1
+                continue
+            widest = max(r['width'] for r in usable)
+            qualified = [r for r in usable if r['width'] == widest]
+            below_target(qualified[0])
+        shortlists.append(qualified)
+
+    def preference(rendition):
+        return (
+            rendition.get('bytes') if rendition.get('bytes') is not None else float('inf'),
+            0 if (prefer_webp and rendition['format'] == 'webp') else 1,
+            rendition['width'] or 0,
+        )
+
+    def report_skipped():
+        if skipped:
+            print(f"跳过 {skipped} 张没有 {min_width}px 以上版本的照片 (--allow-smaller 改为下载其最宽的版本)")
+
+    if not probe:
+        report_skipped()
+        return [min(shortlist, key=lambda r: (r['width'] or 0, preference(r)[1]))['url']
+                for shortlist in shortlists]
+
+    # 2. 并发探测所有需要比较的候选版本
+    to_probe = [r for shortlist in shortlists if len(shortlist) > 1 or shortlist[0]['width'] is None
+                for r in shortlist]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        probed = list(pool.map(lambda r: probe_rendition(r, need_dimensions=r['width'] is None), to_probe))
+    by_url = {r['url']: r for r in probed}
+
+    # 3. 选出字节数最小且 (探测后) 仍满足宽度要求的版本
+    selected = []
+    for shortlist in shortlists:
+        shortlist = [by_url.get(r['url'], r) for r in shortlist]
+        qualified = [r for r in shortlist if r['width'] is None or r['width'] >= min_width]
+        if not qualified:
+            # 探测到的实际宽度都低于目标
+            if not allow_smaller:
+                skipped += 1
+                continue
+            qualified = shortlist
+            below_target(max(shortlist, key=lambda r: r['width'] or 0))
+        selected.append(min(qualified, key=preference)['url'])
+    report_skipped()
+    return selected
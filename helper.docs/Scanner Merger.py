@@ -3,14 +3,19 @@ Path = r"C:\Users\Camel\Pictures\ControlCenter4\Scan"
 CounterChar = "_"
 FileType = "pdf"
 AutoMergePdf = 1
+DropBlankPages = 0	#leave out pages that look blank
+ObjectStreams = 0	#needs pikepdf
+Linearize = 0		#fast web view, needs pikepdf
 Debug = 0
 
 
-import os
-import pathlib
 import glob
-import datetime
 import shutil
+from pdf_duplex import merge_scans
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import metrics, tracing
+tracing.enable_from_env()	#CETC_TRACE=trace.jsonl: per-file timings
+metrics.enable_from_env('scanmerge')	#CETC_METRICS_PORT / CETC_METRICS_FILE: Prometheus metrics
 
 #debug
 if Debug :
@@ -19,45 +24,13 @@ if Debug :
 		shutil.copy(deg_file,Path)
 
 
-#create target folder
-timestamp = str(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
-targetDir = Path+"\\MergeScan_"+timestamp
-if not os.path.exists(targetDir):
-	#create target directory
-	os.mkdir(targetDir)
-
-#only handle pdf files
-files = glob.glob(Path+r"\*."+FileType)
-if len(files)%2 == 1 :
-	raise RuntimeError(str(len(files))+" files cannot be paired!")
-
-#re-index all the scan files
-loop = 1
-for file in files:
-	fileBasename = os.path.basename(file)
-	#get fileIndex
-	fileIndex = file.split(CounterChar)[-1].split(".")[0]
-	if loop <= (len(files))/2:
-		#odd
-		newIndex = loop*2-1
-	else:
-		#even
-		newIndex = int(len(files)) - (loop-int(len(files)/2)-1)*2
-	
-	newFilename = fileBasename.replace(fileIndex,str(newIndex)+"_"+fileIndex)
-
-	print(loop, fileBasename,"-->",newFilename)
-	os.rename(file,targetDir+"\\"+newFilename)
-
-	loop+=1
-
-import PyPDF2
-#merge pdf
+#merge pdf in scan order (fronts first, then the flipped stack of backs): pages are interleaved
+#inside the output, then the scans are archived into MergeScan_<timestamp>
+result = merge_scans(Path, CounterChar, FileType, merge=AutoMergePdf, drop_blank=DropBlankPages,
+	object_streams=ObjectStreams, linearize=Linearize)
+if not result['files']:
+	raise RuntimeError("No "+FileType+" files found in "+Path)
+if not result['success']:
+	raise RuntimeError("Merging "+str(len(result['files']))+" files failed!")
 if AutoMergePdf:
-	from PyPDF2 import PdfMerger 
-	mergeFiles = sorted(os.listdir(targetDir),key=lambda x: int(os.path.splitext(x.split('_')[1])[0]))
-	merger = PdfMerger()
-	for mFile in mergeFiles:
-		merger.append(open(targetDir+"\\"+mFile,'rb'))
-	with open(Path+"\\MergeResult-"+timestamp+".pdf","wb") as resFile:
-		merger.write(resFile)
+	print(len(result['files']), "files -->", result['output'], "("+str(result['pages'])+" pages)")
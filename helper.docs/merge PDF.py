@@ -1,29 +1,15 @@
-import os
-import datetime
-import os
-import pathlib
-import glob
-import datetime
-import shutil
-import PyPDF2
+from pdf_merge import merge_folder
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import metrics, tracing
 
 Path = r"C:\Users\Camel\Downloads\merger"
+ObjectStreams = 0   #needs pikepdf
+Linearize = 0       #fast web view, needs pikepdf
 
-timestamp = str(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
-targetDir = Path+"\\Merge_"+timestamp
-if not os.path.exists(targetDir):
-	#create target directory
-	os.mkdir(targetDir)
+#CETC_TRACE=trace.jsonl: per-file timings
+tracing.enable_from_env()
+#CETC_METRICS_PORT=9400 or CETC_METRICS_FILE=merge.prom: Prometheus metrics
+metrics.enable_from_env('pdfmerge')
 
-files = glob.glob(Path+r"\*.pdf")
-for file in files:
-    os.rename(file,targetDir+"\\"+os.path.basename(file))
- 
-#merge pdf
-from PyPDF2 import PdfMerger 
-mergeFiles =os.listdir(targetDir)
-merger = PdfMerger()
-for mFile in mergeFiles:
-    merger.append(open(targetDir+"\\"+mFile,'rb'))
-with open(Path+"\\MergeResult-"+timestamp+".pdf","wb") as resFile:
-    merger.write(resFile)
+#move the pdfs into Merge_<timestamp>, then merge them into MergeResult-<timestamp>.pdf
+merge_folder(Path, object_streams=ObjectStreams, linearize=Linearize)
@@ -0,0 +1,300 @@
+import argparse
+import datetime
+import glob
+import os
+import shutil
+import sys
+
+from pdf_merge import finalize_pdf
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import metrics, tracing
+
+# Blank page heuristics (no rendering needed)
+# A page is blank when its content stream is tiny and it shows at least one
+# image, every image compressing to almost nothing, which is what a scan of
+# an empty sheet of paper does. Pages without images (e.g. short text) are kept.
+# The limit is for 8-bit images and shrinks with the bits per pixel; bilevel
+# images (1 bit, CCITT, JBIG2) store text in so few bytes that they are never blank.
+BLANK_CONTENT_BYTES = 256
+BLANK_IMAGE_BYTES_PER_PIXEL = 0.02
+BILEVEL_FILTERS = ('/CCITTFaxDecode', '/JBIG2Decode')
+# 每像素的颜色分量数 (其余设备色彩空间按 1 个分量计)
+COLOR_COMPONENTS = {'/DeviceRGB': 3, '/CalRGB': 3, '/Lab': 3, '/DeviceCMYK': 4}
+
+
+def duplex_order(page_count):
+    """
+    Page order for a duplex scan made of a front batch followed by a reversed back batch
+
+    The first half of the pages are the fronts in order, the second half
+    the backs in reverse order (the stack is flipped to scan the backs).
+    With an odd count the last front has no back and ends the document.
+
+    Returns:
+        list: Page indices in reading order
+    """
+    half = (page_count + 1) // 2
+    fronts = list(range(half))
+    backs = list(range(page_count - 1, half - 1, -1))
+
+    order = []
+    for i, front in enumerate(fronts):
+        order.append(front)
+        if i < len(backs):
+            order.append(backs[i])
+    return order
+
+
+def _resolve(value):
+    return value.get_object() if value is not None else None
+
+
+def _stored_length(stream):
+    """Size of a stream as stored in the file (still encoded, nothing is decompressed)"""
+    length = _resolve(stream.get('/Length'))
+    if length is not None:
+        return int(length)
+    # pypdf drops /Length once parsed and keeps the raw bytes in _data
+    return len(getattr(stream, '_data', b''))
+
+
+def _bits_per_pixel(image):
+    """Bits per pixel of an image XObject, None for bilevel images"""
+    filters = _resolve(image.get('/Filter'))
+    if not isinstance(filters, list):
+        filters = [filters]
+    if _resolve(image.get('/ImageMask')) or any(name in BILEVEL_FILTERS for name in filters):
+        return None
+    # JPX 图像可以没有 /BitsPerComponent
+    bits = int(_resolve(image.get('/BitsPerComponent')) or 8)
+    if bits == 1:
+        return None
+    color_space = _resolve(image.get('/ColorSpace'))
+    if isinstance(color_space, list):
+        # [/ICCBased 流] 的分量数在 /N 中；/Indexed 等每像素一个索引
+        is_icc = len(color_space) > 1 and color_space[0] == '/ICCBased'
+        components = int(_resolve(color_space[1]).get('/N', 1)) if is_icc else 1
+    else:
+        components = COLOR_COMPONENTS.get(color_space, 1)
+    return bits * components
+
+
+def is_blank_page(page, max_content_bytes=BLANK_CONTENT_BYTES, max_image_bpp=BLANK_IMAGE_BYTES_PER_PIXEL):
+    """
+    Guess whether a page is blank from its content and image sizes only
+
+    Image data is never decoded: the stored size of each image is
+    compared to its pixel count. A page needs at least one such near-empty
+    image to count as blank, so short text-only pages are never dropped,
+    and bilevel scans (whose text compresses as well as an empty page)
+    never are blank.
+
+    Args:
+        page (PageObject): Page to inspect
+        max_content_bytes (int): Largest content stream that still counts as empty
+        max_image_bpp (float): Largest compressed bytes per pixel of a blank 8-bit image
+
+    Returns:
+        bool: True if the page looks blank
+    """
+    contents = page.get_contents()
+    if contents is not None and len(contents.get_data()) > max_content_bytes:
+        return False
+
+    resources = _resolve(page.get('/Resources')) or {}
+    xobjects = _resolve(resources.get('/XObject')) or {}
+    if not xobjects:
+        return False
+    for ref in xobjects.values():
+        xobject = _resolve(ref)
+        if xobject.get('/Subtype') != '/Image':
+            # Form XObjects can draw anything, be conservative
+            return False
+        bits = _bits_per_pixel(xobject)
+        if bits is None:
+            return False
+        pixels = int(_resolve(xobject.get('/Width')) or 0) * int(_resolve(xobject.get('/Height')) or 0)
+        length = _stored_length(xobject)
+        if pixels == 0 or length / pixels > max_image_bpp * min(bits, 8) / 8:
+            return False
+
+    return True
+
+
+def reorder_pages(writer, order):
+    """
+    Rearrange (and drop) pages by rewriting the page tree's references only
+
+    Args:
+        writer (PdfWriter): Document with a flat page tree (as built by add_page/append)
+        order (list): Page indices to keep, in their new order
+    """
+    from pypdf.generic import ArrayObject, NameObject, NumberObject
+
+    pages = writer.root_object['/Pages']
+    kids = pages['/Kids']
+    pages[NameObject('/Kids')] = ArrayObject([kids[i] for i in order])
+    pages[NameObject('/Count')] = NumberObject(len(order))
+
+
+def duplex_merge(input_files, output_path, drop_blank=False, dedupe=True, object_streams=False,
+                 linearize=False, progress=None):
+    """
+    Merge duplex scans into one correctly ordered PDF in a single pass
+
+    input_files are taken in scan order: all front sides, then the flipped
+    stack of back sides. Files may hold any number of pages; ordering is
+    done on pages, so single-page and batch scans work alike. Source files
+    are only read, never renamed or rewritten.
+
+    Args:
+        input_files (list): Scanned PDFs in scan order
+        output_path (str): Output PDF file
+        drop_blank (bool): Leave out pages that look blank
+        dedupe (bool): Store identical shared resources only once
+        object_streams (bool): Write compressed object streams (needs pikepdf)
+        linearize (bool): Write a linearized "fast web view" file (needs pikepdf)
+        progress (callable): Called with each input path after it is read
+
+    Returns:
+        dict: 'success', 'pages', 'blank_pages' and 'output'; no success (and no
+              output written) when there are no pages or every page was dropped as blank
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    result = {'success': False, 'pages': 0, 'blank_pages': [], 'output': str(output_path)}
+
+    # Blank pages are recognised on the source side and never copied
+    writer = PdfWriter()
+    positions = []  # scan-order page -> position in writer, None when dropped
+    for file_path in input_files:
+        try:
+            with tracing.span('append', file=os.path.basename(str(file_path))) as append_span, \
+                    open(file_path, 'rb') as source:
+                append_span.add('bytes_in', os.path.getsize(file_path))
+                reader = PdfReader(source)
+                kept = []
+                for index, page in enumerate(reader.pages):
+                    if drop_blank and is_blank_page(page):
+                        result['blank_pages'].append(len(positions))
+                        positions.append(None)
+                    else:
+                        positions.append(len(writer.pages) + len(kept))
+                        kept.append(index)
+                if kept:
+                    writer.append(reader, pages=kept)
+        except Exception as e:
+            print(f"  [ERROR] Could not read {os.path.basename(str(file_path))}: {e}")
+            return result
+        if progress:
+            progress(file_path)
+
+    if not positions:
+        print("No pages to merge")
+        return result
+    if len(positions) % 2 == 1:
+        print(f"  [WARNING] {len(positions)} pages cannot all be paired, the last front page has no back")
+    if result['blank_pages']:
+        print(f"  Dropping {len(result['blank_pages'])} blank page(s)")
+
+    order = [positions[i] for i in duplex_order(len(positions)) if positions[i] is not None]
+    if not order:
+        print(f"  [ERROR] All {len(positions)} pages look blank, nothing to merge")
+        return result
+    reorder_pages(writer, order)
+    finalize_pdf(writer, output_path, dedupe, object_streams, linearize)
+
+    result['pages'] = len(order)
+    result['success'] = True
+    return result
+
+
+def scan_index(file_path, counter_char='_'):
+    """
+    Sort key for scanner file names ending in a counter (Scan_1.pdf, Scan_2.pdf, ...)
+
+    Numbered files come first in counter order, anything else after them by name.
+    """
+    file_index = os.path.basename(file_path).split(counter_char)[-1].split(".")[0]
+    return (0, int(file_index), file_path) if file_index.isdigit() else (1, 0, file_path)
+
+
+def merge_scans(folder, counter_char='_', file_type='pdf', merge=True, drop_blank=False, dedupe=True,
+                object_streams=False, linearize=False):
+    """
+    Merge the duplex scans of a folder into MergeResult-<timestamp>.pdf, then archive them
+
+    The scans are taken in counter order (fronts first, then the flipped
+    stack of backs) and moved into MergeScan_<timestamp> once the merge
+    succeeded. They are left in place when merging fails.
+
+    Args:
+        folder (str): Scanner output folder
+        counter_char (str): Character before the scan counter in the file names
+        file_type (str): Extension of the scans
+        merge (bool): Merge the scans (False only archives them)
+        drop_blank (bool): Leave out pages that look blank (see is_blank_page())
+
+    Returns:
+        dict: duplex_merge() result plus 'files' (scans in scan order) and 'archive'
+    """
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    files = sorted(glob.glob(os.path.join(folder, "*." + file_type)), key=lambda f: scan_index(f, counter_char))
+    if not files:
+        return {'success': False, 'pages': 0, 'blank_pages': [], 'output': None, 'files': [], 'archive': None}
+
+    if merge:
+        result = duplex_merge(files, os.path.join(folder, "MergeResult-" + timestamp + ".pdf"),
+                              drop_blank=drop_blank, dedupe=dedupe,
+                              object_streams=object_streams, linearize=linearize)
+        result['files'] = files
+        result['archive'] = None
+        if not result['success']:
+            return result
+    else:
+        result = {'success': True, 'pages': 0, 'blank_pages': [], 'output': None, 'files': files}
+
+    #archive the scans
+    target_dir = os.path.join(folder, "MergeScan_" + timestamp)
+    os.makedirs(target_dir, exist_ok=True)
+    for file in files:
+        shutil.move(file, target_dir)
+    result['archive'] = target_dir
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge duplex scans (fronts, then the flipped stack of backs) '
+                                                 'into one PDF in reading order')
+    parser.add_argument('folder', help='Scanner output folder')
+    parser.add_argument('--counter-char', default='_',
+                        help='Character before the scan counter in the file names (default: _)')
+    parser.add_argument('--type', default='pdf', help='Extension of the scans (default: pdf)')
+    parser.add_argument('--no-merge', action='store_true', help='Only archive the scans, do not merge them')
+    parser.add_argument('--drop-blank', action='store_true',
+                        help='Leave out pages that look blank (near-empty images, never bilevel scans)')
+    parser.add_argument('--object-streams', action='store_true',
+                        help='Write compressed object streams (needs pikepdf)')
+    parser.add_argument('--linearize', action='store_true', help='Write a "fast web view" file (needs pikepdf)')
+    tracing.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.enable_from_args(args)
+    metrics.enable_from_args(args, 'scanmerge')
+
+    result = merge_scans(args.folder, args.counter_char, args.type, merge=not args.no_merge,
+                         drop_blank=args.drop_blank, object_streams=args.object_streams,
+                         linearize=args.linearize)
+    if not result['files']:
+        print(f"No {args.type} files found in {args.folder}")
+        sys.exit(1)
+    if not result['success']:
+        print(f"Merging {len(result['files'])} files failed!")
+        sys.exit(1)
+    if result['output']:
+        print(len(result['files']), "files -->", result['output'], "(" + str(result['pages']) + " pages)")
+    print(f"Scans archived in {result['archive']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import datetime
+import glob
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import metrics, tracing
+
+# pypdf and pikepdf are imported when a PDF is actually read or written, so
+# the tools start quickly. pikepdf (qpdf) is only needed for object streams
+# and linearized output.
+PIKEPDF_AVAILABLE = importlib.util.find_spec('pikepdf') is not None
+
+
+def append_pdf(writer, file_path, pages=None):
+    """
+    Copy pages of one PDF into writer and close the source right away
+
+    The writer clones the page objects, outline and everything they
+    reference, so nothing of the source reader is needed once this returns.
+
+    Args:
+        writer (PdfWriter): Output document
+        file_path (str): Source PDF
+        pages (list): Page indices to copy, in order (default: all pages)
+
+    Returns:
+        int: Number of pages copied
+    """
+    from pypdf import PdfReader
+
+    with open(file_path, 'rb') as source:
+        reader = PdfReader(source)
+        indices = list(range(len(reader.pages))) if pages is None else list(pages)
+        writer.append(reader, pages=indices)
+        return len(indices)
+
+
+def finalize_pdf(writer, output_path, dedupe=True, object_streams=False, linearize=False):
+    """
+    Write the merged document, optionally deduplicated, with object streams and/or linearized
+
+    Args:
+        writer (PdfWriter): Merged document
+        output_path (str): Output PDF file
+        dedupe (bool): Store identical objects (fonts, images, ...) shared across inputs only once
+        object_streams (bool): Pack objects into compressed object streams (needs pikepdf)
+        linearize (bool): Write a linearized "fast web view" file (needs pikepdf)
+    """
+    with tracing.span('finalize', file=os.path.basename(str(output_path))) as finalize_span:
+        _write_pdf(writer, output_path, dedupe, object_streams, linearize)
+        finalize_span.add('bytes_out', os.path.getsize(output_path))
+
+
+def _write_pdf(writer, output_path, dedupe, object_streams, linearize):
+    if dedupe:
+        with tracing.span('dedupe'):
+            writer.compress_identical_objects()
+
+    if (object_streams or linearize) and not PIKEPDF_AVAILABLE:
+        print("Warning: pikepdf not available, writing without object streams/linearization. "
+              "Install with: pip install pikepdf")
+        object_streams = linearize = False
+
+    if not (object_streams or linearize):
+        with open(output_path, 'wb') as output:
+            writer.write(output)
+        return
+
+    # Let qpdf rewrite the file: it generates object streams and the linearization hints
+    import pikepdf
+    fd, temp_path = tempfile.mkstemp(suffix='.pdf', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            writer.write(temp_file)
+        with pikepdf.open(temp_path) as pdf:
+            pdf.save(
+                output_path,
+                object_stream_mode=(pikepdf.ObjectStreamMode.generate if object_streams
+                                    else pikepdf.ObjectStreamMode.preserve),
+                compress_streams=True,
+                linearize=linearize,
+            )
+    finally:
+        os.remove(temp_path)
+
+
+def merge_pdfs(input_files, output_path, dedupe=True, object_streams=False, linearize=False, progress=None):
+    """
+    Merge PDF files in order into one document
+
+    Inputs are processed one at a time and each source file is closed as
+    soon as its pages are copied, so only one source is open at any time.
+    Memory is not bounded, though: the writer keeps the copied pages, with
+    their stream data still compressed, until the output is written, so it
+    grows with the total size of the inputs (as PdfMerger did). This is
+    deliberate: deduplicating resources shared across inputs needs the whole
+    document, and pikepdf also reads the sources until it saves.
+
+    Args:
+        input_files (list): Source PDFs in merge order
+        output_path (str): Output PDF file
+        dedupe (bool): Store identical shared resources only once
+        object_streams (bool): Write compressed object streams (needs pikepdf)
+        linearize (bool): Write a linearized "fast web view" file (needs pikepdf)
+        progress (callable): Called with each input path after it is merged
+
+    Returns:
+        dict: 'success', 'pages', 'inputs' and 'output'
+    """
+    from pypdf import PdfWriter
+
+    result = {'success': False, 'pages': 0, 'inputs': 0, 'output': str(output_path)}
+
+    writer = PdfWriter()
+    for file_path in input_files:
+        try:
+            with tracing.span('append', file=os.path.basename(str(file_path))) as append_span:
+                append_span.add('bytes_in', os.path.getsize(file_path))
+                result['pages'] += append_pdf(writer, file_path)
+            result['inputs'] += 1
+        except Exception as e:
+            print(f"  [ERROR] Could not read {os.path.basename(str(file_path))}: {e}")
+        if progress:
+            progress(file_path)
+
+    if result['pages'] == 0:
+        print("No pages to merge")
+        return result
+
+    finalize_pdf(writer, output_path, dedupe, object_streams, linearize)
+    result['success'] = True
+    return result
+
+
+def merge_folder(folder, dedupe=True, object_streams=False, linearize=False):
+    """
+    Move the PDFs of a folder into Merge_<timestamp> and merge them into MergeResult-<timestamp>.pdf
+
+    Args:
+        folder (str): Folder holding the PDFs to merge
+        dedupe (bool): Store identical shared resources only once
+        object_streams (bool): Write compressed object streams (needs pikepdf)
+        linearize (bool): Write a linearized "fast web view" file (needs pikepdf)
+
+    Returns:
+        dict: merge_pdfs() result plus 'archive' (folder the inputs were moved to)
+    """
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    target_dir = os.path.join(folder, "Merge_" + timestamp)
+    os.makedirs(target_dir, exist_ok=True)
+
+    for file in glob.glob(os.path.join(folder, "*.pdf")):
+        shutil.move(file, os.path.join(target_dir, os.path.basename(file)))
+
+    merge_files = [os.path.join(target_dir, name) for name in sorted(os.listdir(target_dir))]
+    result = merge_pdfs(merge_files, os.path.join(folder, "MergeResult-" + timestamp + ".pdf"),
+                        dedupe=dedupe, object_streams=object_streams, linearize=linearize)
+    result['archive'] = target_dir
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge all PDFs of a folder into MergeResult-<timestamp>.pdf '
+                                                 '(the inputs are moved into Merge_<timestamp>)')
+    parser.add_argument('folder', help='Folder holding the PDFs to merge')
+    parser.add_argument('--object-streams', action='store_true',
+                        help='Write compressed object streams (needs pikepdf)')
+    parser.add_argument('--linearize', action='store_true', help='Write a "fast web view" file (needs pikepdf)')
+    tracing.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.enable_from_args(args)
+    metrics.enable_from_args(args, 'pdfmerge')
+
+    result = merge_folder(args.folder, object_streams=args.object_streams, linearize=args.linearize)
+    if not result['success']:
+        sys.exit(1)
+    print(f"{result['inputs']} files --> {result['output']} ({result['pages']} pages)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+Make the shared cetchome package importable from the tool scripts of this folder.
+
+The scripts are run from their folder without installing anything, so
+the repository root is put on sys.path, ahead of any installed copy of
+cetchome that could be older than the checkout. In an installed tree
+(pip install .) there is no repository root and this changes nothing.
+"""
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.path.isdir(os.path.join(_ROOT, 'cetchome')) and _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
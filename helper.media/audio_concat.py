@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import tracing
+
+# Raw PCM layout used between decoders and the single encoder
+PCM_FORMAT = 's16le'
+PCM_SAMPLE_WIDTH = 2
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CHANNELS = 2
+
+# Bytes moved per read from a decoder pipe into the encoder pipe
+CHUNK_SIZE = 1024 * 1024
+
+# Gapless joining trims digital silence at track edges, scanning at most this many seconds per edge
+GAPLESS_MAX_TRIM = 2.0
+SILENCE_THRESHOLD = 16  # about -66 dBFS for 16-bit samples
+
+# Encoder and stream-copy compatible codecs per output extension
+OUTPUT_CODECS = {
+    '.mp3': ('libmp3lame', {'mp3'}),
+    '.m4a': ('aac', {'aac', 'alac'}),
+    '.aac': ('aac', {'aac'}),
+    '.flac': ('flac', {'flac'}),
+    '.ogg': ('libvorbis', {'vorbis', 'opus'}),
+    '.opus': ('libopus', {'opus'}),
+    '.wav': ('pcm_s16le', {'pcm_s16le'}),
+}
+
+
+def get_ffmpeg_path():
+    """Get the path to ffmpeg executable"""
+    script_dir = Path(__file__).parent
+    ffmpeg_path = script_dir / 'bin' / 'ffmpeg.exe'
+
+    if ffmpeg_path.exists():
+        return str(ffmpeg_path)
+
+    # Fallback to system ffmpeg
+    if shutil.which('ffmpeg'):
+        return 'ffmpeg'
+
+    return None
+
+
+def get_ffprobe_path():
+    """Get the path to ffprobe executable (next to ffmpeg)"""
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        return None
+    return str(Path(ffmpeg_path).parent / 'ffprobe.exe') if 'bin' in ffmpeg_path else 'ffprobe'
+
+
+def probe_audio(file_path):
+    """
+    Get codec and PCM layout of the first audio stream using ffprobe
+
+    Returns:
+        dict: codec, sample_rate and channels, or None if probing failed
+    """
+    ffprobe_path = get_ffprobe_path()
+    if not ffprobe_path:
+        return None
+
+    cmd = [
+        ffprobe_path,
+        '-v', 'quiet',
+        '-print_format', 'json',
+        '-select_streams', 'a:0',
+        '-show_streams',
+        str(file_path)
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        streams = json.loads(result.stdout).get('streams', [])
+    except Exception:
+        return None
+
+    if not streams:
+        return None
+
+    stream = streams[0]
+    return {
+        'codec': stream.get('codec_name'),
+        'sample_rate': int(stream.get('sample_rate', 0) or 0),
+        'channels': int(stream.get('channels', 0) or 0),
+    }
+
+
+def can_stream_copy(probes, output_path):
+    """
+    Check whether all inputs can be joined with the concat demuxer without re-encoding.
+
+    Every input must carry the same codec, sample rate and channel count,
+    and that codec must be valid in the output container.
+    """
+    if not probes or any(p is None for p in probes):
+        return False
+
+    _, copy_codecs = OUTPUT_CODECS.get(Path(output_path).suffix.lower(), (None, set()))
+    first = probes[0]
+    if first['codec'] not in copy_codecs:
+        return False
+
+    return all(
+        (p['codec'], p['sample_rate'], p['channels']) == (first['codec'], first['sample_rate'], first['channels'])
+        for p in probes
+    )
+
+
+def concat_stream_copy(input_files, output_path):
+    """
+    Join inputs with ffmpeg's concat demuxer and stream copy (no decode, no generation loss)
+
+    Returns:
+        bool: True on success
+    """
+    ffmpeg_path = get_ffmpeg_path()
+
+    # The concat demuxer reads its input list from a file
+    fd, list_path = tempfile.mkstemp(suffix='.txt', prefix='concat_')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as list_file:
+            for file_path in input_files:
+                escaped = str(Path(file_path).resolve()).replace("'", "'\\''")
+                list_file.write(f"file '{escaped}'\n")
+
+        cmd = [
+            ffmpeg_path, '-v', 'error', '-nostdin',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-map', '0:a', '-c', 'copy',
+            '-y', str(output_path)
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"  [ERROR] Stream copy failed: {result.stderr.strip()}")
+            return False
+        return True
+    finally:
+        os.remove(list_path)
+
+
+def start_decoder(file_path, sample_rate, channels):
+    """Start an ffmpeg process decoding the audio of file_path to raw PCM on stdout"""
+    cmd = [
+        get_ffmpeg_path(), '-v', 'error', '-nostdin',
+        '-i', str(file_path),
+        '-vn', '-f', PCM_FORMAT, '-ar', str(sample_rate), '-ac', str(channels),
+        'pipe:1'
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+
+def start_encoder(output_path, sample_rate, channels, bitrate):
+    """Start the single ffmpeg process that encodes raw PCM from stdin into output_path"""
+    encoder, _ = OUTPUT_CODECS.get(Path(output_path).suffix.lower(), OUTPUT_CODECS['.mp3'])
+    cmd = [
+        get_ffmpeg_path(), '-v', 'error',
+        '-f', PCM_FORMAT, '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+        '-c:a', encoder,
+    ]
+    if not encoder.startswith(('pcm_', 'flac')):
+        cmd.extend(['-b:a', bitrate])
+    cmd.extend(['-y', str(output_path)])
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def concat_streaming_encode(input_files, output_path, bitrate='192k', sample_rate=None, channels=None,
+                            progress=None, workers=1, gapless=False, crossfade=0.0):
+    """
+    Decode inputs and stream their PCM, in order, into a single encoder
+
+    With one worker and no joining effects each decoder pipes straight into
+    the encoder. Otherwise inputs are decoded in parallel to scratch PCM
+    files (at most a few tracks ahead of the encoder) and joined with
+    gapless trimming and/or crossfades that only touch a bounded window at
+    each track edge. Python never holds more than one chunk or one
+    crossfade window, so memory stays constant and runtime is linear.
+
+    Args:
+        input_files (list): Input paths in join order
+        output_path (str): Output audio file; the extension selects the encoder
+        bitrate (str): Encoder bitrate for lossy outputs
+        sample_rate (int): Output sample rate (default 44100)
+        channels (int): Output channel count (default 2)
+        progress (callable): Called with each input path after it is streamed
+        workers (int): Number of parallel decoders
+        gapless (bool): Trim leading/trailing digital silence between tracks
+        crossfade (float): Crossfade length in seconds between tracks (0 disables)
+
+    Returns:
+        bool: True on success
+    """
+    sample_rate = sample_rate or DEFAULT_SAMPLE_RATE
+    channels = channels or DEFAULT_CHANNELS
+
+    encoder = start_encoder(output_path, sample_rate, channels, bitrate)
+    try:
+        if workers <= 1 and not gapless and not crossfade:
+            for file_path in input_files:
+                decoder = start_decoder(file_path, sample_rate, channels)
+                shutil.copyfileobj(decoder.stdout, encoder.stdin, CHUNK_SIZE)
+                decoder.stdout.close()
+                if decoder.wait() != 0:
+                    print(f"  [WARNING] Could not fully decode {os.path.basename(str(file_path))}")
+                if progress:
+                    progress(file_path)
+        else:
+            _join_decoded(input_files, encoder.stdin, sample_rate, channels, max(1, workers),
+                          gapless, crossfade, progress)
+    except BrokenPipeError:
+        pass
+    finally:
+        if encoder.stdin and not encoder.stdin.closed:
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+        stderr = encoder.stderr.read().decode(errors='replace')
+        encoder.wait()
+
+    if encoder.returncode != 0:
+        print(f"  [ERROR] Encoding failed: {stderr.strip()}")
+        return False
+    return True
+
+
+def decode_to_pcm(file_path, pcm_path, sample_rate, channels):
+    """
+    Decode the audio of file_path to a raw PCM file (runs in a worker thread)
+
+    Returns:
+        bool: True on success
+    """
+    cmd = [
+        get_ffmpeg_path(), '-v', 'error', '-nostdin',
+        '-i', str(file_path),
+        '-vn', '-f', PCM_FORMAT, '-ar', str(sample_rate), '-ac', str(channels),
+        '-y', str(pcm_path)
+    ]
+    with tracing.span('decode', file=os.path.basename(str(file_path))) as decode_span:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True)
+        if os.path.exists(pcm_path):
+            decode_span.add('bytes_out', os.path.getsize(pcm_path))
+    return result.returncode == 0 and os.path.exists(pcm_path)
+
+
+def _samples(data):
+    """Interpret little-endian 16-bit PCM bytes as a sample array"""
+    samples = array('h', data[:len(data) - len(data) % PCM_SAMPLE_WIDTH])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples
+
+
+def _to_bytes(samples):
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def find_audible_range(pcm_path, frame_size, window_bytes, threshold=SILENCE_THRESHOLD):
+    """
+    Find the byte range of a PCM file without leading/trailing digital silence
+
+    Only the first and last window_bytes are read.
+
+    Returns:
+        tuple: (start, end) byte offsets, frame aligned
+    """
+    size = os.path.getsize(pcm_path)
+    size -= size % frame_size
+
+    with open(pcm_path, 'rb') as pcm:
+        head = _samples(pcm.read(min(window_bytes, size)))
+        first = next((i for i, v in enumerate(head) if abs(v) > threshold), None)
+        if first is None:
+            # Fully silent track (within the window): leave it untouched
+            if window_bytes >= size:
+                return 0, size
+            start = len(head) * PCM_SAMPLE_WIDTH
+        else:
+            start = first * PCM_SAMPLE_WIDTH
+        start -= start % frame_size
+
+        tail_pos = max(start, size - window_bytes)
+        pcm.seek(tail_pos)
+        tail = _samples(pcm.read(size - tail_pos))
+        last = next((i for i in range(len(tail) - 1, -1, -1) if abs(tail[i]) > threshold), None)
+        if last is None:
+            end = tail_pos
+        else:
+            end = tail_pos + (last + 1) * PCM_SAMPLE_WIDTH
+            end += -end % frame_size
+
+    return start, max(start, min(end, size))
+
+
+def mix_crossfade(tail, head, channels):
+    """Linearly fade out tail while fading in head (both the same length of PCM bytes)"""
+    a = _samples(tail)
+    b = _samples(head)
+    frames = len(a) // channels or 1
+    mixed = array('h', (
+        max(-32768, min(32767, int(a[i] + (b[i] - a[i]) * ((i // channels) / frames))))
+        for i in range(len(a))
+    ))
+    return _to_bytes(mixed)
+
+
+def _copy_range(src, dst, length):
+    """Copy length bytes from src to dst in CHUNK_SIZE pieces"""
+    while length > 0:
+        chunk = src.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def _join_decoded(input_files, sink, sample_rate, channels, workers, gapless, crossfade, progress):
+    """Decode inputs in parallel, a bounded number of tracks ahead, and write them to sink in order"""
+    frame_size = channels * PCM_SAMPLE_WIDTH
+    gapless_window = int(GAPLESS_MAX_TRIM * sample_rate) * frame_size
+    crossfade_bytes = int(crossfade * sample_rate) * frame_size
+    lookahead = workers + 1
+
+    with tempfile.TemporaryDirectory(prefix='audio_merge_') as scratch, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+
+        def submit(index):
+            pcm_path = os.path.join(scratch, f'{index}.pcm')
+            futures[index] = (pcm_path, pool.submit(decode_to_pcm, input_files[index], pcm_path,
+                                                    sample_rate, channels))
+
+        for index in range(min(lookahead, len(input_files))):
+            submit(index)
+
+        pending = b''  # held-back tail of the previous track, waiting to be crossfaded
+        for index, file_path in enumerate(input_files):
+            pcm_path, future = futures.pop(index)
+            if index + lookahead < len(input_files):
+                submit(index + lookahead)
+
+            if not future.result():
+                print(f"  [WARNING] Could not decode {os.path.basename(str(file_path))}, skipping")
+                continue
+
+            if gapless:
+                start, end = find_audible_range(pcm_path, frame_size, gapless_window)
+            else:
+                start = 0
+                end = os.path.getsize(pcm_path)
+                end -= end % frame_size
+
+            with open(pcm_path, 'rb') as pcm:
+                pcm.seek(start)
+
+                if pending:
+                    overlap = min(len(pending), (end - start) // 2 // frame_size * frame_size)
+                    sink.write(pending[:len(pending) - overlap])
+                    if overlap:
+                        sink.write(mix_crossfade(pending[len(pending) - overlap:], pcm.read(overlap), channels))
+                    start += overlap
+                    pending = b''
+
+                keep = 0
+                if crossfade_bytes and index < len(input_files) - 1:
+                    keep = min(crossfade_bytes, (end - start) // 2 // frame_size * frame_size)
+
+                _copy_range(pcm, sink, end - start - keep)
+                if keep:
+                    pending = pcm.read(keep)
+
+            os.remove(pcm_path)
+            if progress:
+                progress(file_path)
+
+        if pending:
+            sink.write(pending)
+
+
+def merge_audio_files(input_files, output_path, bitrate='192k', allow_stream_copy=True, progress=None,
+                      workers=1, gapless=False, crossfade=0.0):
+    """
+    Join audio files in order into one output file
+
+    Uses the concat demuxer with stream copy when every input already matches
+    the output codec and no joining effects are requested, otherwise falls
+    back to a single streaming re-encode (see concat_streaming_encode).
+
+    Returns:
+        dict: 'success', 'mode' ('copy' or 'encode') and 'output'
+    """
+    result = {'success': False, 'mode': None, 'output': str(output_path)}
+
+    if not get_ffmpeg_path():
+        print("Error: ffmpeg not found in bin folder or system PATH")
+        return result
+
+    if not input_files:
+        return result
+
+    probes = []
+    for file_path in input_files:
+        with tracing.span('probe', file=os.path.basename(str(file_path))):
+            probes.append(probe_audio(file_path))
+
+    if allow_stream_copy and not gapless and not crossfade and can_stream_copy(probes, output_path):
+        result['mode'] = 'copy'
+        with tracing.span('stream_copy', file=os.path.basename(str(output_path))):
+            result['success'] = concat_stream_copy(input_files, output_path)
+        if result['success']:
+            if progress:
+                for file_path in input_files:
+                    progress(file_path)
+            return result
+        print("  [INFO] Falling back to re-encoding")
+
+    # Keep the source layout when it is known, so decoders do not resample needlessly
+    first = next((p for p in probes if p and p['sample_rate'] and p['channels']), None)
+    result['mode'] = 'encode'
+    with tracing.span('encode', file=os.path.basename(str(output_path)), workers=workers) as encode_span:
+        result['success'] = concat_streaming_encode(
+            input_files, output_path, bitrate,
+            sample_rate=first['sample_rate'] if first else None,
+            channels=first['channels'] if first else None,
+            progress=progress,
+            workers=workers,
+            gapless=gapless,
+            crossfade=crossfade,
+        )
+        if os.path.exists(output_path):
+            encode_span.add('bytes_out', os.path.getsize(output_path))
+    return result
@@ -1,59 +1,20 @@
 
-import pathlib
-import imageio
-import rawpy
-from rich.progress import track
-from PIL import Image
-import shutil
-import os
-import pillow_heif
+import subprocess
+from raw_convert import convert_folder
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import metrics, tracing
+tracing.enable_from_env()  # CETC_TRACE=trace.jsonl: per-file timings
+metrics.enable_from_env('raw2jpg')  # CETC_METRICS_PORT / CETC_METRICS_FILE: Prometheus metrics
 
 pathArray = [
              r'Z:\Photo\Life.LosAngeles\!Home.4318 Cutler\H']
-             
+
 for path in pathArray:
     print(path)
     #path = r'Z:\Photo\Life.Montreal\20151018.Part nature du Bois-de-ile-Bizard'
     ext = 'HEIC'
     #ext = 'HEIC'
 
-    FROM = pathlib.Path(path)  # Folder to read from.
-    TO = pathlib.Path(FROM.joinpath(ext))  # Folder to save images into.
-    if not os.path.exists(TO):
-        os.makedirs(TO)
-
-    images = list(FROM.glob(f'*.{ext}'))
-
-    for img in track(images):
-        new_location = (TO / img.name).with_suffix(".JPG")
-
-        if ext=='RAF':
-            with rawpy.imread(str(img)) as raw:
-                rgb = raw.postprocess(rawpy.Params(
-                    use_camera_wb=True,  # 是否使用拍摄时的白平衡值
-                    use_auto_wb=False,
-                    exp_shift=0.25  # 修改后光线会下降，所以需要手动提亮，线性比例的曝光偏移。可用范围从0.25（变暗2级）到8.0（变浅3级）。
-                    ))
-            imageio.imsave(new_location, rgb)
-        
-        if ext=='HEIC':
-            heif_file = pillow_heif.read_heif(str(img))
-            image = Image.frombytes(
-                heif_file.mode,
-                heif_file.size,
-                heif_file.data,
-                "raw",
-            )
-            image.save(new_location, "JPEG", quality=100)
+    TO = convert_folder(path, ext)  # JPEGs are saved into <path>\<ext>
 
-        #clone exif        
-        import subprocess
-        command = f'.\\helper.photo\\bin\\exiftool -overwrite_original -TagsFromFile \"{img._str}\" \"{new_location._str}\"'
-        print(command)
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("Command executed successfully.")
-        print("Output:", result.stdout)
-        
-        shutil.move(img, TO) 
-        
-    subprocess.Popen(r'explorer /select,"'+str(TO)+'\"')
\ No newline at end of file
+    subprocess.Popen(r'explorer /select,"'+str(TO)+'\"')
@@ -3,8 +3,13 @@ import sys
 import subprocess
 import shutil
 import json
+import argparse
+import threading
 from pathlib import Path
-from tqdm import tqdm
+
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import cache_path, exiftool, fingerprint, jobs, metrics, mp4, staging, tracing
+import video_fingerprint
 
 # Configuration Parameters
 SOURCE_PATH = "input"          # Source folder for MOV files
@@ -12,6 +17,23 @@ DESTINATION_PATH = "output"     # Destination folder for MP4 files
 FILE_EXTENSIONS = [".mov", ".MOV"]  # File extensions to process
 QUALITY_LEVEL = "high"          # Quality level: high, medium, low
 USE_HEVC = False                # Use H.265/HEVC for better compression (slower, not all devices support)
+SCRATCH_PATH = None             # Local scratch folder to stage inputs/outputs on a network share (None = off)
+SCRATCH_SIZE_GB = 20            # Maximum size of staged inputs in the scratch folder
+READ_AHEAD = 2                  # Number of files copied to scratch ahead of the one being encoded
+EXTRA_OUTPUTS = []              # Extra outputs made from the same decode: 'proxy', 'poster', 'sprite'
+ENCODE_JOBS = 1                 # Files encoded at the same time (each ffmpeg already uses all cores)
+PLAN_ONLY = False               # Only show the plan (decisions, estimated time and size), convert nothing
+VERIFY_DECODE = False           # Also decode the keyframes of each MP4 when verifying it (reads the whole file)
+DEDUPLICATE = True              # Link clips that duplicate an already converted clip instead of encoding them again
+
+# Metadata fields compared between source and MP4 after conversion
+VERIFY_FIELDS = [
+    'CreateDate', 'ModifyDate', 'DateTimeOriginal', 'FileModifyDate',
+    'GPSLatitude', 'GPSLongitude', 'GPSPosition', 'Model', 'Make',
+    'Duration', 'ImageWidth', 'ImageHeight', 'VideoFrameRate'
+]
+# Fields of a linked duplicate's MP4 that must equal its source's (else the clips are not the same recording)
+DUPLICATE_FIELDS = ['CreateDate', 'DateTimeOriginal', 'GPSLatitude', 'GPSLongitude', 'GPSPosition', 'Model', 'Make']
 
 # Quality settings - optimized for compression with slower encoding
 # CRF: Lower = better quality (18=very high, 23=good, 28=acceptable)
@@ -41,6 +63,45 @@ QUALITY_SETTINGS = {
     }
 }
 
+# Extra output targets, written next to the MP4 as <name><suffix>
+# proxy: small H.264 copy for previews (shorter side at most 'size' pixels)
+# poster: one JPEG frame 'time' seconds into the clip (the middle frame for shorter clips;
+#         the nearest whole second when the duration is unknown)
+# sprite: contact sheet of columns x rows frames spread over the clip, each 'width' pixels wide
+#         (one frame every 'interval' seconds when the duration is unknown)
+OUTPUT_TARGETS = {
+    'proxy': {
+        'suffix': '_proxy.mp4',
+        'size': 720,
+        'crf': '28',
+        'preset': 'veryfast',
+        'audio_bitrate': '96k'
+    },
+    'poster': {
+        'suffix': '_poster.jpg',
+        'time': 1.0,
+        'quality': '2'  # JPEG qscale: 2 (best) - 31
+    },
+    'sprite': {
+        'suffix': '_sprite.jpg',
+        'columns': 5,
+        'rows': 5,
+        'width': 160,
+        'interval': 10.0,
+        'quality': '4'
+    }
+}
+
+# Cost model for planning: encode seconds per megapixel-second of video
+# (width x height x duration / 1e6) and MP4/source size ratio per encoder,
+# preset and CRF. Measured on past runs (last COST_HISTORY encodes per
+# setting, kept in the cache folder); these guesses are used until then.
+DEFAULT_ENCODE_SPEED = {'libx264': {'slow': 0.35, 'medium': 0.2}, 'libx265': {'slow': 1.5, 'medium': 0.8}}
+DEFAULT_SIZE_RATIO = {'18': 0.6, '23': 0.35, '28': 0.2}
+COPY_SPEED = 200 * 1024 * 1024  # Bytes per second when the video stream is copied
+COST_HISTORY = 50
+OUTPUT_INDEX = 'mov2mp4-outputs.jsonl'  # Converted MP4s, looked up for duplicate clips
+
 def get_ffmpeg_path():
     """Get the path to ffmpeg executable"""
     script_dir = Path(__file__).parent
@@ -63,15 +124,28 @@ def get_exiftool_path():
     if exiftool_path.exists():
         return str(exiftool_path)
 
+    # Fallback to system exiftool
+    if shutil.which('exiftool'):
+        return 'exiftool'
+
     return None
 
 def get_video_info(file_path):
     """
-    Get video codec and bitrate information using ffprobe
+    Get video codec and bitrate information
+
+    MOV/MP4 headers are read in-process (cetchome.mp4, no subprocess);
+    ffprobe is only used for files that parser cannot read.
 
     Returns:
         dict: Video information including codec, bitrate, audio codec, etc.
+              (plus rotation, capture_time and location from the header parser)
     """
+    try:
+        return mp4.probe(file_path)
+    except (OSError, ValueError):
+        pass
+
     ffmpeg_path = get_ffmpeg_path()
     if not ffmpeg_path:
         return None
@@ -134,6 +208,7 @@ def get_video_info(file_path):
         print(f"  [WARNING] Could not get video info: {e}")
         return None
 
+@tracing.traced('exiftool')
 def preserve_metadata(source_file, target_file):
     """
     Preserve metadata from source to target file using exiftool
@@ -146,7 +221,7 @@ def preserve_metadata(source_file, target_file):
     try:
         # Copy all metadata from source to target
         cmd = [exiftool_path, '-TagsFromFile', str(source_file), '-all:all', str(target_file), '-overwrite_original']
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = exiftool.run(cmd)
 
         if result.returncode == 0:
             return True
@@ -159,7 +234,10 @@ def preserve_metadata(source_file, target_file):
 
 def files_are_identical(file1, file2):
     """
-    Check if two files are identical by comparing size, modification time, and content hash
+    Check if two files are identical by comparing size, modification time and a sampled content fingerprint
+
+    The fingerprint reads about 1 MB per file whatever its size and is
+    cached, so checking a multi-GB backup takes milliseconds.
     """
     if not file2.exists():
         return False
@@ -176,40 +254,13 @@ def files_are_identical(file1, file2):
     if abs(stat1.st_mtime - stat2.st_mtime) > 1:
         return False
 
-    # For small files, do content comparison
-    if stat1.st_size < 50 * 1024 * 1024:  # Less than 50MB
-        import hashlib
-        try:
-            print(f"  [DEBUG] Comparing file content for {file1.name}...", end='', flush=True)
-            hash1 = hashlib.md5()
-            hash2 = hashlib.md5()
-
-            with open(file1, 'rb') as f1, open(file2, 'rb') as f2:
-                # Read in chunks to handle large files
-                while True:
-                    chunk1 = f1.read(8192)
-                    chunk2 = f2.read(8192)
-                    if not chunk1 and not chunk2:
-                        break
-                    if not chunk1 or not chunk2 or chunk1 != chunk2:
-                        print(" Different content found")
-                        return False
-                    hash1.update(chunk1)
-                    hash2.update(chunk2)
-
-            result = hash1.hexdigest() == hash2.hexdigest()
-            print(f" {'Identical' if result else 'Different'}")
-            return result
-        except Exception as e:
-            print(f" Error: {e}")
-            return False
-
-    # For large files, assume identical if size and mtime match
-    return True
+    return fingerprint.identical(file1, file2)
 
-def create_backup(source_file, output_folder):
+def create_backup(source_file, output_folder, stager=None):
     """
     Create a backup by copying original file to output folder only if it doesn't already exist
+
+    With a stager the copy is made from the staged local copy, so the source is read from the share only once.
     """
     try:
         backup_path = output_folder / source_file.name
@@ -224,51 +275,40 @@ def create_backup(source_file, output_folder):
             backup_path.unlink()
             print(f"[INFO] Replacing different backup: {source_file.name}")
 
-        shutil.copy2(source_file, backup_path)
+        shutil.copy2(stager.local(source_file) if stager is not None else source_file, backup_path)
+        tracing.current().add('bytes_copied', source_file.stat().st_size)
         print(f"[OK] Backup created: {source_file.name}")
         return backup_path
     except Exception as e:
         print(f"[ERROR] Failed to create backup: {e}")
         return None
 
-def get_file_metadata(file_path):
-    """
-    Extract metadata from file using exiftool
-    """
-    exiftool_path = get_exiftool_path()
-    if not exiftool_path:
-        return {}
-
-    try:
-        cmd = [exiftool_path, '-j', str(file_path)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
-            metadata = json.loads(result.stdout)[0]
-            return metadata
-    except Exception:
-        pass
-    return {}
-
 def compare_metadata(source_file, target_file):
     """
-    Compare metadata between source and target files
-    """
-    source_meta = get_file_metadata(source_file)
-    target_meta = get_file_metadata(target_file)
-
-    important_fields = [
-        'CreateDate', 'ModifyDate', 'DateTimeOriginal', 'FileModifyDate',
-        'GPSLatitude', 'GPSLongitude', 'GPSPosition', 'Model', 'Make',
-        'Duration', 'ImageWidth', 'ImageHeight', 'VideoFrameRate'
-    ]
+    Compare the important metadata fields of source and target files
 
+    Reads only VERIFY_FIELDS of both files with a single exiftool command.
+    """
     comparison = {
         'preserved': [],
         'missing': [],
         'different': []
     }
+    exiftool_path = get_exiftool_path()
+    if not exiftool_path:
+        return comparison
 
-    for field in important_fields:
+    try:
+        cmd = [exiftool_path, '-j', *(f'-{field}' for field in VERIFY_FIELDS), str(source_file), str(target_file)]
+        result = exiftool.run(cmd)
+        records = json.loads(result.stdout) if result.returncode == 0 else []
+    except Exception:
+        records = []
+    if len(records) != 2:
+        return comparison
+    source_meta, target_meta = records
+
+    for field in VERIFY_FIELDS:
         if field in source_meta:
             if field in target_meta:
                 if str(source_meta[field]) == str(target_meta[field]):
@@ -284,78 +324,142 @@ def compare_metadata(source_file, target_file):
 
     return comparison
 
-def convert_mov_to_mp4(input_file, output_folder):
+def check_streams(source_file, target_file, video_info):
     """
-    Convert a single MOV file to MP4 with size reduction and metadata preservation
+    Check that the target file is complete and as long as the source, without decoding it
+
+    Only the moov atoms are read (cetchome.mp4): the durations and sample
+    (packet) counts of the video and audio tracks are compared with the
+    source, and every sample of the target must lie inside the file.
+
+    Returns:
+        tuple: (streams, problems) - per stream 'source'/'target' duration and
+               sample count, and a list of problem descriptions (empty if OK)
+    """
+    problems = []
+    try:
+        target = mp4.read_tracks(target_file)
+    except (OSError, ValueError) as e:
+        return {}, [f"unreadable output: {e}"]
+    try:
+        source = mp4.read_tracks(source_file)
+    except (OSError, ValueError):
+        source = None
+
+    data_end = max((track['data_end'] for track in target['tracks']), default=0)
+    if data_end > target['size']:
+        problems.append(f"truncated: {target['size']} of {data_end} bytes")
+
+    streams = {}
+    for name, handler in (('video', 'vide'), ('audio', 'soun')):
+        target_track = mp4.first_track(target, handler)
+        source_track = mp4.first_track(source, handler) if source else None
+        if source is None and name == 'video' and video_info:
+            # 源文件不是 QuickTime 容器时只比较探测到的时长
+            source_track = {'duration': video_info['duration'], 'samples': None}
+        if source_track is None:
+            continue
+        streams[name] = {
+            'source': {'duration': round(source_track['duration'], 3), 'samples': source_track['samples']},
+            'target': None
+        }
+        if target_track is None:
+            problems.append(f"{name} stream missing")
+            continue
+        streams[name]['target'] = {'duration': round(target_track['duration'], 3),
+                                   'samples': target_track['samples']}
+        # 重复片段的匹配 (video_fingerprint.same_duration) 不比这里宽松
+        if abs(target_track['duration'] - source_track['duration']) > 0.1 + source_track['duration'] * 0.01:
+            problems.append(f"{name} duration {target_track['duration']:.2f}s, source {source_track['duration']:.2f}s")
+        if name == 'video' and source_track['samples'] and \
+                source_track['samples'] - target_track['samples'] > max(2, source_track['samples'] // 100):
+            problems.append(f"video has {target_track['samples']} frames, source {source_track['samples']}")
+    return streams, problems
+
+def check_decode(target_file):
+    """
+    Decode only the keyframes of the target video
+
+    Returns:
+        str: First decoder error, or None if the keyframes decode cleanly
+    """
+    cmd = [get_ffmpeg_path(), '-v', 'error', '-skip_frame', 'nokey', '-i', str(target_file),
+           '-map', '0:v:0', '-an', '-f', 'null', '-']
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    errors = result.stderr.strip()
+    if result.returncode != 0 or errors:
+        return errors.splitlines()[0] if errors else f"ffmpeg exit code {result.returncode}"
+    return None
+
+def verify_output(source_file, target_file, video_info, decode=False, duplicate=False):
+    """
+    Verify a converted file: structure, stream lengths and important metadata
 
     Args:
-        input_file (Path): Path to the input MOV file
-        output_folder (Path): Folder for the output MP4 file
+        source_file (Path): Original MOV file
+        target_file (Path): Converted MP4 file
+        video_info (dict): get_video_info() result of the source (None if probing failed)
+        decode (bool): Also decode the keyframes (reads the whole file)
+        duplicate (bool): target_file is the linked MP4 of another clip; DUPLICATE_FIELDS
+                          that differ from the source are problems
 
     Returns:
-        dict: Conversion results with metadata comparison
+        dict: compare_metadata() fields plus 'streams' (see check_streams()),
+              'problems' (empty when the output is complete) and 'decoded'
     """
-    result = {
-        'success': False,
-        'input_file': input_file.name,
-        'original_size': 0,
-        'converted_size': 0,
-        'backup_created': False,
-        'metadata_comparison': None,
-        'video_info': None
-    }
+    verification = compare_metadata(source_file, target_file)
+    with tracing.span('check_streams'):
+        verification['streams'], verification['problems'] = check_streams(source_file, target_file, video_info)
+    if duplicate:
+        verification['problems'].extend(
+            f"{difference['field']} {difference['target']} of the linked MP4, source {difference['source']}"
+            for difference in verification['different'] if difference['field'] in DUPLICATE_FIELDS)
+    verification['decoded'] = False
+    if decode and not verification['problems']:
+        with tracing.span('check_decode'):
+            error = check_decode(target_file)
+        verification['decoded'] = True
+        if error:
+            verification['problems'].append(f"decode error: {error}")
+    return verification
+
+def check_input(input_file):
+    """
+    Check that a file can be converted
 
+    Returns:
+        str: Error message, or None if the file can be converted
+    """
     if not input_file.exists():
         print(f"Error: Input file '{input_file}' does not exist.")
-        return result
+        return 'input file does not exist'
 
     if input_file.suffix.lower() not in [ext.lower() for ext in FILE_EXTENSIONS]:
         print(f"Error: Input file '{input_file}' is not a supported file type.")
-        return result
+        return 'unsupported file type'
 
-    ffmpeg_path = get_ffmpeg_path()
-    if not ffmpeg_path:
+    if not get_ffmpeg_path():
         print("Error: ffmpeg not found in bin folder or system PATH")
-        return result
-
-    # Get video information first
-    print(f"Analyzing {input_file.name}...")
-    video_info = get_video_info(input_file)
-    result['video_info'] = video_info
-
-    if video_info:
-        print(f"  Source codec: {video_info['video_codec']} @ {video_info['video_bitrate'] / 1_000_000:.1f} Mbps")
-        print(f"  Audio codec: {video_info['audio_codec']} @ {video_info['audio_bitrate'] / 1000:.0f} kbps")
-        print(f"  Resolution: {video_info['width']}x{video_info['height']}")
-
-    # Create backup first
-    backup_path = create_backup(input_file, output_folder)
-    if backup_path:
-        result['backup_created'] = True
-
-    # Set output path
-    output_file = output_folder / input_file.with_suffix('.MP4').name
+        return 'ffmpeg not found'
 
-    # Remove existing output file if it exists (with retry for Windows file locking)
-    if output_file.exists():
-        try:
-            output_file.unlink()
-        except PermissionError:
-            print(f"  [WARNING] Could not delete existing {output_file.name}, ffmpeg will overwrite it")
+    return None
 
-    # Get quality settings
-    quality_config = QUALITY_SETTINGS.get(QUALITY_LEVEL, QUALITY_SETTINGS['medium'])
+def choose_codecs(video_info, quality_config, use_hevc, quiet=False):
+    """
+    Decide whether to copy or re-encode the video and audio streams (quiet: do not print the decisions)
 
+    Returns:
+        tuple: (video_codec_args, audio_codec_args) for ffmpeg
+    """
     # Determine video encoding strategy
     video_codec_args = []
-    should_reencode_video = True
 
     if video_info:
         source_codec = video_info['video_codec']
         source_bitrate = video_info['video_bitrate']
 
         # Determine target codec
-        if USE_HEVC:
+        if use_hevc:
             target_codec = 'libx265'
             target_codec_name = 'H.265/HEVC'
         else:
@@ -365,14 +469,15 @@ def convert_mov_to_mp4(input_file, output_folder):
         # Check if we can copy the video stream (already optimal)
         max_bitrate_bps = int(quality_config['max_video_bitrate'].rstrip('M')) * 1_000_000
 
-        if not USE_HEVC and source_codec in ['h264', 'avc1'] and source_bitrate <= max_bitrate_bps * 1.1:
+        if not use_hevc and source_codec in ['h264', 'avc1'] and source_bitrate <= max_bitrate_bps * 1.1:
             # Source is already H.264 and within reasonable bitrate, just copy it
-            print(f"  Video: Copying stream (already H.264 at acceptable bitrate)")
+            if not quiet:
+                print(f"  Video: Copying stream (already H.264 at acceptable bitrate)")
             video_codec_args = ['-c:v', 'copy']
-            should_reencode_video = False
         else:
             # Re-encode with target codec
-            print(f"  Video: Re-encoding to {target_codec_name} (preset: {quality_config['preset']}, CRF: {quality_config['crf']})")
+            if not quiet:
+                print(f"  Video: Re-encoding to {target_codec_name} (preset: {quality_config['preset']}, CRF: {quality_config['crf']})")
             video_codec_args = [
                 '-c:v', target_codec,
                 '-crf', quality_config['crf'],
@@ -382,12 +487,13 @@ def convert_mov_to_mp4(input_file, output_folder):
             ]
 
             # Add x265-specific params for better compression
-            if USE_HEVC:
+            if use_hevc:
                 video_codec_args.extend(['-x265-params', 'log-level=error'])
     else:
         # No video info available, use default encoding
-        target_codec = 'libx265' if USE_HEVC else 'libx264'
-        print(f"  Video: Re-encoding to {target_codec} (no source info available)")
+        target_codec = 'libx265' if use_hevc else 'libx264'
+        if not quiet:
+            print(f"  Video: Re-encoding to {target_codec} (no source info available)")
         video_codec_args = [
             '-c:v', target_codec,
             '-crf', quality_config['crf'],
@@ -395,7 +501,7 @@ def convert_mov_to_mp4(input_file, output_folder):
             '-maxrate', quality_config['max_video_bitrate'],
             '-bufsize', quality_config['bufsize']
         ]
-        if USE_HEVC:
+        if use_hevc:
             video_codec_args.extend(['-x265-params', 'log-level=error'])
 
     # Determine audio encoding strategy
@@ -404,22 +510,206 @@ def convert_mov_to_mp4(input_file, output_folder):
         target_audio_bitrate_bps = int(quality_config['audio_bitrate'].rstrip('k')) * 1000
         if video_info['audio_bitrate'] <= target_audio_bitrate_bps * 1.1:
             # Audio is already AAC at acceptable bitrate, copy it
-            print(f"  Audio: Copying stream (already AAC at acceptable bitrate)")
+            if not quiet:
+                print(f"  Audio: Copying stream (already AAC at acceptable bitrate)")
             audio_codec_args = ['-c:a', 'copy']
         else:
-            print(f"  Audio: Re-encoding to AAC @ {quality_config['audio_bitrate']}")
+            if not quiet:
+                print(f"  Audio: Re-encoding to AAC @ {quality_config['audio_bitrate']}")
             audio_codec_args = ['-c:a', 'aac', '-b:a', quality_config['audio_bitrate']]
     else:
-        print(f"  Audio: Re-encoding to AAC @ {quality_config['audio_bitrate']}")
+        if not quiet:
+            print(f"  Audio: Re-encoding to AAC @ {quality_config['audio_bitrate']}")
         audio_codec_args = ['-c:a', 'aac', '-b:a', quality_config['audio_bitrate']]
 
+    return video_codec_args, audio_codec_args
+
+def output_targets(extra_outputs):
+    """
+    Settings of the requested extra outputs
+
+    Args:
+        extra_outputs: Names from OUTPUT_TARGETS, or a dict of name -> settings
+                       overriding OUTPUT_TARGETS[name] (e.g. {'poster': {'time': 5}})
+
+    Returns:
+        dict: name -> complete settings, in OUTPUT_TARGETS order
+    """
+    if not isinstance(extra_outputs, dict):
+        extra_outputs = {name: {} for name in extra_outputs or ()}
+    unknown = set(extra_outputs) - set(OUTPUT_TARGETS)
+    if unknown:
+        raise ValueError(f"unknown output targets: {', '.join(sorted(unknown))}")
+    return {name: dict(OUTPUT_TARGETS[name], **(extra_outputs[name] or {}))
+            for name in OUTPUT_TARGETS if name in extra_outputs}
+
+def extra_output_files(input_file, output_folder, targets):
+    """Paths of the extra outputs of one input: name -> Path"""
+    return {name: output_folder / f"{input_file.stem}{settings['suffix']}" for name, settings in targets.items()}
+
+def _every(seconds):
+    """select filter keeping the first frame and then one frame every `seconds`"""
+    # 与 fps 滤镜不同，比间隔更短的剪辑也至少输出一帧
+    return f"select='isnan(prev_selected_t)+gte(t-prev_selected_t,{seconds:g})'"
+
+def extra_output_args(targets, files, video_info):
+    """
+    Filter graph branches and output options for the extra outputs
+
+    Every extra output is fed from one split of the decoded video, so the
+    source is only decoded once however many outputs are written.
+
+    Args:
+        targets (dict): output_targets() result
+        files (dict): name -> Path to write
+        video_info (dict): get_video_info() result (None if probing failed)
+
+    Returns:
+        tuple: (filter chains taking [x_<name>] as input, ffmpeg output arguments)
+    """
+    duration = video_info['duration'] if video_info else 0
+    chains = []
+    args = []
+    for name, settings in targets.items():
+        if name == 'proxy':
+            # 短边缩小到 size，不放大，宽高保持偶数
+            scale = f"min(1,{settings['size']}/min(iw,ih))"
+            chains.append(f"[x_proxy]scale='trunc(iw*{scale}/2)*2':'trunc(ih*{scale}/2)*2'[proxy]")
+            args += ['-map', '[proxy]', '-map', '0:a:0?',
+                     '-c:v', 'libx264', '-crf', settings['crf'], '-preset', settings['preset'],
+                     '-c:a', 'aac', '-b:a', settings['audio_bitrate'],
+                     '-map_metadata', '0', '-movflags', '+faststart']
+        elif name == 'poster':
+            start = float(settings['time'])
+            if duration:
+                if start >= duration:
+                    start = duration / 2
+                chains.append(f"[x_poster]trim=start={start:g},setpts=PTS-STARTPTS[poster]")
+                args += ['-map', '[poster]', '-frames:v', '1']
+            else:
+                # 时长未知时剪辑可能比 time 短：每秒写一帧并覆盖，保留 time 之前的最后一帧
+                chains.append(f"[x_poster]{_every(1)},trim=end={start + 1:g}[poster]")
+                args += ['-map', '[poster]']
+            args += ['-q:v', settings['quality'], '-update', '1']
+        elif name == 'sprite':
+            frames = settings['columns'] * settings['rows']
+            interval = duration / frames if duration else settings['interval']
+            chains.append(f"[x_sprite]{_every(interval)},scale={settings['width']}:-2,"
+                          f"tile={settings['columns']}x{settings['rows']}[sprite]")
+            args += ['-map', '[sprite]', '-frames:v', '1', '-q:v', settings['quality'], '-update', '1']
+        args += ['-y', str(files[name])]
+    return chains, args
+
+def set_creation_timestamps(input_file, output_file):
+    """
+    Set the output file's timestamps to the original creation datetime
+    """
+    try:
+        # First try to get creation date from metadata using exiftool
+        creation_time = None
+        exiftool_path = get_exiftool_path()
+
+        if exiftool_path:
+            try:
+                cmd = [exiftool_path, '-CreateDate', '-s3', str(input_file)]
+                with tracing.span('read_create_date'):
+                    exif_result = exiftool.run(cmd)
+                if exif_result.returncode == 0 and exif_result.stdout.strip():
+                    # Parse creation date (format: YYYY:MM:DD HH:MM:SS)
+                    from datetime import datetime
+                    date_str = exif_result.stdout.strip()
+                    creation_time = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S').timestamp()
+            except Exception:
+                pass
+
+        # Fallback to original file modification time if metadata extraction fails
+        if creation_time is None:
+            original_stat = input_file.stat()
+            creation_time = original_stat.st_mtime
+
+        # Set both access time and modification time to creation time
+        # This ensures modify datetime matches create datetime
+        os.utime(output_file, (creation_time, creation_time))
+
+        # Format timestamp for display
+        from datetime import datetime
+        formatted_time = datetime.fromtimestamp(creation_time).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"  [OK] File timestamps set to creation date: {formatted_time}")
+
+    except Exception as e:
+        print(f"  [WARNING] Could not set timestamps: {e}")
+
+def transcode(input_file, output_file, video_info, quality_level, use_hevc, stager=None, targets=None):
+    """
+    Encode one MOV file to MP4, copy its metadata and set its timestamps
+
+    Extra outputs (proxy, poster, sprite) are written by the same ffmpeg
+    process from a split of the decoded video, next to the MP4.
+
+    Args:
+        input_file (Path): Path to the input MOV file
+        output_file (Path): Path of the MP4 file to write
+        video_info (dict): get_video_info() result (None if probing failed)
+        quality_level (str): Key of QUALITY_SETTINGS
+        use_hevc (bool): Encode H.265/HEVC instead of H.264
+        stager (staging.Stager): Read the input from its staged local copy and write
+                                 the output to scratch (moved out by a later step)
+        targets (dict): Extra outputs, see output_targets()
+
+    Returns:
+        dict: The chosen 'video_codec' and 'audio_codec' ('copy' or the encoder)
+              and the file names of the 'extra_outputs' that were written
+
+    Raises:
+        RuntimeError: ffmpeg failed or did not create the output file
+    """
+    ffmpeg_path = get_ffmpeg_path()
+
+    # With staging, ffmpeg and exiftool work on local files instead of the share
+    source, target = input_file, output_file
+    extra_files = extra_output_files(input_file, output_file.parent, targets or {})
+    if stager is not None:
+        source = stager.local(input_file)
+        target = stager.output_path(output_file)
+        extra_files = {name: stager.output_path(path) for name, path in extra_files.items()}
+
+    if video_info:
+        print(f"  Source codec: {video_info['video_codec']} @ {video_info['video_bitrate'] / 1_000_000:.1f} Mbps")
+        print(f"  Audio codec: {video_info['audio_codec']} @ {video_info['audio_bitrate'] / 1000:.0f} kbps")
+        print(f"  Resolution: {video_info['width']}x{video_info['height']}")
+
+    # Remove existing output file if it exists (with retry for Windows file locking)
+    if target.exists():
+        try:
+            target.unlink()
+        except PermissionError:
+            print(f"  [WARNING] Could not delete existing {output_file.name}, ffmpeg will overwrite it")
+    for path in extra_files.values():
+        if path.exists():
+            path.unlink()
+
+    # Get quality settings
+    quality_config = QUALITY_SETTINGS.get(quality_level, QUALITY_SETTINGS['medium'])
+    video_codec_args, audio_codec_args = choose_codecs(video_info, quality_config, use_hevc)
+
     # Build optimized ffmpeg command
     cmd = [
         ffmpeg_path,
-        '-i', str(input_file),
+        '-i', str(source),
         '-threads', '0',                 # Use all available CPU cores
     ]
 
+    # Extra outputs: decode once and split the frames between the encoders
+    extra_args = []
+    if extra_files:
+        chains, extra_args = extra_output_args(targets, extra_files, video_info)
+        branches = [f"x_{name}" for name in extra_files]
+        if video_codec_args[1] != 'copy':
+            branches.insert(0, 'main')
+        split = f"[0:v:0]split={len(branches)}" + ''.join(f"[{branch}]" for branch in branches)
+        cmd.extend(['-filter_complex', ';'.join([split] + chains),
+                    '-map', '[main]' if 'main' in branches else '0:v:0', '-map', '0:a:0?'])
+
     # Add video encoding args
     cmd.extend(video_codec_args)
 
@@ -432,169 +722,356 @@ def convert_mov_to_mp4(input_file, output_folder):
         '-movflags', '+faststart',       # Optimize for streaming
         '-avoid_negative_ts', 'make_zero', # Fix timestamp issues
         '-fflags', '+genpts',            # Generate presentation timestamps
-        '-y', str(output_file)
+        '-y', str(target)
     ])
+    cmd.extend(extra_args)
 
-    try:
-        print(f"Converting {input_file.name} to {output_file.name}...")
-
-        # Get video duration first for percentage calculation
-        duration_cmd = [ffmpeg_path, '-i', str(input_file), '-f', 'null', '-']
-        duration_result = subprocess.run(duration_cmd, capture_output=True, text=True)
-        duration_seconds = 0
-        duration_output = duration_result.stderr if duration_result.stderr else duration_result.stdout
-        for line in duration_output.split('\n'):
-            if 'Duration:' in line:
-                duration_str = line.split('Duration: ')[1].split(',')[0]
-                time_parts = duration_str.split(':')
-                if len(time_parts) == 3:
-                    hours, minutes, seconds = time_parts
-                    duration_seconds = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-                break
+    print(f"Converting {input_file.name} to {output_file.name}...")
 
-        # Simple progress monitoring using stderr parsing
-        import time
-        import threading
-        import re
+    # Duration for the percentage: from the probe, otherwise from the
+    # "Duration:" line ffmpeg prints before encoding (no separate decode pass)
+    duration_seconds = video_info['duration'] if video_info else 0
 
-        start_time = time.time()
+    # Simple progress monitoring using stderr parsing
+    import time
+    import re
 
-        try:
-            print(f"  Progress: Starting conversion...", flush=True)
-
-            # Run ffmpeg with simple output
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                     text=True, universal_newlines=True, bufsize=1)
-
-            # Monitor output for progress information
-            last_update_time = time.time()
-
-            for line in iter(process.stdout.readline, ''):
-                current_time = time.time()
-
-                # Look for time progress in ffmpeg output
-                time_match = re.search(r'time=(\d+):(\d+):(\d+)\.(\d+)', line)
-                if time_match and current_time - last_update_time > 2.0:  # Update every 2 seconds
-                    hours, minutes, seconds, centiseconds = time_match.groups()
-                    current_seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(centiseconds) / 100
-
-                    # Calculate percentage
-                    percentage = 0
-                    if duration_seconds > 0:
-                        percentage = min(100, (current_seconds / duration_seconds) * 100)
-
-                    # Look for speed in the same line
-                    speed_match = re.search(r'speed=\s*(\S+)', line)
-                    speed = speed_match.group(1) if speed_match else 'N/A'
-
-                    # Create simple progress display
-                    if percentage > 0:
-                        filled = int(percentage / 5)  # 20 chars
-                        progress_bar = f"[{'#' * filled}{'.' * (20 - filled)}] {percentage:5.1f}%"
-
-                        # Calculate ETA
-                        elapsed = current_time - start_time
-                        if percentage > 1:
-                            eta_seconds = (elapsed / percentage) * (100 - percentage)
-                            eta_min = int(eta_seconds // 60)
-                            eta_sec = int(eta_seconds % 60)
-                            eta = f"{eta_min:02d}:{eta_sec:02d}"
-                        else:
-                            eta = "N/A"
-
-                        current_time_str = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
-
-                        progress_text = f"\r  {progress_bar} | Time: {current_time_str}"
-                        if speed != 'N/A':
-                            progress_text += f" | Speed: {speed}"
-                        if eta != "N/A":
-                            progress_text += f" | ETA: {eta}"
-
-                        print(progress_text, end='', flush=True)
-                        last_update_time = current_time
-
-                # Show dots for activity even without time updates
-                elif current_time - last_update_time > 5.0:
-                    print(".", end='', flush=True)
-                    last_update_time = current_time
+    start_time = time.time()
 
-            print()  # New line after progress
+    print(f"  Progress: Starting conversion...", flush=True)
 
-            # Wait for process completion
-            process.wait()
+    with tracing.span('encode', video=' '.join(video_codec_args[:2]),
+                      audio=' '.join(audio_codec_args[:2])) as encode_span:
+        encode_span.add('bytes_in', source.stat().st_size)
 
-            if process.returncode == 0:
-                print(f"  [OK] Conversion completed successfully!")
-            else:
-                print(f"  [ERROR] Conversion failed (exit code: {process.returncode})")
-                return result
+        # Run ffmpeg with simple output
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 text=True, universal_newlines=True, bufsize=1)
 
-        except Exception as e:
-            print(f"  [ERROR] Error during conversion: {e}")
-            return result
+        # Monitor output for progress information
+        last_update_time = time.time()
 
+        for line in iter(process.stdout.readline, ''):
+            current_time = time.time()
 
-        # Preserve additional metadata using exiftool
-        preserve_metadata(input_file, output_file)
+            if not duration_seconds and 'Duration:' in line:
+                duration_match = re.search(r'Duration: (\d+):(\d+):([\d.]+)', line)
+                if duration_match:
+                    hours, minutes, seconds = duration_match.groups()
+                    duration_seconds = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
 
-        # Set file timestamps to match original creation datetime
-        if output_file.exists():
-            try:
-                # First try to get creation date from metadata using exiftool
-                creation_time = None
-                exiftool_path = get_exiftool_path()
-
-                if exiftool_path:
-                    try:
-                        cmd = [exiftool_path, '-CreateDate', '-s3', str(input_file)]
-                        exif_result = subprocess.run(cmd, capture_output=True, text=True)
-                        if exif_result.returncode == 0 and exif_result.stdout.strip():
-                            # Parse creation date (format: YYYY:MM:DD HH:MM:SS)
-                            from datetime import datetime
-                            date_str = exif_result.stdout.strip()
-                            creation_time = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S').timestamp()
-                    except Exception:
-                        pass
-
-                # Fallback to original file modification time if metadata extraction fails
-                if creation_time is None:
-                    original_stat = input_file.stat()
-                    creation_time = original_stat.st_mtime
-
-                # Set both access time and modification time to creation time
-                # This ensures modify datetime matches create datetime
-                os.utime(output_file, (creation_time, creation_time))
-
-                # Format timestamp for display
-                from datetime import datetime
-                formatted_time = datetime.fromtimestamp(creation_time).strftime('%Y-%m-%d %H:%M:%S')
-                print(f"  [OK] File timestamps set to creation date: {formatted_time}")
-
-            except Exception as e:
-                print(f"  [WARNING] Could not set timestamps: {e}")
-
-        # Get file sizes and show results
-        if output_file.exists():
-            result['original_size'] = input_file.stat().st_size
-            result['converted_size'] = output_file.stat().st_size
-            reduction = (1 - result['converted_size'] / result['original_size']) * 100
-
-            print(f"  Original size: {result['original_size'] / (1024*1024):.1f} MB")
-            print(f"  New size: {result['converted_size'] / (1024*1024):.1f} MB")
-            print(f"  Size reduction: {reduction:.1f}%")
-
-            # Compare metadata
-            result['metadata_comparison'] = compare_metadata(input_file, output_file)
-            result['success'] = True
+            fps_match = re.search(r'fps=\s*([\d.]+)', line)
+            if fps_match:
+                metrics.ENCODE_FPS.set(float(fps_match.group(1)))
+
+            # Look for time progress in ffmpeg output
+            time_match = re.search(r'time=(\d+):(\d+):(\d+)\.(\d+)', line)
+            if time_match and current_time - last_update_time > 2.0:  # Update every 2 seconds
+                hours, minutes, seconds, centiseconds = time_match.groups()
+                current_seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(centiseconds) / 100
+
+                # Calculate percentage
+                percentage = 0
+                if duration_seconds > 0:
+                    percentage = min(100, (current_seconds / duration_seconds) * 100)
+
+                # Look for speed in the same line
+                speed_match = re.search(r'speed=\s*(\S+)', line)
+                speed = speed_match.group(1) if speed_match else 'N/A'
+
+                # Create simple progress display
+                if percentage > 0:
+                    filled = int(percentage / 5)  # 20 chars
+                    progress_bar = f"[{'#' * filled}{'.' * (20 - filled)}] {percentage:5.1f}%"
+
+                    # Calculate ETA
+                    elapsed = current_time - start_time
+                    if percentage > 1:
+                        eta_seconds = (elapsed / percentage) * (100 - percentage)
+                        eta_min = int(eta_seconds // 60)
+                        eta_sec = int(eta_seconds % 60)
+                        eta = f"{eta_min:02d}:{eta_sec:02d}"
+                    else:
+                        eta = "N/A"
+
+                    current_time_str = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
+
+                    progress_text = f"\r  {progress_bar} | Time: {current_time_str}"
+                    if speed != 'N/A':
+                        progress_text += f" | Speed: {speed}"
+                    if eta != "N/A":
+                        progress_text += f" | ETA: {eta}"
+
+                    print(progress_text, end='', flush=True)
+                    last_update_time = current_time
+
+            # Show dots for activity even without time updates
+            elif current_time - last_update_time > 5.0:
+                print(".", end='', flush=True)
+                last_update_time = current_time
+
+        print()  # New line after progress
+
+        # Wait for process completion
+        process.wait()
+        metrics.ENCODE_FPS.set(0)
+        if target.exists():
+            encode_span.add('bytes_out', target.stat().st_size)
+
+    if process.returncode != 0:
+        print(f"  [ERROR] Conversion failed (exit code: {process.returncode})")
+        raise RuntimeError(f'ffmpeg exit code {process.returncode}')
+    if not target.exists():
+        print(f"  [ERROR] Output file was not created")
+        raise RuntimeError('output file was not created')
+    print(f"  [OK] Conversion completed successfully!")
+    if video_codec_args[1] != 'copy':
+        record_encode(video_codec_args[1], quality_config, time.time() - start_time, video_info,
+                      source.stat().st_size, target.stat().st_size)
+
+    # Preserve additional metadata using exiftool
+    preserve_metadata(source, target)
+
+    # Set file timestamps to match original creation datetime
+    set_creation_timestamps(source, target)
+
+    # Extra outputs get the same timestamps as the MP4
+    written = {}
+    target_stat = target.stat()
+    for name, path in extra_files.items():
+        if path.exists():
+            os.utime(path, ns=(target_stat.st_atime_ns, target_stat.st_mtime_ns))
+            written[name] = path.name
+        else:
+            print(f"  [WARNING] {name} output was not created: {path.name}")
+
+    if video_info:
+        record_output(output_file, video_info['duration'], conversion_settings(quality_level, use_hevc))
+    return {'video_codec': video_codec_args[1], 'audio_codec': audio_codec_args[1], 'extra_outputs': written}
+
+def link_output(existing_file, output_file, targets=None):
+    """
+    Hard-link (or copy) an existing MP4 and its extra outputs as the output of a duplicate clip
+
+    Returns:
+        dict: Like transcode(), with 'link' as codecs and the MP4 it is a 'duplicate_of'
+    """
+    existing_file = Path(existing_file)
+    existing_extras = extra_output_files(existing_file, existing_file.parent, targets or {})
+    pairs = [(existing_file, output_file)]
+    written = {}
+    for name, path in extra_output_files(output_file, output_file.parent, targets or {}).items():
+        if existing_extras[name].exists():
+            pairs.append((existing_extras[name], path))
+            written[name] = path.name
         else:
-            print(f"  [ERROR] Output file was not created")
+            print(f"  [WARNING] {name} output of {existing_file.name} is missing: {path.name} was not created")
+
+    for source, destination in pairs:
+        if destination.exists():
+            if os.path.samefile(source, destination):
+                continue
+            destination.unlink()
+        try:
+            os.link(source, destination)
+        except OSError:
+            # 跨卷或文件系统不支持硬链接时复制
+            shutil.copy2(source, destination)
+    print(f"  [OK] {output_file.name} linked to {existing_file.name}")
+    return {'video_codec': 'link', 'audio_codec': 'link', 'extra_outputs': written,
+            'duplicate_of': str(existing_file)}
+
+def publish_outputs(stager, destinations):
+    """Move the outputs written to scratch to their destinations"""
+    for destination in destinations:
+        stager.publish(stager.output_path(destination), destination)
+
+def add_conversion(graph, input_file, output_folder, quality_level=None, use_hevc=None, stager=None,
+                   extra_outputs=None, plan=None, after=()):
+    """
+    Add the steps converting one MOV file to a job graph
+
+    probe -> transcode (encode, metadata, timestamps) -> verify, with the
+    backup copy running alongside. With staging, the backup is copied from
+    the staged input after the transcode and a publish step moves the MP4
+    (and extra outputs) out of scratch. probe, transcode and verify are
+    memoized on the file content and quality settings, so re-running a
+    batch skips files whose MP4 is already up to date. With a plan from
+    plan_batch() the probe is skipped and the transcode is prioritized by its
+    expected time, so the longest encodes start first. A plan marked as a
+    duplicate (find_duplicates()) gets a link step instead of the transcode.
+
+    Args:
+        graph (jobs.Graph): Graph to add the steps to
+        input_file (Path): Path to the input MOV file
+        output_folder (Path): Folder for the output MP4 file and the backup
+        quality_level (str): Key of QUALITY_SETTINGS (default: QUALITY_LEVEL)
+        use_hevc (bool): Encode H.265/HEVC instead of H.264 (default: USE_HEVC)
+        stager (staging.Stager): Stage the input and output on local scratch
+        extra_outputs: Extra outputs of the same encode, see output_targets() (default: EXTRA_OUTPUTS)
+        plan (dict): estimate_conversion() result for this file
+        after (iterable): Steps to wait for before converting, e.g. the conversion of the clip this one duplicates
+
+    Returns:
+        dict: Step name -> jobs.Step, for conversion_result()
+    """
+    if quality_level is None:
+        quality_level = QUALITY_LEVEL
+    if use_hevc is None:
+        use_hevc = USE_HEVC
+    if extra_outputs is None:
+        extra_outputs = EXTRA_OUTPUTS
+    output_file = output_folder / input_file.with_suffix('.MP4').name
+    targets = output_targets(extra_outputs)
+    outputs = [output_file, *extra_output_files(input_file, output_folder, targets).values()]
+    settings = {'quality': QUALITY_SETTINGS.get(quality_level, QUALITY_SETTINGS['medium']), 'hevc': use_hevc}
+    if targets:
+        settings['outputs'] = targets
+
+    steps = {}
+    if plan is None:
+        probe = steps['probe'] = graph.add('probe', get_video_info, input_file, resource='io',
+                                           file=input_file.name, files=[input_file])
+    else:
+        probe = plan['video_info']
+    duplicate = plan.get('duplicate_of') if plan else None
+    if duplicate is not None:
+        # 同一片段已经转换过：链接已有的 MP4 (及附加输出)，不再编码
+        convert = steps['link'] = graph.add('link', link_output, duplicate, output_file, targets, resource='io',
+                                            after=after, file=input_file.name)
+    else:
+        convert = steps['transcode'] = graph.add(
+            'transcode', transcode, input_file, output_file, probe, quality_level, use_hevc, stager, targets,
+            resource='encode', after=after, file=input_file.name, files=[input_file], outputs=outputs,
+            params=settings, priority=plan['seconds'] if plan else 0)
+    # 暂存时备份在编码之后从本地副本复制，源文件只从共享读取一次
+    steps['backup'] = backup = graph.add('backup', create_backup, input_file, output_folder, stager, resource='io',
+                                         after=[convert] if stager is not None else (), file=input_file.name)
+    if stager is not None and duplicate is None:
+        # 输出从本地暂存目录移到目标文件夹，与下一个文件的编码并行
+        steps['publish'] = graph.add('publish', publish_outputs, stager, outputs,
+                                     resource='io', after=[convert], file=input_file.name)
+    verify_params = {'fields': VERIFY_FIELDS, 'decode': VERIFY_DECODE}
+    if duplicate is not None:
+        verify_params['duplicate'] = DUPLICATE_FIELDS
+    steps['verify'] = graph.add('verify', verify_output, input_file, output_file, probe, VERIFY_DECODE,
+                                duplicate is not None, resource='subprocess',
+                                after=[steps.get('publish', convert), backup], file=input_file.name,
+                                files=[input_file, output_file], params=verify_params)
+    return steps
+
+def conversion_result(input_file, output_folder, steps, video_info=None):
+    """
+    Result of a conversion added with add_conversion(), after the graph has run
+
+    video_info is the planned probe result when add_conversion() had a plan.
+
+    A conversion whose output fails verification (verify_output()) is reported as failed;
+    the links of a duplicate that fails it are removed, so no other recording is left in its place.
+
+    Returns:
+        dict: Conversion results with the verification ('metadata_comparison'), the chosen
+              'video_codec'/'audio_codec' ('copy', the encoder or 'link' for a
+              duplicate, with the MP4 it is a 'duplicate_of'), the
+              'extra_outputs' written (name -> file name), per-step
+              'timings' (seconds), the 'cached' steps and an 'error' message
+              when the conversion failed
+    """
+    output_file = output_folder / input_file.with_suffix('.MP4').name
+    convert = steps['link'] if 'link' in steps else steps['transcode']
+    codecs = convert.result or {}
+    result = {
+        'success': False,
+        'input_file': input_file.name,
+        'original_size': 0,
+        'converted_size': 0,
+        'backup_created': bool(steps['backup'].result),
+        'metadata_comparison': steps['verify'].result,
+        'video_info': steps['probe'].result if 'probe' in steps else video_info,
+        'video_codec': codecs.get('video_codec'),
+        'audio_codec': codecs.get('audio_codec'),
+        'extra_outputs': codecs.get('extra_outputs', {}),
+        'duplicate_of': codecs.get('duplicate_of'),
+        'timings': {name: round(step.seconds, 6) for name, step in steps.items()},
+        'cached': [name for name, step in steps.items() if step.status == 'cached'],
+        'error': None
+    }
 
+    if not convert.ok:
+        print(f"  [ERROR] {input_file.name}: {convert.error}")
+        result['error'] = convert.error
+        return result
+    if not output_file.exists():
+        print(f"  [ERROR] {input_file.name}: output file was not created")
+        result['error'] = 'output file was not created'
         return result
 
-    except Exception as e:
-        print(f"  [ERROR] Error during conversion: {e}")
+    verification = steps['verify'].result or {}
+    if verification.get('problems'):
+        error = 'verification failed: ' + '; '.join(verification['problems'])
+        if result['duplicate_of']:
+            for path in [output_file, *(output_folder / name for name in result['extra_outputs'].values())]:
+                path.unlink(missing_ok=True)
+            error += ' (not a duplicate: convert it with --no-dedupe)'
+        print(f"  [ERROR] {input_file.name}: {error}")
+        result['error'] = error
         return result
 
+    # Get file sizes and show results
+    result['original_size'] = input_file.stat().st_size
+    result['converted_size'] = output_file.stat().st_size
+    reduction = (1 - result['converted_size'] / result['original_size']) * 100
+
+    if result['duplicate_of']:
+        print(f"{input_file.name} (duplicate of {Path(result['duplicate_of']).name}):")
+    else:
+        print(f"{input_file.name}{' (up to date)' if 'transcode' in result['cached'] else ''}:")
+    print(f"  Original size: {result['original_size'] / (1024*1024):.1f} MB")
+    print(f"  New size: {result['converted_size'] / (1024*1024):.1f} MB")
+    print(f"  Size reduction: {reduction:.1f}%")
+    metrics.COMPRESSION_RATIO.observe(result['converted_size'] / result['original_size'])
+    result['success'] = True
+    return result
+
+def convert_mov_to_mp4(input_file, output_folder, quality_level=None, use_hevc=None, extra_outputs=None):
+    """
+    Convert a single MOV file to MP4 with size reduction and metadata preservation
+
+    Args:
+        input_file (Path): Path to the input MOV file
+        output_folder (Path): Folder for the output MP4 file
+        quality_level (str): Key of QUALITY_SETTINGS (default: QUALITY_LEVEL)
+        use_hevc (bool): Encode H.265/HEVC instead of H.264 (default: USE_HEVC)
+        extra_outputs: Proxy, poster and/or sprite made from the same decode, e.g.
+                       ['proxy', 'poster'] or {'poster': {'time': 5}} (default: EXTRA_OUTPUTS)
+
+    Returns:
+        dict: See conversion_result()
+    """
+    error = check_input(input_file)
+    if error:
+        return {
+            'success': False, 'input_file': input_file.name, 'original_size': 0, 'converted_size': 0,
+            'backup_created': False, 'metadata_comparison': None, 'video_info': None,
+            'video_codec': None, 'audio_codec': None, 'extra_outputs': {}, 'duplicate_of': None,
+            'timings': {}, 'cached': [], 'error': error
+        }
+
+    print(f"Analyzing {input_file.name}...")
+    graph = jobs.Graph()
+    steps = add_conversion(graph, input_file, output_folder, quality_level, use_hevc, extra_outputs=extra_outputs)
+    graph.run()
+    return conversion_result(input_file, output_folder, steps)
+
+def convert_file(input_file, output_folder, quality_level=None, use_hevc=None, extra_outputs=None):
+    """convert_mov_to_mp4() inside the per-file 'mov2mp4' span (stage timings and metrics)"""
+    with tracing.span('mov2mp4', file=input_file.name) as file_span:
+        result = convert_mov_to_mp4(input_file, output_folder, quality_level, use_hevc, extra_outputs)
+        file_span.set('success', result['success'])
+        file_span.add('bytes_in', result['original_size'])
+        file_span.add('bytes_out', result['converted_size'])
+    return result
+
 def print_metadata_comparison(comparison, filename):
     """
     Print metadata comparison results
@@ -614,6 +1091,250 @@ def print_metadata_comparison(comparison, filename):
         for diff in comparison['different'][:2]:  # Show first 2 differences
             print(f"      {diff['field']}: {diff['source']} -> {diff['target']}")
 
+_costs_lock = threading.Lock()
+
+def cost_key(video_codec, quality_config):
+    """Cost model entry for an encoder and quality setting, e.g. 'libx264/slow/crf18'"""
+    return f"{video_codec}/{quality_config['preset']}/crf{quality_config['crf']}"
+
+def load_costs():
+    """Measured encodes: cost_key -> [[seconds, megapixel-seconds, bytes in, bytes out], ...]"""
+    path = cache_path('mov2mp4-costs.json')
+    if path is None:
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def record_encode(video_codec, quality_config, seconds, video_info, bytes_in, bytes_out):
+    """Add one measured encode to the cost model"""
+    path = cache_path('mov2mp4-costs.json')
+    if path is None:
+        return
+    work = video_info['width'] * video_info['height'] * video_info['duration'] / 1e6 if video_info else 0
+    with _costs_lock:
+        costs = load_costs()
+        samples = costs.setdefault(cost_key(video_codec, quality_config), [])
+        samples.append([round(seconds, 3), round(work, 3), bytes_in, bytes_out])
+        del samples[:-COST_HISTORY]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(costs, f)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+def estimate_conversion(input_file, video_info, quality_level, use_hevc, costs):
+    """
+    Expected codec decisions, encode time and MP4 size of one file
+
+    Returns:
+        dict: 'file', 'size', 'video_info', 'video'/'audio' ('copy' or the encoder),
+              'seconds', 'output_size' and 'measured' (estimate from past runs)
+    """
+    quality_config = QUALITY_SETTINGS.get(quality_level, QUALITY_SETTINGS['medium'])
+    video_codec_args, audio_codec_args = choose_codecs(video_info, quality_config, use_hevc, quiet=True)
+    size = input_file.stat().st_size
+    plan = {
+        'file': input_file, 'size': size, 'video_info': video_info,
+        'video': video_codec_args[1], 'audio': audio_codec_args[1],
+        'seconds': size / COPY_SPEED, 'output_size': size, 'measured': False
+    }
+    if plan['video'] == 'copy':
+        return plan
+
+    work = video_info['width'] * video_info['height'] * video_info['duration'] / 1e6 if video_info else 0
+    samples = costs.get(cost_key(plan['video'], quality_config), [])
+    timed = [sample for sample in samples if sample[1] > 0]
+    if timed and work:
+        plan['seconds'] = work * sum(sample[0] for sample in timed) / sum(sample[1] for sample in timed)
+    elif samples and not work:
+        # 分辨率或时长未知时按源文件大小估算
+        plan['seconds'] = size * sum(sample[0] for sample in samples) / max(1, sum(sample[2] for sample in samples))
+    else:
+        speed = DEFAULT_ENCODE_SPEED.get(plan['video'], {}).get(quality_config['preset'], 0.5)
+        # 未知分辨率时假定约 1 MB 源数据对应 1 百万像素秒
+        plan['seconds'] = speed * (work or size / 1e6)
+    if samples:
+        plan['output_size'] = int(size * sum(sample[3] for sample in samples) / max(1, sum(sample[2] for sample in samples)))
+        plan['measured'] = True
+    else:
+        plan['output_size'] = int(size * DEFAULT_SIZE_RATIO.get(quality_config['crf'], 0.4))
+    return plan
+
+def plan_batch(target_files, quality_level=None, use_hevc=None, output_folder=None):
+    """
+    Probe all files in parallel and estimate each conversion
+
+    The probes are memoized steps of the same name as in add_conversion(),
+    so the conversion graph reuses them. With an output_folder (and
+    DEDUPLICATE), duplicate clips are marked by find_duplicates().
+
+    Returns:
+        list: estimate_conversion() results, longest first (duplicates last)
+    """
+    if quality_level is None:
+        quality_level = QUALITY_LEVEL
+    if use_hevc is None:
+        use_hevc = USE_HEVC
+    graph = jobs.Graph()
+    probes = [(input_file, graph.add('probe', get_video_info, input_file, resource='io',
+                                     file=input_file.name, files=[input_file]))
+              for input_file in target_files]
+    graph.run()
+    costs = load_costs()
+    plans = [estimate_conversion(input_file, probe.result, quality_level, use_hevc, costs)
+             for input_file, probe in probes]
+    plans.sort(key=lambda plan: plan['seconds'], reverse=True)
+    if output_folder is not None and DEDUPLICATE:
+        find_duplicates(plans, output_folder, conversion_settings(quality_level, use_hevc))
+        plans.sort(key=lambda plan: plan['seconds'], reverse=True)
+    return plans
+
+_index_lock = threading.Lock()
+
+def conversion_settings(quality_level, use_hevc):
+    """Short key of the encode settings; only MP4s made with the same settings are linked to duplicates"""
+    import hashlib
+    quality_config = QUALITY_SETTINGS.get(quality_level, QUALITY_SETTINGS['medium'])
+    payload = json.dumps({'quality': quality_config, 'hevc': use_hevc}, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+def load_output_index(settings):
+    """Converted MP4s that still exist and were made with the given settings: [{'output', 'duration', 'settings'}]"""
+    path = cache_path(OUTPUT_INDEX)
+    if path is None:
+        return []
+    entries = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                # 同一输出转换多次时以最后一次为准
+                entries[entry.get('output')] = entry
+    except OSError:
+        return []
+    return [entry for output, entry in entries.items()
+            if output and entry.get('settings') == settings and entry.get('duration') and os.path.exists(output)]
+
+def record_output(output_file, duration, settings):
+    """Add a converted MP4 to the index of outputs searched for duplicates"""
+    path = cache_path(OUTPUT_INDEX)
+    if path is None or not duration:
+        return
+    line = json.dumps({'output': str(Path(output_file).resolve()), 'duration': duration, 'settings': settings},
+                      ensure_ascii=False)
+    with _index_lock:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError:
+            pass
+
+def fingerprint_video(video_file, duration):
+    """video_fingerprint.compute() with the bundled ffmpeg and the capture time of the file"""
+    video_info = get_video_info(video_file)
+    capture_time = video_info.get('capture_time') if video_info else None
+    return video_fingerprint.compute(get_ffmpeg_path(), video_file, duration, capture_time)
+
+def find_duplicates(plans, output_folder, settings):
+    """
+    Mark the plans of clips that duplicate another input of the batch or an already converted MP4
+
+    Only clips whose duration matches another clip's are fingerprinted
+    (video_fingerprint), in parallel memoized steps. The plan of a duplicate
+    gets 'duplicate_of' (the MP4 to link: an indexed output, or the output of
+    the first input in plan order it duplicates), and the link replaces its
+    encode in the time and size estimates.
+    """
+    same_duration = video_fingerprint.same_duration
+
+    def duration(plan):
+        return plan['video_info']['duration'] if plan['video_info'] else None
+
+    def output_of(plan):
+        return output_folder / plan['file'].with_suffix('.MP4').name
+
+    timed = [plan for plan in plans if duration(plan)]
+    # 本批次的输出即将被重写，只通过批内匹配链接
+    batch_outputs = {str(output_of(plan).resolve()) for plan in plans}
+    indexed = [entry for entry in load_output_index(settings) if entry['output'] not in batch_outputs]
+    candidates = [plan for plan in timed
+                  if any(other is not plan and same_duration(duration(plan), duration(other)) for other in timed)
+                  or any(same_duration(duration(plan), entry['duration']) for entry in indexed)]
+    if not candidates:
+        return
+    indexed = [entry for entry in indexed
+               if any(same_duration(entry['duration'], duration(plan)) for plan in candidates)]
+
+    graph = jobs.Graph()
+
+    def add(video_file, seconds):
+        return graph.add('fingerprint', fingerprint_video, video_file, seconds, resource='subprocess',
+                         file=Path(video_file).name, files=[video_file],
+                         params={'duration': seconds, 'samples': video_fingerprint.SAMPLES})
+
+    inputs = [(plan, add(plan['file'], duration(plan))) for plan in candidates]
+    existing = [(Path(entry['output']), add(entry['output'], entry['duration'])) for entry in indexed]
+    graph.run()
+
+    originals = []
+    for plan, step in inputs:
+        if not step.ok:
+            continue
+        match = next((output for output, other in existing
+                      if other.ok and video_fingerprint.matches(step.result, other.result)), None)
+        if match is None:
+            match = next((output_of(original) for original, other in originals
+                          if video_fingerprint.matches(step.result, other.result)), None)
+        if match is None:
+            originals.append((plan, step))
+            continue
+        plan.update(duplicate_of=match, video='link', audio='link', seconds=0.0, output_size=0)
+
+def batch_time(plans, workers):
+    """Expected wall time of running the plans longest-first on `workers` encoders"""
+    import heapq
+    finish = [0.0] * max(1, workers)
+    for plan in plans:
+        heapq.heapreplace(finish, finish[0] + plan['seconds'])
+    return max(finish)
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def print_plan(plans, workers):
+    """Print the per-file decisions and the expected totals of a batch"""
+    print(f"{'File':<32} {'Resolution':>10} {'Length':>8}  {'Video':<8} {'Audio':<5} {'Time':>8} {'Size (MB)':>17}")
+    for plan in plans:
+        info = plan['video_info']
+        resolution = f"{info['width']}x{info['height']}" if info else '?'
+        length = format_duration(info['duration']) if info else '?'
+        sizes = f"{plan['size'] / (1024*1024):.1f} -> {plan['output_size'] / (1024*1024):.1f}"
+        print(f"{plan['file'].name[:32]:<32} {resolution:>10} {length:>8}  {plan['video']:<8} {plan['audio']:<5} "
+              f"{format_duration(plan['seconds']):>8} {sizes:>17}")
+
+    total_size = sum(plan['size'] for plan in plans)
+    total_output = sum(plan['output_size'] for plan in plans)
+    copies = sum(1 for plan in plans if plan['video'] == 'copy')
+    links = sum(1 for plan in plans if plan['video'] == 'link')
+    print(f"\nVideo streams copied: {copies}, re-encoded: {len(plans) - copies - links}, duplicates linked: {links}")
+    print(f"Expected output: {total_output / (1024*1024):.1f} MB of {total_size / (1024*1024):.1f} MB "
+          f"({(total_size - total_output) / (1024*1024):.1f} MB saved)")
+    print(f"Expected time: {format_duration(batch_time(plans, workers))} with {workers} encoder(s)")
+    if any(plan['video'] not in ('copy', 'link') and not plan['measured'] for plan in plans):
+        print("Estimates for settings without past runs are rough guesses; they improve as files are converted")
+
 def convert_all_mov_files():
     """
     Convert all MOV files from source folder to destination folder
@@ -657,6 +1378,19 @@ def convert_all_mov_files():
     print(f"Max bitrate: {QUALITY_SETTINGS[QUALITY_LEVEL]['max_video_bitrate']}")
     print(f"Target codec: {'H.265/HEVC' if USE_HEVC else 'H.264'}")
     print(f"File extensions: {FILE_EXTENSIONS}")
+    if EXTRA_OUTPUTS:
+        print(f"Extra outputs: {', '.join(EXTRA_OUTPUTS)}")
+    if SCRATCH_PATH:
+        print(f"Scratch folder: {SCRATCH_PATH} (limit {SCRATCH_SIZE_GB} GB, read-ahead {READ_AHEAD})")
+    print()
+
+    # Planning: probe every file (in parallel) and estimate its encode time,
+    # so the longest encodes start first and the batch time is known upfront
+    plans = plan_batch(target_files, output_folder=output_folder)
+    if PLAN_ONLY:
+        print_plan(plans, ENCODE_JOBS)
+        return {'success': True, 'results': [], 'plans': plans}
+    print(f"Expected time: {format_duration(batch_time(plans, ENCODE_JOBS))} with {ENCODE_JOBS} encoder(s)")
     print()
 
     results = []
@@ -664,21 +1398,61 @@ def convert_all_mov_files():
     total_converted_size = 0
     successful_conversions = 0
 
-    # Convert each file with progress bar
-    for target_file in tqdm(target_files, desc="Processing files"):
-        result = convert_mov_to_mp4(target_file, output_folder)
+    # All files go into one job graph: probing, backups and metadata checks
+    # of other files run while one file is being encoded
+    graph = jobs.Graph()
+    conversions = {}
+    # Inputs on a network share are copied to local scratch ahead of the encoder
+    stager = None
+    if SCRATCH_PATH:
+        stager = staging.Stager(SCRATCH_PATH, order=[plan['file'] for plan in plans],
+                                size_limit=int(SCRATCH_SIZE_GB * 1024 ** 3), read_ahead=READ_AHEAD)
+    converted = {}
+    for plan in plans:
+        # 批内重复的片段在原片段的 MP4 写到目标文件夹后再链接
+        original = converted.get(plan.get('duplicate_of'))
+        after = [original.get('publish', original['transcode'])] if original else ()
+        steps = add_conversion(graph, plan['file'], output_folder, stager=stager, plan=plan, after=after)
+        converted[output_folder / plan['file'].with_suffix('.MP4').name] = steps
+        conversions[steps['verify']] = (plan, steps)
+
+    # Report each file as soon as its last step is done, with progress bar
+    from tqdm import tqdm
+    progress = tqdm(total=len(target_files), desc="Processing files")
+    metrics.QUEUE_DEPTH.set(len(target_files))
+
+    def file_done(step):
+        if step not in conversions:
+            return
+        plan, steps = conversions[step]
+        if stager is not None:
+            stager.release(plan['file'])
+        result = conversion_result(plan['file'], output_folder, steps, plan['video_info'])
         results.append(result)
 
         if result['success']:
-            successful_conversions += 1
-            total_original_size += result['original_size']
-            total_converted_size += result['converted_size']
-
             # Show metadata comparison
             if result['metadata_comparison']:
                 print_metadata_comparison(result['metadata_comparison'], result['input_file'])
 
         print()  # Add spacing between files
+        progress.update()
+        metrics.QUEUE_DEPTH.set(len(target_files) - len(results))
+
+    try:
+        graph.run(workers={'encode': ENCODE_JOBS}, on_step=file_done)
+    finally:
+        progress.close()
+        if stager is not None:
+            stager.close()
+
+    for result in results:
+        if result['success']:
+            successful_conversions += 1
+            total_original_size += result['original_size']
+            total_converted_size += result['converted_size']
+
+    metrics.QUEUE_DEPTH.set(0)
 
     # Final Summary
     print(f"\n{'='*60}")
@@ -708,8 +1482,55 @@ def convert_all_mov_files():
 
     return {'success': True, 'results': results}
 
+def parse_arguments():
+    """Parse command line arguments (defaults come from the configuration parameters above)."""
+    parser = argparse.ArgumentParser(description='Convert MOV videos to MP4, keeping metadata and backups')
+    parser.add_argument('--source', '-i', default=SOURCE_PATH,
+                        help=f'Source folder for MOV files, relative to this script (default: {SOURCE_PATH})')
+    parser.add_argument('--destination', '-o', default=DESTINATION_PATH,
+                        help=f'Destination folder for MP4 files, relative to this script (default: {DESTINATION_PATH})')
+    parser.add_argument('--quality', default=QUALITY_LEVEL, choices=list(QUALITY_SETTINGS),
+                        help=f'Quality level (default: {QUALITY_LEVEL})')
+    parser.add_argument('--hevc', action=argparse.BooleanOptionalAction, default=USE_HEVC,
+                        help='Encode H.265/HEVC instead of H.264')
+    parser.add_argument('--outputs', nargs='+', default=EXTRA_OUTPUTS, choices=list(OUTPUT_TARGETS), metavar='TARGET',
+                        help='Extra outputs made from the same decode: proxy (720p MP4), poster (JPEG frame), '
+                             'sprite (contact sheet)')
+    parser.add_argument('--poster-time', type=float, default=OUTPUT_TARGETS['poster']['time'],
+                        help=f"Seconds into the clip for the poster frame (default: {OUTPUT_TARGETS['poster']['time']:g})")
+    parser.add_argument('--plan', action='store_true', default=PLAN_ONLY,
+                        help='Only probe the files and show the codec decisions, expected time and space saved')
+    parser.add_argument('--jobs', '-j', type=int, default=ENCODE_JOBS,
+                        help=f'Number of files encoded at the same time, longest first (default: {ENCODE_JOBS})')
+    parser.add_argument('--verify-decode', action=argparse.BooleanOptionalAction, default=VERIFY_DECODE,
+                        help='Also decode the keyframes of each MP4 when verifying it')
+    parser.add_argument('--dedupe', action=argparse.BooleanOptionalAction, default=DEDUPLICATE,
+                        help='Link clips that duplicate an already converted clip instead of encoding them again')
+    parser.add_argument('--scratch', default=SCRATCH_PATH,
+                        help='Local folder to stage inputs and outputs in, for sources on a network share')
+    parser.add_argument('--scratch-size', type=float, default=SCRATCH_SIZE_GB,
+                        help=f'Maximum size of staged inputs in GB (default: {SCRATCH_SIZE_GB})')
+    parser.add_argument('--read-ahead', type=int, default=READ_AHEAD,
+                        help=f'Number of files to stage ahead of the one being encoded (default: {READ_AHEAD})')
+    # --trace/--profile 默认读取 CETC_TRACE/CETC_PROFILE，指标选项同理
+    tracing.add_arguments(parser)
+    metrics.add_arguments(parser)
+    return parser.parse_args()
+
 def main():
     """Main function"""
+    global SOURCE_PATH, DESTINATION_PATH, QUALITY_LEVEL, USE_HEVC, SCRATCH_PATH, SCRATCH_SIZE_GB, READ_AHEAD
+    global EXTRA_OUTPUTS, VERIFY_DECODE, PLAN_ONLY, ENCODE_JOBS, DEDUPLICATE
+    args = parse_arguments()
+    tracing.enable_from_args(args)
+    metrics.enable_from_args(args, 'mov2mp4')
+    SOURCE_PATH, DESTINATION_PATH = args.source, args.destination
+    QUALITY_LEVEL, USE_HEVC = args.quality, args.hevc
+    SCRATCH_PATH, SCRATCH_SIZE_GB, READ_AHEAD = args.scratch, args.scratch_size, args.read_ahead
+    EXTRA_OUTPUTS, VERIFY_DECODE = args.outputs, args.verify_decode
+    PLAN_ONLY, ENCODE_JOBS, DEDUPLICATE = args.plan, max(1, args.jobs), args.dedupe
+    OUTPUT_TARGETS['poster']['time'] = args.poster_time
+
     ffmpeg_path = get_ffmpeg_path()
     if not ffmpeg_path:
         print("Error: ffmpeg.exe not found in bin folder")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import os
+import re
+from datetime import datetime
+
+# Supported ordering modes for merge_images_to_pdf
+ORDER_MODES = ('natural', 'name', 'exif', 'mtime', 'manifest')
+
+# EXIF tag ids used for capture-time ordering
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_DATETIME = 0x0132
+
+_NATURAL_SPLIT = re.compile(r'(\d+)')
+
+
+def natural_sort_key(name):
+    """
+    Build a sort key that orders embedded numbers numerically (page2 < page10).
+
+    Args:
+        name (str): File name to build the key for
+    """
+    parts = _NATURAL_SPLIT.split(name.lower())
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part) for part in parts]
+
+
+def read_exif_datetime(image_path):
+    """
+    Read EXIF DateTimeOriginal (or DateTime) without decoding pixel data.
+
+    Image.open() only parses the file header; the EXIF block lives there,
+    so this stays cheap even for large photos.
+
+    Returns:
+        float: POSIX timestamp, or None if no capture time is available
+    """
+    from PIL import Image  # 只有按 EXIF 排序时才需要 PIL
+
+    try:
+        with Image.open(image_path) as img:
+            exif = img.getexif()
+            value = exif.get_ifd(EXIF_IFD_POINTER).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    except Exception:
+        return None
+
+    if not value:
+        return None
+
+    try:
+        return datetime.strptime(str(value).strip('\x00 ')[:19], '%Y:%m:%d %H:%M:%S').timestamp()
+    except ValueError:
+        return None
+
+
+def read_manifest(manifest_path):
+    """
+    Read an ordering manifest: one file name per line, '#' starts a comment.
+
+    Returns:
+        list: File names in manifest order
+    """
+    names = []
+    with open(manifest_path, 'r', encoding='utf-8') as manifest:
+        for line in manifest:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                names.append(line)
+    return names
+
+
+def build_image_index(input_folder, supported_formats):
+    """
+    Collect image entries from a folder in a single directory scan.
+
+    Args:
+        input_folder (str): Path to folder containing images
+        supported_formats (tuple): Lower-case file extensions to accept
+
+    Returns:
+        list: One dict per image with 'path', 'name' and 'mtime'
+    """
+    entries = []
+    with os.scandir(input_folder) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(supported_formats):
+                entries.append({
+                    'path': entry.path,
+                    'name': entry.name,
+                    'mtime': entry.stat().st_mtime,
+                })
+    return entries
+
+
+def sort_image_index(entries, order_by='natural', manifest_path=None):
+    """
+    Order image entries for page layout.
+
+    Args:
+        entries (list): Entries from build_image_index()
+        order_by (str): One of ORDER_MODES
+        manifest_path (str): Manifest file, required for order_by='manifest'
+
+    Returns:
+        list: Image paths in page order
+    """
+    if order_by not in ORDER_MODES:
+        raise ValueError(f"Unknown order mode '{order_by}', expected one of {', '.join(ORDER_MODES)}")
+
+    if order_by == 'name':
+        ordered = sorted(entries, key=lambda e: e['name'])
+
+    elif order_by == 'natural':
+        ordered = sorted(entries, key=lambda e: natural_sort_key(e['name']))
+
+    elif order_by == 'mtime':
+        ordered = sorted(entries, key=lambda e: (e['mtime'], natural_sort_key(e['name'])))
+
+    elif order_by == 'exif':
+        # Images without a capture time fall back to their modification time
+        for entry in entries:
+            if 'exif_time' not in entry:
+                entry['exif_time'] = read_exif_datetime(entry['path'])
+        ordered = sorted(entries, key=lambda e: (
+            e['exif_time'] if e['exif_time'] is not None else e['mtime'],
+            natural_sort_key(e['name']),
+        ))
+
+    else:
+        if not manifest_path:
+            raise ValueError("order_by='manifest' requires a manifest file")
+        by_name = {e['name']: e for e in entries}
+        ordered = []
+        for name in read_manifest(manifest_path):
+            entry = by_name.pop(os.path.basename(name), None)
+            if entry is None:
+                print(f"  [WARNING] Manifest entry not found: {name}")
+                continue
+            ordered.append(entry)
+        # Images the manifest does not mention go last, in natural order
+        leftovers = sorted(by_name.values(), key=lambda e: natural_sort_key(e['name']))
+        if leftovers:
+            print(f"  [WARNING] {len(leftovers)} image(s) not in manifest, appended at the end")
+        ordered.extend(leftovers)
+
+    return [entry['path'] for entry in ordered]
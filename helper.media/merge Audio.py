@@ -1,63 +1,103 @@
 import os
-from pydub import AudioSegment
-from tqdm import tqdm
-
-# Specify the folder containing the MP4 files
-folder_path = "C:\Clouds\Dropbox\Music\Game\轩辕剑\轩辕剑黄金纪念版CD"
-
-# Get all MP4 files in the folder, sorted alphabetically
-video_files = sorted([os.path.join(folder_path, file) for file in os.listdir(folder_path) if file.endswith(".mp4")])
-# Get all MP3 files in the folder, sorted alphabetically
-audio_files = sorted([os.path.join(folder_path, file) for file in os.listdir(folder_path) if file.endswith(".mp3")])
-
-
-# Get the folder name to use as the output file name
-output_filename = os.path.basename(folder_path) + ".mp3"
-
-# Define the path to the parent directory
-parent_folder_path = os.path.dirname(folder_path)
-output_path = os.path.join(parent_folder_path, output_filename)
-
-# Check if there are MP4 files in the folder
-if not video_files:
-    print("No MP4 files found in the folder.")
-else:
-    # Convert the first MP4 file to MP3 and load it as the initial audio segment
-    merged_audio = AudioSegment.from_file(video_files[0], format="mp4").export("temp_0.mp3", format="mp3")
-    merged_audio = AudioSegment.from_file("temp_0.mp3")
-
-    # Convert and append the rest of the MP4 files with a progress bar
-    for i, file in enumerate(tqdm(video_files[1:], desc="Converting and merging files")):
-        # Convert MP4 to MP3
-        temp_mp3_path = f"temp_{i+1}.mp3"
-        AudioSegment.from_file(file, format="mp4").export(temp_mp3_path, format="mp3")
-        
-        # Load the converted MP3 file and append to merged_audio
-        next_audio = AudioSegment.from_file(temp_mp3_path)
-        merged_audio += next_audio
-        
-        # Clean up the temporary MP3 file
-        os.remove(temp_mp3_path)
-
-    # Export the final merged audio to the parent folder
-    merged_audio.export(output_path, format="mp3")
-
-    print(f"Files have been converted and merged successfully into {output_path}!")
-
-
-# Check if there are MP3 files in the folder
-if not audio_files:
-    print("No MP3 files found in the folder.")
-else:
-    # Load the first MP3 file
-    merged_audio = AudioSegment.from_file(audio_files[0])
-
-    # Append the rest of the MP3 files with a progress bar
-    for file in tqdm(audio_files[1:], desc="Merging files"):
-        next_audio = AudioSegment.from_file(file)
-        merged_audio += next_audio
-
-    # Export the merged audio to the parent folder
-    merged_audio.export(output_path, format="mp3")
-
-    print(f"Files have been merged successfully into {output_path}!")
\ No newline at end of file
+import sys
+import argparse
+from audio_concat import OUTPUT_CODECS, merge_audio_files
+from image_ordering import natural_sort_key
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import metrics, tracing
+
+# File extensions picked up from the input folder
+AUDIO_EXTENSIONS = ('.mp3', '.mp4', '.m4a', '.aac', '.flac', '.wav', '.ogg', '.opus', '.wma')
+
+
+def collect_audio_files(folder_path, extensions=AUDIO_EXTENSIONS, recursive=False):
+    """
+    Collect audio files in natural order (Track2 before Track10, CD1 before CD2)
+
+    Args:
+        folder_path (str): Folder containing the tracks
+        extensions (tuple): Lower-case file extensions to accept
+        recursive (bool): Also descend into sub folders (e.g. one folder per disc)
+
+    Returns:
+        list: Audio file paths in join order
+    """
+    audio_files = []
+    for root, dirs, files in os.walk(folder_path):
+        for file in files:
+            if file.lower().endswith(extensions):
+                audio_files.append(os.path.join(root, file))
+        if not recursive:
+            break
+
+    return sorted(audio_files, key=lambda p: natural_sort_key(os.path.relpath(p, folder_path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge all audio tracks of a folder into a single file')
+    parser.add_argument('folder',
+                        help='Folder containing the tracks to merge')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Output file (default: <folder name>.<format> next to the folder)')
+    parser.add_argument('--format', '-f', default='mp3', choices=[ext.lstrip('.') for ext in OUTPUT_CODECS],
+                        help='Output format when --output is not given (default: mp3)')
+    parser.add_argument('--bitrate', '-b', default='192k',
+                        help='Encoder bitrate for lossy formats (default: 192k)')
+    parser.add_argument('--recursive', '-r', action='store_true',
+                        help='Include tracks in sub folders, e.g. multi-disc sets')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1,
+                        help='Parallel decoders (default: number of CPUs)')
+    parser.add_argument('--gapless', action='store_true',
+                        help='Trim digital silence between tracks')
+    parser.add_argument('--crossfade', type=float, default=0.0,
+                        help='Crossfade between tracks in seconds (default: 0, disabled)')
+    parser.add_argument('--no-copy', action='store_true',
+                        help='Always re-encode, even when inputs could be stream copied')
+    tracing.add_arguments(parser)
+    metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+    tracing.enable_from_args(args)
+    metrics.enable_from_args(args, 'audiomerge')
+
+    folder_path = os.path.normpath(args.folder)
+    if not os.path.isdir(folder_path):
+        print(f"Error: Folder '{folder_path}' does not exist")
+        sys.exit(1)
+
+    # Default output: the folder name, placed in the parent directory
+    output_path = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(folder_path)),
+        os.path.basename(folder_path) + '.' + args.format
+    )
+
+    audio_files = collect_audio_files(folder_path, recursive=args.recursive)
+    if not audio_files:
+        print(f"No audio files found in {folder_path}")
+        print(f"Supported formats: {', '.join(AUDIO_EXTENSIONS)}")
+        sys.exit(1)
+
+    print(f"Found {len(audio_files)} track(s) to merge into {output_path}")
+
+    from tqdm import tqdm
+    with tqdm(total=len(audio_files), desc="Merging files") as bar:
+        result = merge_audio_files(
+            audio_files, output_path,
+            bitrate=args.bitrate,
+            allow_stream_copy=not args.no_copy,
+            progress=lambda _: bar.update(1),
+            workers=args.workers,
+            gapless=args.gapless,
+            crossfade=args.crossfade,
+        )
+
+    if not result['success']:
+        print("\nOperation failed!")
+        sys.exit(1)
+
+    mode = 'stream copy' if result['mode'] == 'copy' else 're-encode'
+    print(f"Files have been merged successfully into {output_path} ({mode})!")
+
+
+if __name__ == "__main__":
+    main()
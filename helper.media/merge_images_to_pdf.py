@@ -2,49 +2,70 @@
 
 import os
 import sys
-from PIL import Image
 from datetime import datetime
 import argparse
+from image_ordering import ORDER_MODES, build_image_index, sort_image_index
 
-def merge_images_to_pdf(input_folder, output_folder):
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import jobs, metrics, tracing
+
+def load_page(img_path):
+    """Open and decode one image as RGB (for PDF compatibility)."""
+    from PIL import Image
+    img = Image.open(img_path)
+    # Convert to RGB if necessary (for PDF compatibility)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    else:
+        img.load()
+    tracing.current().add('bytes_in', os.path.getsize(img_path))
+    return img
+
+def merge_images_to_pdf(input_folder, output_folder, order_by='natural', manifest_path=None):
     """
     Merge all images from input folder into a single PDF file.
     
     Args:
         input_folder (str): Path to folder containing images
         output_folder (str): Path to folder where PDF will be saved
+        order_by (str): Page order: natural, name, exif, mtime or manifest
+        manifest_path (str): File listing image names in page order (for order_by='manifest')
     """
     
     # Supported image formats
     supported_formats = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif')
     
     # Get all image files from input folder
-    image_files = []
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith(supported_formats):
-            image_files.append(os.path.join(input_folder, filename))
+    with tracing.span('scan'):
+        image_index = build_image_index(input_folder, supported_formats)
     
-    if not image_files:
+    if not image_index:
         print(f"No supported image files found in {input_folder}")
         print(f"Supported formats: {', '.join(supported_formats)}")
         return False
     
-    # Sort files to ensure consistent order
-    image_files.sort()
+    # Order pages (only headers are read, no pixel data is decoded here)
+    try:
+        with tracing.span('order', order_by=order_by):
+            image_files = sort_image_index(image_index, order_by, manifest_path)
+    except (ValueError, OSError) as e:
+        print(f"Error ordering images: {str(e)}")
+        return False
     
     print(f"Found {len(image_files)} image(s) to merge:")
     for img_file in image_files:
         print(f"  - {os.path.basename(img_file)}")
     
     try:
-        # Open and convert images
-        images = []
-        for img_path in image_files:
-            img = Image.open(img_path)
-            # Convert to RGB if necessary (for PDF compatibility)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            images.append(img)
+        # Decode all pages in parallel, keeping page order
+        graph = jobs.Graph()
+        pages = [graph.add('decode', load_page, img_path, resource='cpu', file=os.path.basename(img_path))
+                 for img_path in image_files]
+        graph.run()
+        if graph.failed:
+            print(f"Error creating PDF: {graph.failed[0].error}")
+            return False
+        images = [page.result for page in pages]
         
         # Create output filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -53,7 +74,9 @@ def merge_images_to_pdf(input_folder, output_folder):
         
         # Save as PDF
         if images:
-            images[0].save(output_path, save_all=True, append_images=images[1:])
+            with tracing.span('save_pdf', file=output_filename) as save_span:
+                images[0].save(output_path, save_all=True, append_images=images[1:])
+                save_span.add('bytes_out', os.path.getsize(output_path))
             print(f"\nSuccess! PDF created: {output_path}")
             return True
         
@@ -67,11 +90,22 @@ def main():
                        help='Input folder containing images (default: input)')
     parser.add_argument('--output', '-o', default='output', 
                        help='Output folder for PDF file (default: output)')
+    parser.add_argument('--order', default='natural', choices=ORDER_MODES,
+                       help='Page order: natural (page2 before page10), name, exif (capture time), '
+                            'mtime or manifest (default: natural)')
+    parser.add_argument('--manifest', '-m', default=None,
+                       help='Text file listing image names in page order (implies --order manifest)')
+    
+    tracing.add_arguments(parser)
+    metrics.add_arguments(parser)
     
     args = parser.parse_args()
+    tracing.enable_from_args(args)
+    metrics.enable_from_args(args, 'img2pdf')
     
     input_folder = args.input
     output_folder = args.output
+    order_by = 'manifest' if args.manifest else args.order
     
     # Check if input folder exists
     if not os.path.exists(input_folder):
@@ -83,10 +117,11 @@ def main():
     
     print(f"Input folder: {input_folder}")
     print(f"Output folder: {output_folder}")
+    print(f"Page order: {order_by}")
     print("-" * 50)
     
     # Merge images to PDF
-    success = merge_images_to_pdf(input_folder, output_folder)
+    success = merge_images_to_pdf(input_folder, output_folder, order_by, args.manifest)
     
     if success:
         print("\nOperation completed successfully!")
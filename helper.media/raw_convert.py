@@ -0,0 +1,318 @@
+import argparse
+import io
+import os
+import pathlib
+import shutil
+import subprocess
+
+import _cetchome_path  # noqa: F401  共享的 cetchome 包位于仓库根目录
+from cetchome import exiftool, jobs, metrics, tracing
+
+EXTENSIONS = ('RAF', 'HEIC')
+DEFAULT_EXIFTOOL = os.path.join('.', 'helper.photo', 'bin', 'exiftool')
+
+# RAF 解码参数
+RAW_EXPOSURE_SHIFT = 0.25  # 修改后光线会下降，所以需要手动提亮，线性比例的曝光偏移。可用范围从0.25（变暗2级）到8.0（变浅3级）。
+
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+MAX_SEGMENT = 65533  # JPEG 标记段的最大负载
+
+
+def _decode_raf(img):
+    import rawpy
+    with rawpy.imread(str(img)) as raw:
+        return raw.postprocess(rawpy.Params(
+            use_camera_wb=True,  # 是否使用拍摄时的白平衡值
+            use_auto_wb=False,
+            exp_shift=RAW_EXPOSURE_SHIFT
+            ))
+
+
+def _decode_heic(img):
+    """Decoded image and its metadata: 'exif', 'xmp' and 'icc_profile' (those present)"""
+    import pillow_heif
+    from PIL import Image
+    heif_file = pillow_heif.read_heif(str(img))
+    image = Image.frombytes(
+        heif_file.mode,
+        heif_file.size,
+        heif_file.data,
+        "raw",
+    )
+    # libheif 已按旋转信息转正像素，EXIF/XMP 中的方向改为 1，避免查看器再次旋转
+    info = dict(heif_file.info)
+    pillow_heif.set_orientation(info)
+    metadata = {key: info[key] for key in ('exif', 'xmp', 'icc_profile') if info.get(key)}
+    if 'exif' in metadata and not metadata['exif'].startswith(EXIF_HEADER):
+        metadata['exif'] = EXIF_HEADER + metadata['exif']
+    return image, metadata
+
+
+def _raf_metadata(img):
+    """
+    EXIF (and XMP) of a RAF file, from the JPEG preview it embeds
+
+    The preview carries the camera's complete EXIF data, maker notes
+    included; only its segments before the image data are read.
+    """
+    metadata = {}
+    with open(img, 'rb') as f:
+        header = f.read(92)
+        if not header.startswith(b'FUJIFILMCCD-RAW '):
+            return metadata
+        f.seek(int.from_bytes(header[84:88], 'big'))
+        if f.read(2) != b'\xff\xd8':
+            return metadata
+        while True:
+            marker = f.read(4)
+            # SOS/EOI 之后不再有元数据段
+            if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xDA, 0xD9):
+                break
+            payload = f.read(int.from_bytes(marker[2:], 'big') - 2)
+            if marker[1] == 0xE1 and payload.startswith(EXIF_HEADER):
+                metadata.setdefault('exif', _reset_orientation(payload))
+            elif marker[1] == 0xE1 and payload.startswith(XMP_HEADER):
+                metadata.setdefault('xmp', payload[len(XMP_HEADER):])
+    return metadata
+
+
+def _reset_orientation(exif):
+    """EXIF segment with its Orientation tag set to 1 (rawpy already rotates the pixels)"""
+    tiff = bytearray(exif[len(EXIF_HEADER):])
+    order = 'little' if tiff[:2] == b'II' else 'big'
+    ifd = int.from_bytes(tiff[4:8], order)
+    count = int.from_bytes(tiff[ifd:ifd + 2], order)
+    for entry in range(ifd + 2, ifd + 2 + 12 * count, 12):
+        if int.from_bytes(tiff[entry:entry + 2], order) == 0x0112:
+            tiff[entry + 8:entry + 10] = (1).to_bytes(2, order)
+    return EXIF_HEADER + bytes(tiff)
+
+
+def _insert_segment(jpeg, marker, payload):
+    """JPEG bytes with an APPn segment added after the leading APP0/APP1 (JFIF, EXIF) segments"""
+    position = 2
+    while jpeg[position] == 0xFF and jpeg[position + 1] in (0xE0, 0xE1):
+        position += 2 + int.from_bytes(jpeg[position + 2:position + 4], 'big')
+    segment = bytes([0xFF, marker]) + (len(payload) + 2).to_bytes(2, 'big') + payload
+    return jpeg[:position] + segment + jpeg[position:]
+
+
+def _save_jpeg(image, new_location, metadata, **options):
+    """
+    Save a PIL image as JPEG with the metadata in the same write
+
+    Returns:
+        bool: True if all metadata was embedded, False if some of it does not
+              fit a JPEG segment (copy_exif() has to copy it)
+    """
+    exif, xmp = metadata.get('exif'), metadata.get('xmp')
+    embedded = True
+    if exif and len(exif) <= MAX_SEGMENT:
+        options['exif'] = exif
+    elif exif:
+        embedded = False
+    if metadata.get('icc_profile'):
+        options['icc_profile'] = metadata['icc_profile']
+    if xmp and len(XMP_HEADER) + len(xmp) > MAX_SEGMENT:
+        # 超过一个段的 XMP 需要扩展 XMP，交给 exiftool
+        xmp, embedded = None, False
+    if not xmp:
+        image.save(new_location, "JPEG", **options)
+        return embedded
+    # Pillow 9/10 不能写 XMP：编码到内存后插入 APP1 段，仍只写一次文件
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", **options)
+    new_location.write_bytes(_insert_segment(buffer.getvalue(), 0xE1, XMP_HEADER + xmp))
+    return embedded
+
+
+def write_jpeg(img, new_location, ext):
+    """
+    Decode a RAF/HEIC photo and save it as JPEG with its EXIF, XMP and ICC profile
+
+    Returns:
+        bool: True if the metadata was embedded; False if copy_exif() has to copy it
+              (RAF without readable preview EXIF, segments too large for a JPEG marker)
+    """
+    from PIL import Image
+
+    if ext == 'RAF':
+        with tracing.span('decode'):
+            rgb = _decode_raf(img)
+            metadata = _raf_metadata(img)
+        with tracing.span('save'):
+            # rawpy 输出 sRGB，不需要 ICC 配置文件
+            embedded = _save_jpeg(Image.fromarray(rgb), new_location, metadata) and 'exif' in metadata
+
+    if ext == 'HEIC':
+        with tracing.span('decode'):
+            image, metadata = _decode_heic(img)
+        with tracing.span('save'):
+            embedded = _save_jpeg(image, new_location, metadata, quality=100)
+
+    tracing.current().add('bytes_in', img.stat().st_size)
+    tracing.current().add('bytes_out', new_location.stat().st_size)
+    tracing.current().set('metadata', 'embedded' if embedded else 'exiftool')
+    return embedded
+
+
+def copy_exif(exiftool_path, img, new_location, embedded=False):
+    """
+    Copy the EXIF data of the original photo into the JPEG (one exiftool process is kept running for all photos)
+
+    Nothing to do when write_jpeg() already embedded the metadata (embedded=True).
+    """
+    if embedded:
+        return
+    command = [exiftool_path, '-overwrite_original', '-TagsFromFile', str(img), str(new_location)]
+    print(subprocess.list2cmdline(command))
+    exif_result = exiftool.run(command, check=True)
+    print("Command executed successfully.")
+    print("Output:", exif_result.stdout)
+
+
+def add_photo(graph, img, target, ext, exiftool_path=DEFAULT_EXIFTOOL, move_original=True):
+    """
+    Add the steps converting one photo to a job graph: convert (decode + save) -> exiftool -> move
+
+    Decoding runs on the CPU pool, so the next photos are decoded while
+    the file moves of earlier ones are running. The metadata is embedded
+    while saving; the exiftool step only runs exiftool when it could not be.
+
+    Returns:
+        dict: Step name -> jobs.Step, for photo_result()
+    """
+    new_location = (pathlib.Path(target) / img.name).with_suffix(".JPG")
+    convert = graph.add('convert', write_jpeg, img, new_location, ext, resource='cpu', file=img.name, format=ext)
+    exif = graph.add('exiftool', copy_exif, exiftool_path, img, new_location, convert, resource='subprocess',
+                     file=img.name)
+    steps = {'convert': convert, 'exiftool': exif}
+    if move_original:
+        steps['move'] = graph.add('move', shutil.move, img, target, resource='io', after=[exif], file=img.name)
+    return steps
+
+
+def photo_result(img, target, steps):
+    """
+    Result of a conversion added with add_photo(), after the graph has run
+
+    Returns:
+        dict: 'success', 'input_file', 'output_file', 'original_size', 'converted_size', 'timings' and 'error'
+    """
+    new_location = (pathlib.Path(target) / img.name).with_suffix(".JPG")
+    moved = pathlib.Path(target) / img.name
+    result = {'success': False, 'input_file': img.name, 'output_file': str(new_location),
+              'original_size': 0, 'converted_size': 0,
+              'timings': {name: round(step.seconds, 6) for name, step in steps.items()}, 'error': None}
+    failed = [step for step in steps.values() if step.status == 'failed']
+    if failed:
+        result['error'] = failed[0].error
+        return result
+
+    original = moved if 'move' in steps else img
+    result['original_size'] = original.stat().st_size
+    result['converted_size'] = new_location.stat().st_size
+    result['success'] = True
+    return result
+
+
+def convert_photo(img, target, ext=None, exiftool_path=DEFAULT_EXIFTOOL, move_original=True):
+    """
+    Convert one RAF/HEIC photo to <target>/<name>.JPG with its EXIF data and move the original next to it
+
+    Args:
+        img (Path): Source photo
+        target (Path): Output folder
+        ext (str): 'RAF' or 'HEIC' (default: from the file name)
+        exiftool_path (str): exiftool executable
+        move_original (bool): Move the source photo into target afterwards
+
+    Returns:
+        dict: See photo_result()
+    """
+    img = pathlib.Path(img)
+    ext = (ext or img.suffix.lstrip('.')).upper()
+    if ext not in EXTENSIONS:
+        return {'success': False, 'input_file': img.name,
+                'output_file': str((pathlib.Path(target) / img.name).with_suffix(".JPG")),
+                'original_size': 0, 'converted_size': 0, 'timings': {}, 'error': f'unsupported format {ext}'}
+
+    graph = jobs.Graph()
+    steps = add_photo(graph, img, target, ext, exiftool_path, move_original)
+    graph.run()
+    return photo_result(img, target, steps)
+
+
+def convert_folder(folder, ext='HEIC', exiftool_path=DEFAULT_EXIFTOOL):
+    """
+    Convert every *.<ext> photo of a folder to JPEG
+
+    JPEGs are written to the <folder>/<ext> subfolder with the EXIF/XMP
+    data (and ICC profile) of the original embedded, exiftool copying it
+    only where that is not possible, and each original is moved next to its
+    JPEG. rawpy (RAF) and pillow_heif (HEIC) are only imported for the
+    format being converted. All photos go into one job graph, so decoding
+    and moving overlap across photos.
+
+    Args:
+        folder (str): Folder to read from
+        ext (str): 'RAF' or 'HEIC'
+        exiftool_path (str): exiftool executable
+
+    Returns:
+        pathlib.Path: Folder the images were saved into
+    """
+    from rich.progress import Progress
+
+    source = pathlib.Path(folder)  # Folder to read from.
+    target = source.joinpath(ext)  # Folder to save images into.
+    if not os.path.exists(target):
+        os.makedirs(target)
+
+    images = list(source.glob(f'*.{ext}'))
+
+    graph = jobs.Graph()
+    photos = {}
+    for img in images:
+        steps = add_photo(graph, img, target, ext, exiftool_path)
+        photos[steps['move']] = (img, steps)
+
+    with Progress() as progress:
+        task = progress.add_task("Working...", total=len(images))
+        metrics.QUEUE_DEPTH.set(len(images))
+
+        def photo_done(step):
+            if step in photos:
+                img, steps = photos.pop(step)
+                result = photo_result(img, target, steps)
+                if not result['success']:
+                    print(f"[ERROR] {img.name}: {result['error']}")
+                progress.advance(task)
+                metrics.QUEUE_DEPTH.set(len(photos))
+
+        graph.run(on_step=photo_done)
+
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert RAF or HEIC photos to JPEG, keeping their EXIF data')
+    parser.add_argument('folders', nargs='+', help='Folders to convert')
+    parser.add_argument('--ext', default='HEIC', choices=EXTENSIONS, help='Source format (default: HEIC)')
+    parser.add_argument('--exiftool', default=DEFAULT_EXIFTOOL,
+                        help=f'exiftool executable (default: {DEFAULT_EXIFTOOL})')
+    tracing.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.enable_from_args(args)
+    metrics.enable_from_args(args, 'raw2jpg')
+
+    for folder in args.folders:
+        print(folder)
+        target = convert_folder(folder, args.ext, args.exiftool)
+        print(f"已保存到 {target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Perceptual fingerprints of video clips for convert_mov_to_mp4.
+
+Recognises the same clip saved under another name, remuxed into another
+container or already converted to MP4. A fingerprint is the duration,
+the capture time, a 64-bit difference hash (dHash) of SAMPLES frames at
+fixed fractions of the duration and the loudness envelope of one second
+of audio at the same points. The hashes alone cannot tell apart two takes
+of a tripod shot, so clips that both have a capture time only match when
+it is the same. Each sample is read with input seeking (the keyframe before
+it and the few frames up to it are decoded), so fingerprinting costs two
+short ffmpeg runs however long the clip is.
+"""
+import re
+import subprocess
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+
+SAMPLES = 8
+HASH_WIDTH, HASH_HEIGHT = 9, 8
+AUDIO_RATE = 8000
+AUDIO_WINDOWS = 10          # Loudness windows per sampled second of audio
+AUDIO_LEVELS = 15
+
+# Durations of duplicates may differ by DURATION_TOLERANCE seconds plus DURATION_RATIO of the shorter one,
+# no more than convert_mov_to_mp4.check_streams() allows between a source and its MP4
+DURATION_TOLERANCE = 0.1
+DURATION_RATIO = 0.01
+FRAME_DISTANCE = 10         # Mean differing bits (of 64) of the frame hashes of duplicates
+AUDIO_DISTANCE = 2.0        # Mean difference of the envelope levels (0-15) of duplicates
+
+
+def sample_times(duration, samples=SAMPLES):
+    """Seconds of the sampled points, in the middle of `samples` equal parts of the clip"""
+    return [(index + 0.5) * duration / samples for index in range(samples)]
+
+
+def _seek_inputs(path, times):
+    args = []
+    for seconds in times:
+        args += ['-ss', f"{seconds:.3f}", '-i', str(path)]
+    return args
+
+
+def _run(cmd, expected):
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0 or len(result.stdout) != expected:
+        error = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(error[-1] if error else f"ffmpeg returned {len(result.stdout)} of {expected} bytes")
+    return result.stdout
+
+
+def frame_hashes(ffmpeg_path, path, times):
+    """dHash of the frame at each time, as 64-bit ints"""
+    chains = [f"[{index}:v:0]trim=end_frame=1,scale={HASH_WIDTH}:{HASH_HEIGHT}:flags=area,setsar=1,format=gray[v{index}]"
+              for index in range(len(times))]
+    chains.append(''.join(f"[v{index}]" for index in range(len(times))) + f"concat=n={len(times)}:v=1:a=0[v]")
+    cmd = [ffmpeg_path, '-v', 'error', *_seek_inputs(path, times),
+           '-filter_complex', ';'.join(chains), '-map', '[v]', '-fps_mode', 'passthrough', '-f', 'rawvideo', '-']
+    frame_size = HASH_WIDTH * HASH_HEIGHT
+    pixels = _run(cmd, frame_size * len(times))
+
+    hashes = []
+    for start in range(0, len(pixels), frame_size):
+        value = 0
+        for row in range(start, start + frame_size, HASH_WIDTH):
+            for column in range(row, row + HASH_WIDTH - 1):
+                value = (value << 1) | (pixels[column] > pixels[column + 1])
+        hashes.append(value)
+    return hashes
+
+
+def audio_envelope(ffmpeg_path, path, times):
+    """Loudness (0-AUDIO_LEVELS, relative to the loudest window) of AUDIO_WINDOWS windows per sampled second"""
+    chains = [f"[{index}:a:0]atrim=duration=1,aresample={AUDIO_RATE},"
+              f"aformat=sample_fmts=s16:channel_layouts=mono,apad=whole_len={AUDIO_RATE}[a{index}]"
+              for index in range(len(times))]
+    chains.append(''.join(f"[a{index}]" for index in range(len(times))) + f"concat=n={len(times)}:v=0:a=1[a]")
+    cmd = [ffmpeg_path, '-v', 'error', *_seek_inputs(path, times),
+           '-filter_complex', ';'.join(chains), '-map', '[a]', '-f', 's16le', '-']
+    samples = array('h')
+    samples.frombytes(_run(cmd, 2 * AUDIO_RATE * len(times)))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+
+    window = AUDIO_RATE // AUDIO_WINDOWS
+    loudness = [(sum(value * value for value in samples[start:start + window]) / window) ** 0.5
+                for start in range(0, len(samples), window)]
+    loudest = max(loudness, default=0)
+    return [round(AUDIO_LEVELS * value / loudest) if loudest else 0 for value in loudness]
+
+
+def compute(ffmpeg_path, path, duration, capture_time=None):
+    """
+    Fingerprint of one clip
+
+    Args:
+        ffmpeg_path (str): ffmpeg executable
+        path (Path): Video file
+        duration (float): Its duration in seconds (from the probe)
+        capture_time (str): Its capture time (from the probe), None if unknown
+
+    Returns:
+        dict: 'duration', 'capture_time', 'frames' (frame hashes) and 'audio' (envelope, None without audio)
+
+    Raises:
+        RuntimeError: ffmpeg could not read the sampled frames
+    """
+    times = sample_times(duration)
+    frames = frame_hashes(ffmpeg_path, path, times)
+    try:
+        audio = audio_envelope(ffmpeg_path, path, times)
+    except RuntimeError:
+        # 没有音轨 (或无法解码)：只与同样没有音频的片段匹配
+        audio = None
+    return {'duration': duration, 'capture_time': capture_time, 'frames': frames, 'audio': audio}
+
+
+def same_duration(duration1, duration2):
+    return abs(duration1 - duration2) <= DURATION_TOLERANCE + DURATION_RATIO * min(duration1, duration2)
+
+
+_TIME = re.compile(r'(\d{4})\D?(\d\d)\D?(\d\d)\D?(\d\d)\D?(\d\d)\D?(\d\d)(?:\.\d+)?\s*(Z|[+-]\d\d:?\d\d)?')
+
+
+def _parse_time(text):
+    """datetime of a capture time (aware if it has a time zone), None if it cannot be read"""
+    match = _TIME.match(text.strip())
+    if not match:
+        return None
+    moment = datetime(*(int(part) for part in match.groups()[:6]))
+    zone = match.group(7)
+    if zone == 'Z':
+        return moment.replace(tzinfo=timezone.utc)
+    if zone:
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]))
+        return moment.replace(tzinfo=timezone(offset if zone[0] == '+' else -offset))
+    return moment
+
+
+def same_capture_time(time1, time2):
+    """True unless both capture times are known and differ (to the second, whatever the format)"""
+    if not time1 or not time2:
+        return True
+    # Apple 的本地时间 (带时区) 与 mvhd 的 UTC 时间格式不同，按时刻比较
+    moment1, moment2 = _parse_time(time1), _parse_time(time2)
+    if moment1 is None or moment2 is None:
+        return time1 == time2
+    if (moment1.tzinfo is None) != (moment2.tzinfo is None):
+        moment1, moment2 = moment1.replace(tzinfo=None), moment2.replace(tzinfo=None)
+    return moment1 == moment2
+
+
+def matches(fingerprint1, fingerprint2):
+    """True if two fingerprints are of the same clip"""
+    if not same_duration(fingerprint1['duration'], fingerprint2['duration']):
+        return False
+    if not same_capture_time(fingerprint1.get('capture_time'), fingerprint2.get('capture_time')):
+        return False
+    frames1, frames2 = fingerprint1['frames'], fingerprint2['frames']
+    if not frames1 or len(frames1) != len(frames2):
+        return False
+    if sum(bin(hash1 ^ hash2).count('1') for hash1, hash2 in zip(frames1, frames2)) > FRAME_DISTANCE * len(frames1):
+        return False
+
+    audio1, audio2 = fingerprint1['audio'], fingerprint2['audio']
+    if (audio1 is None) != (audio2 is None):
+        return False
+    if audio1 is not None:
+        if len(audio1) != len(audio2):
+            return False
+        if sum(abs(level1 - level2) for level1, level2 in zip(audio1, audio2)) > AUDIO_DISTANCE * len(audio1):
+            return False
+    return True
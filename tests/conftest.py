@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Point the persistent caches (CETC_CACHE) at a fresh folder"""
+    folder = tmp_path / 'cache'
+    monkeypatch.setenv('CETC_CACHE', str(folder))
+    return folder
@@ -0,0 +1,37 @@
+import pytest
+
+from cetchome.api import Session
+from cetchome.cli import load_tool
+
+downloader = load_tool('download')
+
+
+def make_tree(root):
+    (root / 'new' / 'example.com').mkdir(parents=True)
+    (root / 'new' / 'example.com' / 'a.jpg').write_bytes(b'jpeg')
+    (root / 'old backup').mkdir()
+    (root / 'duplicates').mkdir()
+
+
+def test_cleanup_keeps_folders_next_to_downloads(tmp_path):
+    make_tree(tmp_path)
+
+    downloader.cleanup_existing_photos(str(tmp_path / 'new'))
+    assert (tmp_path / 'new').is_dir() and not list((tmp_path / 'new').iterdir())
+    assert (tmp_path / 'old backup').is_dir() and (tmp_path / 'duplicates').is_dir()
+
+
+def test_cleanup_removes_backups_of_given_folder(tmp_path):
+    make_tree(tmp_path)
+
+    downloader.cleanup_existing_photos(str(tmp_path / 'new'), backup_dir=str(tmp_path))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['new']
+
+
+@pytest.mark.parametrize('options', [{'cleanup': True}, {'backup_dir': '.'}])
+def test_session_download_does_not_delete_folders(tmp_path, options):
+    make_tree(tmp_path)
+
+    with Session() as session, pytest.raises(ValueError):
+        session.download([], tmp_path / 'new', **options)
+    assert (tmp_path / 'new' / 'example.com' / 'a.jpg').exists()
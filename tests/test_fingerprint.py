@@ -0,0 +1,69 @@
+import os
+
+from cetchome import fingerprint
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return path
+
+
+def test_small_file_is_hashed_in_full(tmp_path):
+    path = write(tmp_path / 'small.bin', os.urandom(1000))
+    assert fingerprint.sampled_hash(path) == fingerprint.full_hash(path)
+
+
+def test_full_hash_with_mmap(tmp_path):
+    data = os.urandom(3 * 1024 + 7)
+    path = write(tmp_path / 'data.bin', data)
+    empty = write(tmp_path / 'empty.bin', b'')
+    assert fingerprint.full_hash(path, use_mmap=True) == fingerprint.full_hash(path)
+    assert fingerprint.full_hash(empty, use_mmap=True) == fingerprint.full_hash(empty)
+    assert fingerprint.full_hash(path) != fingerprint.full_hash(empty)
+
+
+def test_sampled_hash_reads_samples_only(tmp_path):
+    # 2 个中间块 + 首尾块，每块 4 字节：读取偏移 0, 32, 64, 96 处的块
+    data = bytearray(100)
+    path = write(tmp_path / 'large.bin', bytes(data))
+    base = fingerprint.sampled_hash(path, blocks=2, block_size=4)
+    assert base != fingerprint.full_hash(path)
+
+    data[50] = 1
+    write(path, bytes(data))
+    assert fingerprint.sampled_hash(path, blocks=2, block_size=4) == base
+
+    for offset in (0, 33, 66, 99):
+        changed = bytearray(100)
+        changed[offset] = 1
+        write(path, bytes(changed))
+        assert fingerprint.sampled_hash(path, blocks=2, block_size=4) != base
+
+    write(path, bytes(101))
+    assert fingerprint.sampled_hash(path, blocks=2, block_size=4) != base
+
+
+def test_fingerprint_is_cached_per_size_and_mtime(cache, tmp_path):
+    path = write(tmp_path / 'clip.mov', b'a' * 100)
+    stat = os.stat(path)
+    digest = fingerprint.fingerprint(path, 'full')
+
+    # 内容变了但大小与修改时间不变：仍返回缓存的指纹
+    write(path, b'b' * 100)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert fingerprint.fingerprint(path, 'full') == digest
+
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert fingerprint.fingerprint(path, 'full') == fingerprint.full_hash(path) != digest
+
+
+def test_identical(tmp_path):
+    first = write(tmp_path / 'a.bin', b'same content')
+    second = write(tmp_path / 'b.bin', b'same content')
+    other = write(tmp_path / 'c.bin', b'other content')
+    changed = write(tmp_path / 'd.bin', b'same_content')
+
+    assert fingerprint.identical(first, second)
+    assert not fingerprint.identical(first, other)
+    assert not fingerprint.identical(first, changed)
+    assert not fingerprint.identical(first, tmp_path / 'missing.bin')
@@ -0,0 +1,66 @@
+import pytest
+
+from cetchome.cli import load_script
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+pytest.importorskip('imagehash')
+image_similarity = load_script('downloader.urls', 'image_similarity.py')
+
+ONES = (1 << 64) - 1
+
+
+def row(phash=0, dhash=0, whash=0):
+    return {'phash': phash, 'dhash': dhash, 'whash': whash}
+
+
+def pairs(result):
+    pair_i, pair_j, distance = result
+    return sorted(zip(pair_i.tolist(), pair_j.tolist())), distance
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 2048])
+def test_find_similar_pairs(block_size):
+    columns = image_similarity.build_hash_columns([
+        row(),
+        row(phash=0b11),                    # 与 0 相差 2 位 phash
+        row(ONES, ONES, ONES),              # 完全不同
+        row(phash=0b11, dhash=0b1111),      # 与 1 仅 dhash 相差 4 位
+        row(dhash=ONES),                    # phash 相同但 dhash 全部不同
+    ])
+
+    found, distance = pairs(image_similarity.find_similar_pairs(columns, block_size=block_size))
+    assert found == [(0, 1), (0, 3), (1, 3)]
+    assert all(distance <= image_similarity.DEFAULT_THRESHOLD)
+
+
+def test_weighted_distance():
+    columns = image_similarity.build_hash_columns([row(), row(phash=0b1111, dhash=0b1111)])
+    _, _, distance = image_similarity.find_similar_pairs(columns)
+    # 0.5 * 4/64 + 0.25 * 4/64
+    assert distance.tolist() == pytest.approx([0.75 * 4 / 64])
+
+    only_dhash = image_similarity.find_similar_pairs(columns, weights={'dhash': 1}, threshold=0.05)
+    assert len(only_dhash[0]) == 0
+
+
+def test_find_cross_pairs():
+    new = image_similarity.build_hash_columns([row(), row(ONES, ONES, ONES)])
+    archive = image_similarity.build_hash_columns([row(ONES, ONES, ONES), row(phash=1), row(whash=1)])
+
+    found, _ = pairs(image_similarity.find_cross_pairs(new, archive, block_size=2))
+    assert found == [(0, 1), (0, 2), (1, 0)]
+
+
+def test_group_duplicates():
+    pair_i, pair_j = np.array([0, 1, 4]), np.array([1, 2, 5])
+    groups = image_similarity.group_duplicates(6, pair_i, pair_j)
+    assert sorted(sorted(group) for group in groups) == [[0, 1, 2], [4, 5]]
+    assert image_similarity.group_duplicates(3, np.array([], dtype=int), np.array([], dtype=int)) == []
+
+
+def test_pack_hash():
+    imagehash = pytest.importorskip('imagehash')
+    bits = np.zeros((8, 8), dtype=bool)
+    bits[0, 0] = bits[7, 7] = True
+    assert image_similarity.pack_hash(imagehash.ImageHash(bits)) == (1 << 63) | 1
@@ -0,0 +1,71 @@
+from cetchome import jobs
+
+
+def fail():
+    raise RuntimeError('broken')
+
+
+def test_failed_step_skips_dependents(cache):
+    calls = []
+    finished = []
+    graph = jobs.Graph()
+    broken = graph.add('broken', fail)
+    child = graph.add('child', calls.append, broken)
+    grandchild = graph.add('grandchild', calls.append, 'grandchild', after=[child])
+    other = graph.add('other', calls.append, 'other')
+    graph.run(on_step=finished.append)
+
+    assert broken.status == 'failed' and broken.error == 'RuntimeError: broken'
+    assert child.status == 'skipped' and child.error == 'broken failed'
+    assert grandchild.status == 'skipped' and grandchild.error == 'child skipped'
+    assert other.ok
+    assert calls == ['other']
+    assert graph.failed == [broken]
+    assert sorted(step.name for step in finished) == ['broken', 'child', 'grandchild', 'other']
+
+
+def test_memo(cache, tmp_path):
+    source = tmp_path / 'source.txt'
+    output = tmp_path / 'output.txt'
+    source.write_text('source')
+    calls = []
+
+    def convert(path):
+        calls.append(path)
+        output.write_text(path.read_text().upper())
+        return {'size': output.stat().st_size}
+
+    def run():
+        graph = jobs.Graph()
+        step = graph.add('convert', convert, source, files=[source], outputs=[output], params={'case': 'upper'})
+        graph.run()
+        return step
+
+    first = run()
+    assert first.status == 'done' and first.result == {'size': 6}
+
+    # 输入与输出都未变：直接返回缓存的结果
+    second = run()
+    assert second.status == 'cached' and second.result == {'size': 6}
+    assert len(calls) == 1
+
+    # 输出被改动 (或删除) 后缓存失效，重新执行
+    output.write_text('edited by hand')
+    third = run()
+    assert third.status == 'done' and third.result == {'size': 6}
+    assert len(calls) == 2
+    assert run().status == 'cached'
+
+
+def test_memo_disabled(cache, tmp_path):
+    source = tmp_path / 'source.txt'
+    source.write_text('source')
+    calls = []
+
+    for _ in range(2):
+        graph = jobs.Graph()
+        step = graph.add('count', lambda path: calls.append(path) or len(calls), source, files=[source])
+        graph.run(memo=False)
+        assert step.status == 'done'
+    assert calls == [source, source]
+    assert not cache.exists()
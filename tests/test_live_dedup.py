@@ -0,0 +1,103 @@
+import hashlib
+import io
+
+import pytest
+
+from cetchome.cli import load_script
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+pytest.importorskip('imagehash')
+Image = pytest.importorskip('PIL.Image')
+live_dedup = load_script('downloader.urls', 'live_dedup.py')
+reference_index = load_script('downloader.urls', 'reference_index.py')
+image_similarity = load_script('downloader.urls', 'image_similarity.py')
+
+
+def picture(seed, size=(320, 240)):
+    """A smooth random picture (perceptual hashes need structure, not noise)"""
+    small = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+def encode(img, quality=90):
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def inspect(index, data):
+    return index.inspect(data, hashlib.sha256(data).hexdigest())
+
+
+def test_exact_and_perceptual_duplicates():
+    index = live_dedup.LiveDedupIndex()
+    original = encode(picture(1))
+    first = inspect(index, original)
+    assert first['action'] == live_dedup.NEW
+    index.register('a.jpg', first)
+
+    assert inspect(index, original)['action'] == live_dedup.DUPLICATE
+    # 同一张图片，压缩得更厉害 (质量更低)
+    weaker = inspect(index, encode(picture(1), quality=40))
+    assert (weaker['action'], weaker['existing']) == (live_dedup.DUPLICATE, 'a.jpg')
+
+    other = inspect(index, encode(picture(2)))
+    assert other['action'] == live_dedup.NEW
+    index.register('b.jpg', other)
+    assert len(index) == 2
+
+
+def test_better_version_replaces():
+    index = live_dedup.LiveDedupIndex()
+    small = encode(picture(1))
+    first = inspect(index, small)
+    index.register('small.jpg', first)
+
+    larger = inspect(index, encode(picture(1, size=(640, 480))))
+    assert (larger['action'], larger['existing']) == (live_dedup.REPLACE, 'small.jpg')
+    index.register('large.jpg', larger)
+    assert len(index) == 1
+
+    # 被替换的文件已删除：其内容再次出现时按感知哈希与新版本比较
+    again = inspect(index, small)
+    assert (again['action'], again['existing']) == (live_dedup.DUPLICATE, 'large.jpg')
+
+
+def test_undecodable_files_match_by_sha_only():
+    index = live_dedup.LiveDedupIndex()
+    data = b'not an image'
+    first = inspect(index, data)
+    assert first['action'] == live_dedup.NEW and first['hashes'] is None
+    index.register('file.bin', first)
+
+    assert inspect(index, data)['action'] == live_dedup.DUPLICATE
+    assert inspect(index, encode(picture(1)))['action'] == live_dedup.NEW
+
+
+def test_columns_grow():
+    index = live_dedup.LiveDedupIndex()
+    for number in range(300):
+        value = number * 0x0101010101  # 彼此相差很多位
+        index.register(f'{number}.jpg', {'action': live_dedup.NEW, 'hashes': {'phash': value, 'dhash': value,
+                                                                              'whash': value},
+                                         'quality': (1, 1), 'sha256': str(number)})
+    assert len(index) == 300
+
+    data = encode(picture(1))
+    result = inspect(index, data)
+    assert result['action'] == live_dedup.NEW
+    index.register('last.jpg', result)
+    assert inspect(index, encode(picture(1), quality=40))['existing'] == 'last.jpg'
+
+
+def test_archive_reference(tmp_path):
+    img = picture(1)
+    archive = reference_index.ReferenceIndex(tmp_path / 'reference.idx', writable=True)
+    archive.append([image_similarity.compute_hashes(img)], ['/archive/a.jpg'], [(10 ** 9, 10 ** 9)])
+
+    index = live_dedup.LiveDedupIndex(reference_index=archive)
+    result = inspect(index, encode(img))
+    assert (result['action'], result['existing']) == (live_dedup.DUPLICATE, '/archive/a.jpg')
+    assert inspect(index, encode(picture(2)))['action'] == live_dedup.NEW
+    archive.close()
@@ -0,0 +1,132 @@
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+from cetchome import mp4
+
+CREATED = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+VIDEO_SIZES = [100, 50, 50, 60]   # 两个块，每块两个样本
+AUDIO_SIZES = [20, 20, 20]        # 一个块，位于两个视频块之间
+MDAT_SIZE = sum(VIDEO_SIZES) + sum(AUDIO_SIZES)
+
+
+def atom(kind, *children):
+    payload = b''.join(children)
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def full_atom(kind, *children):
+    """Atom with version 0 and no flags"""
+    return atom(kind, b'\0\0\0\0', *children)
+
+
+def timing(kind, timescale, duration, created=0):
+    """mvhd/mdhd: creation and modification time, timescale, duration"""
+    return full_atom(kind, struct.pack('>IIII', created, created, timescale, duration), bytes(80))
+
+
+def table(kind, fmt, entries):
+    return full_atom(kind, struct.pack('>I', len(entries)), *(struct.pack(fmt, *entry) for entry in entries))
+
+
+def track(handler, sample_entry, timescale, duration, sizes, chunk_table, chunks, samples_per_chunk, keyframes=None):
+    tables = [
+        full_atom(b'stsd', struct.pack('>I', 1), sample_entry),
+        full_atom(b'stsz', struct.pack('>II', 0, len(sizes)), *(struct.pack('>I', size) for size in sizes)),
+        table(b'stsc', '>III', [(1, samples_per_chunk, 1)]),
+        table(chunk_table, '>Q' if chunk_table == b'co64' else '>I', [(offset,) for offset in chunks]),
+    ]
+    if keyframes is not None:
+        tables.append(table(b'stss', '>I', [(sample,) for sample in keyframes]))
+    # tkhd: 旋转 90° 的变换矩阵 (a=0, b=1.0)
+    matrix = struct.pack('>9i', 0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+    return atom(
+        b'trak',
+        full_atom(b'tkhd', bytes(36), matrix, struct.pack('>II', 0, 0)),
+        atom(b'mdia',
+             timing(b'mdhd', timescale, duration),
+             full_atom(b'hdlr', bytes(4), handler, bytes(12)),
+             atom(b'minf', atom(b'stbl', *tables))),
+    )
+
+
+def moov(data_start, video=True):
+    avc1 = atom(b'avc1', bytes(24), struct.pack('>HH', 1920, 1080), bytes(50))
+    mp4a = atom(b'mp4a', bytes(28))
+    video_chunks = [data_start, data_start + 150 + sum(AUDIO_SIZES)]
+    tracks = [track(b'soun', mp4a, 48000, 96000, AUDIO_SIZES, b'co64', [data_start + 150], 3)]
+    if video:
+        tracks.insert(0, track(b'vide', avc1, 90000, 180000, VIDEO_SIZES, b'stco', video_chunks, 2, [1, 3]))
+    created = int((CREATED - mp4.EPOCH_1904).total_seconds())
+    return atom(b'moov', timing(b'mvhd', 1000, 2000, created), *tracks)
+
+
+def write_movie(path, mdat_bytes=MDAT_SIZE, video=True):
+    """ftyp + moov + mdat; the mdat header always declares the full size, mdat_bytes of it are written"""
+    ftyp = atom(b'ftyp', b'isom', bytes(4), b'isom')
+    header_size = len(ftyp) + len(moov(0, video)) + 8
+    data = ftyp + moov(header_size, video) + struct.pack('>I4s', 8 + MDAT_SIZE, b'mdat') + bytes(mdat_bytes)
+    path.write_bytes(data)
+    return header_size
+
+
+def test_read_tracks(tmp_path):
+    path = tmp_path / 'clip.mov'
+    data_start = write_movie(path)
+
+    info = mp4.read_tracks(path)
+    assert info['size'] == data_start + MDAT_SIZE
+    assert info['duration'] == 2.0
+    assert info['creation_time'] == '2020-01-02T03:04:05Z'
+
+    video, audio = info['tracks']
+    assert video['handler'] == 'vide' and video['codec'] == 'h264'
+    assert (video['width'], video['height'], video['rotation']) == (1920, 1080, 90)
+    assert video['duration'] == 2.0
+    assert (video['samples'], video['bytes'], video['keyframes']) == (4, sum(VIDEO_SIZES), 2)
+    # 第二个视频块在音频块之后，正好结束于文件末尾
+    assert video['data_end'] == info['size']
+
+    assert audio['handler'] == 'soun' and audio['codec'] == 'aac'
+    assert (audio['samples'], audio['bytes'], audio['keyframes']) == (3, sum(AUDIO_SIZES), None)
+    assert audio['data_end'] == data_start + 150 + sum(AUDIO_SIZES)
+
+
+def test_truncated_mdat(tmp_path):
+    path = tmp_path / 'cut.mov'
+    write_movie(path, mdat_bytes=MDAT_SIZE - 40)
+
+    info = mp4.read_tracks(path)
+    video, audio = info['tracks']
+    assert video['data_end'] == info['size'] + 40
+    assert audio['data_end'] <= info['size']
+
+
+def test_probe(tmp_path):
+    path = tmp_path / 'clip.mov'
+    write_movie(path)
+
+    summary = mp4.probe(path)
+    assert summary['video_codec'] == 'h264' and summary['audio_codec'] == 'aac'
+    assert summary['video_bitrate'] == sum(VIDEO_SIZES) * 8 // 2
+    assert summary['duration'] == 2.0
+    assert summary['capture_time'] == '2020-01-02T03:04:05Z'
+    assert summary['location'] is None
+
+
+def test_probe_without_video(tmp_path):
+    path = tmp_path / 'audio.m4a'
+    write_movie(path, video=False)
+
+    assert [track['handler'] for track in mp4.read_tracks(path)['tracks']] == ['soun']
+    with pytest.raises(ValueError):
+        mp4.probe(path)
+
+
+def test_no_moov(tmp_path):
+    path = tmp_path / 'empty.mov'
+    path.write_bytes(atom(b'ftyp', b'isom') + struct.pack('>I4s', 8 + MDAT_SIZE, b'mdat'))
+
+    with pytest.raises(ValueError):
+        mp4.read_tracks(path)
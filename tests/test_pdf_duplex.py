@@ -0,0 +1,107 @@
+import pytest
+
+from cetchome.cli import load_tool
+
+pypdf = pytest.importorskip('pypdf')
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject, NumberObject, StreamObject  # noqa: E402
+
+pdf_duplex = load_tool('scanmerge')
+
+# 300 dpi A4
+WIDTH, HEIGHT = 2480, 3508
+PIXELS = WIDTH * HEIGHT
+
+
+def stream(writer, data, **entries):
+    obj = StreamObject()
+    obj._data = data
+    obj.update({NameObject('/' + key): value for key, value in entries.items()})
+    return writer._add_object(obj)
+
+
+def scan_page(writer, stored_bytes, bits=8, color_space='/DeviceGray', filters='/DCTDecode'):
+    """Page showing one full-page image whose stored (never decoded) data is stored_bytes long"""
+    if isinstance(filters, str):
+        filters = NameObject(filters)
+    else:
+        filters = ArrayObject(NameObject(name) for name in filters)
+    image = stream(writer, bytes(stored_bytes), Type=NameObject('/XObject'), Subtype=NameObject('/Image'),
+                   Width=NumberObject(WIDTH), Height=NumberObject(HEIGHT), BitsPerComponent=NumberObject(bits),
+                   ColorSpace=NameObject(color_space), Filter=filters)
+    page = writer.add_blank_page(595, 842)
+    page[NameObject('/Resources')] = DictionaryObject(
+        {NameObject('/XObject'): DictionaryObject({NameObject('/Im0'): image})})
+    page[NameObject('/Contents')] = stream(writer, b'q 595 0 0 842 0 0 cm /Im0 Do Q')
+    return page
+
+
+@pytest.mark.parametrize('count, order', [
+    (0, []),
+    (1, [0]),
+    (4, [0, 3, 1, 2]),
+    (5, [0, 4, 1, 3, 2]),
+])
+def test_duplex_order(count, order):
+    assert pdf_duplex.duplex_order(count) == order
+
+
+def test_blank_grayscale_scan():
+    writer = pypdf.PdfWriter()
+    assert pdf_duplex.is_blank_page(scan_page(writer, int(PIXELS * 0.005)))
+    assert not pdf_duplex.is_blank_page(scan_page(writer, int(PIXELS * 0.1)))
+    # 4 位灰度的阈值减半
+    assert not pdf_duplex.is_blank_page(scan_page(writer, int(PIXELS * 0.015), bits=4))
+
+
+@pytest.mark.parametrize('options', [
+    {'bits': 1, 'filters': '/CCITTFaxDecode'},
+    {'bits': 1, 'filters': '/FlateDecode'},
+    {'bits': 1, 'filters': ['/JBIG2Decode']},
+])
+def test_bilevel_text_scan_is_not_blank(options):
+    # 1 位文字扫描只需约 0.008 字节/像素，比 8 位空白页还小
+    writer = pypdf.PdfWriter()
+    assert not pdf_duplex.is_blank_page(scan_page(writer, int(PIXELS * 0.008), **options))
+    assert not pdf_duplex.is_blank_page(scan_page(writer, int(PIXELS * 0.0005), **options))
+
+
+def test_page_without_images_is_not_blank():
+    writer = pypdf.PdfWriter()
+    page = writer.add_blank_page(595, 842)
+    page[NameObject('/Contents')] = stream(writer, b'BT /F1 12 Tf 72 720 Td (Hello) Tj ET')
+    assert not pdf_duplex.is_blank_page(page)
+    assert not pdf_duplex.is_blank_page(writer.add_blank_page(595, 842))
+
+
+def write_scan(path, pages):
+    writer = pypdf.PdfWriter()
+    for stored_bytes, options in pages:
+        scan_page(writer, stored_bytes, **options)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def test_duplex_merge_drops_only_blank_pages(tmp_path):
+    gray = {}
+    bilevel = {'bits': 1, 'filters': '/CCITTFaxDecode'}
+    fronts, backs = tmp_path / 'Scan_1.pdf', tmp_path / 'Scan_2.pdf'
+    write_scan(fronts, [(int(PIXELS * 0.1), gray), (int(PIXELS * 0.008), bilevel)])
+    write_scan(backs, [(int(PIXELS * 0.005), gray), (int(PIXELS * 0.1), gray)])
+
+    kept = pdf_duplex.duplex_merge([fronts, backs], tmp_path / 'kept.pdf')
+    assert kept['success'] and kept['pages'] == 4 and kept['blank_pages'] == []
+
+    result = pdf_duplex.duplex_merge([fronts, backs], tmp_path / 'merged.pdf', drop_blank=True)
+    assert result['success'] and result['pages'] == 3
+    # 扫描顺序中的第 3 页 (反转的背面批次中第一页) 为空白
+    assert result['blank_pages'] == [2]
+    assert len(pypdf.PdfReader(tmp_path / 'merged.pdf').pages) == 3
+
+
+def test_duplex_merge_fails_when_every_page_is_blank(tmp_path):
+    scan = tmp_path / 'Scan_1.pdf'
+    write_scan(scan, [(int(PIXELS * 0.005), {}), (int(PIXELS * 0.005), {})])
+
+    result = pdf_duplex.duplex_merge([scan], tmp_path / 'merged.pdf', drop_blank=True)
+    assert not result['success']
+    assert not (tmp_path / 'merged.pdf').exists()
@@ -0,0 +1,82 @@
+import pytest
+
+from cetchome.cli import load_script
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+pytest.importorskip('imagehash')
+pytest.importorskip('PIL')
+image_similarity = load_script('downloader.urls', 'image_similarity.py')
+reference_index = load_script('downloader.urls', 'reference_index.py')
+
+
+def row(value):
+    return {'phash': value, 'dhash': value, 'whash': value}
+
+
+def test_append_and_reopen(tmp_path):
+    path = tmp_path / 'reference.idx'
+    index = reference_index.ReferenceIndex(path, writable=True)
+    assert len(index) == 0
+    index.append([row(1), row(2)], ['a.jpg', 'b.jpg'], [(100, 10), (200, 20)])
+    index.append([row(3)], ['c.jpg'], [(300, 30)])
+    index.close()
+
+    index = reference_index.ReferenceIndex(path)
+    assert len(index) == 3
+    assert index.records['file_id'].tolist() == [0, 1, 2]
+    assert index.records['phash'].tolist() == [1, 2, 3]
+    assert [index.path(file_id) for file_id in range(3)] == ['a.jpg', 'b.jpg', 'c.jpg']
+    assert index.quality(1) == (200, 20)
+    index.close()
+
+
+def test_mark_deleted_and_compact(tmp_path):
+    path = tmp_path / 'reference.idx'
+    index = reference_index.ReferenceIndex(path, writable=True)
+    far_apart = [0, 0xFFFF, 0xFFFF << 32]
+    index.append([row(value) for value in far_apart], ['a.jpg', 'b.jpg', 'c.jpg'], [(1, 1), (2, 2), (3, 3)])
+
+    index.mark_deleted([0, 2])
+    # 已删除的记录不再匹配
+    query = image_similarity.build_hash_columns([row(value) for value in far_apart])
+    assert list(index.find_matches(query)) == [1]
+
+    assert index.compact() == 2
+    assert len(index) == 1
+    assert index.records['file_id'].tolist() == [0]
+    assert index.path(0) == 'b.jpg'
+    assert index.compact() == 0
+    index.close()
+
+    assert (tmp_path / 'reference.idx.paths').read_text(encoding='utf-8') == 'b.jpg\n'
+    assert len(reference_index.ReferenceIndex(path)) == 1
+
+
+def test_read_only(tmp_path):
+    path = tmp_path / 'reference.idx'
+    writer = reference_index.ReferenceIndex(path, writable=True)
+    writer.append([row(1)], ['a.jpg'], [(1, 1)])
+    writer.close()
+
+    index = reference_index.ReferenceIndex(path)
+    with pytest.raises(ValueError):
+        index.mark_deleted([0])
+    index.close()
+
+
+def test_find_matches_picks_closest(tmp_path):
+    index = reference_index.ReferenceIndex(tmp_path / 'reference.idx', writable=True)
+    index.append([row(0b1), row(0)], ['near.jpg', 'same.jpg'], [(1, 1), (1, 1)])
+
+    matches = index.find_matches(image_similarity.build_hash_columns([row(0), row((1 << 64) - 1)]))
+    assert list(matches) == [0]
+    assert matches[0] == (1, 0.0)
+    index.close()
+
+
+def test_not_an_index(tmp_path):
+    path = tmp_path / 'reference.idx'
+    path.write_bytes(b'not an index at all')
+    with pytest.raises(ValueError):
+        reference_index.ReferenceIndex(path)
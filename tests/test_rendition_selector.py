@@ -0,0 +1,76 @@
+from cetchome.cli import load_script
+
+rendition_selector = load_script('downloader.urls', 'rendition_selector.py')
+
+BASE = 'https://cdn.example.com/photos'
+DOM = f'''
+<img src="{BASE}/IMG_1-cc_ft_384.jpg"
+     srcset="{BASE}/IMG_1-cc_ft_768.jpg 768w, {BASE}/IMG_1-cc_ft_1536.jpg 1536w, {BASE}/IMG_1-cc_ft_3072.jpg 3072w">
+<source type="image/webp" srcset="{BASE}/IMG_1-cc_ft_1536.webp 1536w">
+<img src="{BASE}/IMG_2-cc_ft_384.jpg" srcset="{BASE}/IMG_2-cc_ft_768.jpg 768w">
+<img src="{BASE}/plain.jpg">
+'''
+SIZES = {
+    f'{BASE}/IMG_1-cc_ft_1536.jpg': 400_000,
+    f'{BASE}/IMG_1-cc_ft_3072.jpg': 300_000,   # 更宽但压缩得更小
+    f'{BASE}/IMG_1-cc_ft_1536.webp': 250_000,
+    f'{BASE}/plain.jpg': 100_000,
+}
+
+
+def fake_probe(probed):
+    def probe_rendition(rendition, need_dimensions=False):
+        probed.append(rendition['url'])
+        result = dict(rendition, bytes=SIZES.get(rendition['url']), height=None)
+        if need_dimensions:
+            result['width'] = 2000
+        return result
+    return probe_rendition
+
+
+def test_parse_renditions():
+    groups = rendition_selector.parse_renditions(DOM)
+    widths = {key[-1]: sorted((r['width'] or 0, r['format']) for r in renditions)
+              for key, renditions in groups.items()}
+    assert widths == {
+        'IMG_1': [(384, 'jpeg'), (768, 'jpeg'), (1536, 'jpeg'), (1536, 'webp'), (3072, 'jpeg')],
+        'IMG_2': [(384, 'jpeg'), (768, 'jpeg')],
+        '/photos/plain': [(0, 'jpeg')],
+    }
+
+
+def test_select_without_probing(capsys):
+    groups = rendition_selector.parse_renditions(DOM)
+    urls = rendition_selector.select_renditions(groups, 1152, probe=False)
+    # IMG_2 没有 1152px 以上的版本，被跳过
+    assert urls == [f'{BASE}/IMG_1-cc_ft_1536.jpg', f'{BASE}/plain.jpg']
+    assert '跳过 1 张' in capsys.readouterr().out
+
+
+def test_select_allow_smaller(capsys):
+    groups = rendition_selector.parse_renditions(DOM)
+    urls = rendition_selector.select_renditions(groups, 1152, probe=False, allow_smaller=True)
+    assert f'{BASE}/IMG_2-cc_ft_768.jpg' in urls
+    assert 'IMG_2-cc_ft_768.jpg: 最宽的版本只有 768px' in capsys.readouterr().out
+
+
+def test_select_smallest_probed_file(monkeypatch):
+    probed = []
+    monkeypatch.setattr(rendition_selector, 'probe_rendition', fake_probe(probed))
+    groups = rendition_selector.parse_renditions(DOM)
+
+    urls = rendition_selector.select_renditions(groups, 1152, workers=2)
+    assert urls == [f'{BASE}/IMG_1-cc_ft_3072.jpg', f'{BASE}/plain.jpg']
+    # 只探测需要比较的版本 (以及宽度未知的版本)
+    assert sorted(probed) == sorted(SIZES.keys() - {f'{BASE}/IMG_1-cc_ft_1536.webp'})
+
+    urls = rendition_selector.select_renditions(groups, 1152, prefer_webp=True, workers=2)
+    assert urls[0] == f'{BASE}/IMG_1-cc_ft_1536.webp'
+
+
+def test_select_skips_photos_probed_below_target(monkeypatch):
+    monkeypatch.setattr(rendition_selector, 'probe_rendition', fake_probe([]))
+    groups = rendition_selector.parse_renditions(f'<img src="{BASE}/plain.jpg">')
+
+    assert rendition_selector.select_renditions(groups, 2048) == []
+    assert rendition_selector.select_renditions(groups, 2048, allow_smaller=True) == [f'{BASE}/plain.jpg']
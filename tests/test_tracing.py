@@ -0,0 +1,61 @@
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from cetchome import tracing
+
+
+@pytest.fixture
+def records():
+    collected = []
+    tracing.add_listener(collected.append)
+    yield collected
+    tracing.remove_listener(collected.append)
+
+
+def burn():
+    subprocess.run([sys.executable, '-c', 'sum(range(3 * 10 ** 6))'], check=True)
+
+
+def test_children_cpu_of_exclusive_span(records):
+    with tracing.span('outer', file='a.mov'):
+        with tracing.span('inner'):
+            burn()
+
+    inner, outer = records
+    assert inner['file'] == 'a.mov' and inner['parent'] == outer['id']
+    assert inner['subprocesses'] == 1 and outer['subprocesses'] == 1
+    assert inner['children_cpu'] > 0
+    assert outer['children_cpu'] >= inner['children_cpu']
+
+
+def test_children_cpu_unknown_for_overlapping_spans(records):
+    started = threading.Event()
+    release = threading.Event()
+
+    def other():
+        with tracing.span('other'):
+            started.set()
+            release.wait(5)
+
+    with tracing.span('first'):
+        thread = threading.Thread(target=other)
+        thread.start()
+        started.wait(5)
+        burn()
+    release.set()
+    thread.join()
+    # 两个 span 在不同线程中重叠：都无法归属子进程 CPU 时间
+    with tracing.span('after'):
+        pass
+
+    by_name = {record['span']: record for record in records}
+    assert by_name['first']['children_cpu'] is None
+    assert by_name['other']['children_cpu'] is None
+    assert by_name['after']['children_cpu'] is not None
+
+    summary = tracing.summarize(records)
+    assert summary['first']['children_cpu'] == 0.0
+    assert summary['first']['subprocesses'] == 1
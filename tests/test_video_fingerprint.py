@@ -0,0 +1,73 @@
+import pytest
+
+from cetchome.cli import load_script
+
+video_fingerprint = load_script('helper.media', 'video_fingerprint.py')
+
+
+def clip(duration=10.0, capture_time=None, frames=None, audio=None):
+    return {'duration': duration, 'capture_time': capture_time,
+            'frames': list(range(8)) if frames is None else frames,
+            'audio': [5] * 80 if audio is None else audio}
+
+
+def test_sample_times():
+    assert video_fingerprint.sample_times(8.0, samples=4) == [1.0, 3.0, 5.0, 7.0]
+
+
+@pytest.mark.parametrize('duration1, duration2, same', [
+    (10.0, 10.0, True),
+    (10.0, 10.19, True),     # 0.1 s + 1%
+    (10.0, 10.21, False),
+    (600.0, 606.0, True),
+    (600.0, 606.2, False),
+])
+def test_same_duration(duration1, duration2, same):
+    assert video_fingerprint.same_duration(duration1, duration2) is same
+    assert video_fingerprint.same_duration(duration2, duration1) is same
+
+
+@pytest.mark.parametrize('time1, time2, same', [
+    (None, '2020-01-02T03:04:05Z', True),
+    ('', None, True),
+    # Apple 的本地时间与 mvhd 的 UTC 时间
+    ('2020-01-02T11:04:05+0800', '2020-01-02T03:04:05Z', True),
+    ('2020-01-02T11:04:05+08:00', '2020-01-02T03:04:06Z', False),
+    ('2020:01:02 03:04:05', '2020-01-02T03:04:05.250Z', True),
+    ('2020-01-02T03:04:05Z', '2020-01-02T03:04:07Z', False),
+    ('yesterday', 'yesterday', True),
+    ('yesterday', 'today', False),
+])
+def test_same_capture_time(time1, time2, same):
+    assert video_fingerprint.same_capture_time(time1, time2) is same
+
+
+def test_matches():
+    original = clip(capture_time='2020-01-02T03:04:05Z')
+    assert video_fingerprint.matches(original, clip(duration=10.05, capture_time='2020-01-02T03:04:05Z'))
+    # 没有拍摄时间的一方不参与比较
+    assert video_fingerprint.matches(original, clip())
+
+    assert not video_fingerprint.matches(original, clip(duration=11.0))
+    assert not video_fingerprint.matches(original, clip(capture_time='2020-01-02T03:04:09Z'))
+
+
+def test_matches_frame_distance():
+    frames = [0] * 8
+    # 平均每帧相差 FRAME_DISTANCE 位以内
+    close = [(1 << video_fingerprint.FRAME_DISTANCE) - 1] * 8
+    far = [(1 << (video_fingerprint.FRAME_DISTANCE + 1)) - 1] * 8
+    assert video_fingerprint.matches(clip(frames=frames), clip(frames=close))
+    assert not video_fingerprint.matches(clip(frames=frames), clip(frames=far))
+    assert not video_fingerprint.matches(clip(frames=frames), clip(frames=frames[:4]))
+    assert not video_fingerprint.matches(clip(frames=[]), clip(frames=[]))
+
+
+def test_matches_audio():
+    silent = clip()
+    silent['audio'] = None
+    assert video_fingerprint.matches(silent, dict(silent))
+    assert not video_fingerprint.matches(silent, clip())
+    assert video_fingerprint.matches(clip(audio=[5] * 80), clip(audio=[7] * 80))
+    assert not video_fingerprint.matches(clip(audio=[5] * 80), clip(audio=[8] * 80))
+    assert not video_fingerprint.matches(clip(audio=[5] * 80), clip(audio=[5] * 40))